@@ -0,0 +1,424 @@
+"""Almacenamiento de la hoja de filtros y de las evaluaciones TP y P.
+
+El cargador del snapshot, las rutas de guardado y el resumen de resultados hablan
+con un almacén y no con SheetDB directamente. Hay tres, según ALMACENAMIENTO_MODO:
+
+- "sheetdb": la hoja de filtros se lee de SheetDB y las evaluaciones se encolan en
+  cola_resultados, cuyo worker las envía a SheetDB en segundo plano (lo de siempre).
+- "sqlite": todo en una base SQLite local, sin red. La hoja de filtros se carga con
+  `python almacenamiento.py importar_filtros <archivo .json/.xlsx/.csv>`.
+- "espejo": las lecturas salen de la copia SQLite y las escrituras se guardan ahí y
+  se replican a SheetDB por la cola. La copia de la hoja de filtros se pone al día
+  desde SheetDB en cada refresco; si SheetDB no responde se sigue sirviendo la copia.
+
+Todos entregan la hoja de filtros en el mismo formato que SheetDB (lista JSON de
+registros, con ETag y hash para revalidar y sync incremental por filas añadidas al
+final), así que el resto de app.py no distingue de dónde viene.
+
+`confirmar(guardar, hoja, registros)` envuelve cada escritura de evaluaciones en el
+lugar donde se leen después (el POST de la cola en "sheetdb", el INSERT local en
+"sqlite" y "espejo"); app.py pasa resumen_resultados.guardar_y_registrar para que el
+resumen cuente solo lo que quedó guardado.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import sheetdb_client
+import cola_resultados
+import bitacora
+import base_local
+
+log = bitacora.obtener(__name__)
+
+ALMACENAMIENTO_DB_PATH = os.environ.get("ALMACENAMIENTO_DB", os.path.join(base_local.CARPETA_PROCESADOS, 'almacenamiento.sqlite3'))
+MODOS = ('sheetdb', 'sqlite', 'espejo')
+
+# Índices de versiones anteriores que ninguna consulta usa (la cascada se resuelve en memoria
+# sobre el snapshot); se borran de las bases existentes para no pagarlos en cada escritura
+INDICES_OBSOLETOS = ('idx_filtros_cascada', 'idx_filtros_nrc', 'idx_resultados_filtros')
+
+
+def _solo_guardar(guardar, hoja, registros):
+    return guardar(hoja, registros)
+
+
+def _respuesta_filtros(contenido, etag):
+    return {"sin_cambios": False, "contenido": contenido, "hash": hashlib.sha256(contenido).hexdigest(), "etag": etag}
+
+
+class AlmacenSheetDB:
+    """Hoja de filtros y hojas TP/P en SheetDB."""
+
+    nombre = "sheetdb"
+
+    def __init__(self, url_filtros, url_resultados, confirmar=_solo_guardar):
+        self.url_filtros = url_filtros
+        self.url_resultados = url_resultados
+        self.confirmar = confirmar
+
+    def leer_filtros(self, etag=None):
+        """Hoja de filtros cruda (None si falla).
+
+        Si se pasa el ETag del snapshot actual y SheetDB responde 304, devuelve
+        {"sin_cambios": True}. En otro caso devuelve el contenido, su hash y el ETag nuevo.
+        """
+        try:
+            headers = {"If-None-Match": etag} if etag else {}
+            response = sheetdb_client.get("leer_filtros", self.url_filtros, headers=headers)
+
+            if response.status_code == 304:
+                return {"sin_cambios": True}
+            if response.status_code != 200:
+                log.error("Error al obtener datos de SheetDB para filtros: %s", response.text)
+                return None
+            return _respuesta_filtros(response.content, response.headers.get("ETag"))
+
+        except Exception as e:
+            log.error("Error al obtener datos desde SheetDB: %s", e)
+            return None
+
+    def leer_delta_filtros(self, columnas, filas):
+        """Consultar solo lo necesario para un sync incremental (None si falla).
+
+        Compara el encabezado (/keys) y el número de filas (/count) con los del snapshot y
+        pide con limit/offset solo las filas añadidas al final. Devuelve un dict con "tipo":
+        "sin_cambios", "anexar" (con "registros" y "contenido") o "completo" (con "motivo")
+        cuando el cambio no se puede aplicar como parche.
+        """
+        base = self.url_filtros.rstrip('/')
+        try:
+            # /keys y /count no dependen uno del otro: se piden a la vez y se espera una sola latencia
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix="delta-filtros") as ejecutor:
+                pedido_columnas = ejecutor.submit(sheetdb_client.get, "leer_filtros_delta", f"{base}/keys")
+                pedido_conteo = ejecutor.submit(sheetdb_client.get, "leer_filtros_delta", f"{base}/count")
+                response = pedido_columnas.result()
+                response_conteo = pedido_conteo.result()
+            if response.status_code != 200:
+                log.error("Error al obtener las columnas de la hoja de filtros: %s", response.text)
+                return None
+            if response.json() != columnas:
+                return {"tipo": "completo", "motivo": "cambiaron las columnas de la hoja"}
+
+            response = response_conteo
+            if response.status_code != 200:
+                log.error("Error al contar las filas de la hoja de filtros: %s", response.text)
+                return None
+            filas_actuales = int(response.json()["rows"])
+            if filas_actuales == filas:
+                return {"tipo": "sin_cambios"}
+            if filas_actuales < filas:
+                return {"tipo": "completo", "motivo": "se borraron filas"}
+
+            faltantes = filas_actuales - filas
+            response = sheetdb_client.get("leer_filtros_delta", base, params={"limit": faltantes, "offset": filas})
+            if response.status_code != 200:
+                log.error("Error al obtener las filas nuevas de la hoja de filtros: %s", response.text)
+                return None
+            registros = response.json()
+            if not isinstance(registros, list) or len(registros) != faltantes:
+                return {"tipo": "completo", "motivo": "la paginación no devolvió las filas esperadas"}
+            return {"tipo": "anexar", "registros": registros, "contenido": response.content}
+
+        except Exception as e:
+            log.error("Error al obtener el delta de filtros desde SheetDB: %s", e)
+            return None
+
+    def guardar_resultados(self, hoja, registros):
+        """Encolar registros aplanados; el worker de la cola los envía con enviar_resultados."""
+        if len(registros) == 1:
+            cola_resultados.encolar(hoja, registros[0])
+        else:
+            cola_resultados.encolar_lote(hoja, registros)
+
+    def enviar_resultados(self, hoja, registros):
+        """POST de un lote a la hoja en SheetDB. Devuelve None si se guardó o el mensaje de error."""
+        try:
+            response = sheetdb_client.post(f"guardar_{hoja}", f"{self.url_resultados}?sheet={hoja}",
+                                           json={"data": registros})
+            try:
+                response_data = response.json()
+            except Exception:
+                response_data = {}
+            if response.status_code in (200, 201) or response_data.get('created') == len(registros):
+                return None
+            return f"{response.status_code} {response_data or response.text}"
+        except Exception as e:
+            return str(e)
+
+    def leer_resultados(self, hoja, nrc=None):
+        """Evaluaciones de la hoja ("TP" o "P"), opcionalmente solo las de un NRC (con /search).
+
+        Lanza RuntimeError si SheetDB falla.
+        """
+        if nrc is None:
+            response = sheetdb_client.get(f"leer_{hoja}", f"{self.url_resultados}?sheet={hoja}")
+        else:
+            response = sheetdb_client.get(f"leer_{hoja}", f"{self.url_resultados.rstrip('/')}/search",
+                                          params={"sheet": hoja, "NRC": str(nrc).strip()})
+        if response.status_code != 200:
+            raise RuntimeError(f"SheetDB respondió {response.status_code} al leer la hoja {hoja}: {response.text}")
+        return response.json()
+
+    def iniciar(self):
+        """Arrancar el worker que vacía la cola hacia SheetDB."""
+        cola_resultados.iniciar_worker(functools.partial(self.confirmar, self.enviar_resultados))
+
+
+class AlmacenSQLite:
+    """Hoja de filtros y evaluaciones en una base SQLite local.
+
+    Cada registro se guarda como JSON (con las columnas tal como llegaron). La hoja de
+    filtros se lee siempre entera (app.py arma el snapshot y la cascada en memoria), así
+    que sus filas solo se numeran en orden, lo que permite el sync incremental igual que
+    con limit/offset en SheetDB. Las evaluaciones llevan además su NRC en una columna
+    con índice, para leer_resultados(hoja, nrc).
+    """
+
+    nombre = "sqlite"
+
+    def __init__(self, ruta=None, confirmar=_solo_guardar):
+        self.ruta = ruta or ALMACENAMIENTO_DB_PATH
+        self.confirmar = confirmar
+
+    @staticmethod
+    def _crear_esquema(conexion):
+        conexion.execute("""
+            CREATE TABLE IF NOT EXISTS filtros (
+                fila INTEGER PRIMARY KEY,
+                registro TEXT NOT NULL
+            )
+        """)
+        conexion.execute("""
+            CREATE TABLE IF NOT EXISTS resultados (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                hoja TEXT NOT NULL,
+                NRC TEXT,
+                registro TEXT NOT NULL,
+                creado_en REAL NOT NULL
+            )
+        """)
+        conexion.execute("CREATE INDEX IF NOT EXISTS idx_resultados_nrc ON resultados (hoja, NRC)")
+        for indice in INDICES_OBSOLETOS:
+            conexion.execute(f"DROP INDEX IF EXISTS {indice}")
+        # columnas (encabezado de la hoja de filtros), version, etag_remoto, hash_remoto
+        conexion.execute("CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT)")
+
+    def _conectar(self):
+        return base_local.conectar(self.ruta, self._crear_esquema)
+
+    @staticmethod
+    def _meta(conexion, clave):
+        fila = conexion.execute("SELECT valor FROM meta WHERE clave = ?", (clave,)).fetchone()
+        return fila[0] if fila else None
+
+    @staticmethod
+    def _fijar_meta(conexion, valores):
+        conexion.executemany(
+            "INSERT INTO meta (clave, valor) VALUES (?, ?) ON CONFLICT (clave) DO UPDATE SET valor = excluded.valor",
+            list(valores.items())
+        )
+
+    @staticmethod
+    def _filas_filtros(registros, inicio):
+        return [(inicio + i, json.dumps(r, ensure_ascii=False)) for i, r in enumerate(registros)]
+
+    def reemplazar_filtros(self, registros, etag_remoto=None, hash_remoto=None):
+        """Reemplazar la hoja de filtros completa (el encabezado sale del primer registro)."""
+        conexion = self._conectar()
+        try:
+            with conexion:
+                version = int(self._meta(conexion, "version") or 0) + 1
+                conexion.execute("DELETE FROM filtros")
+                conexion.executemany(
+                    "INSERT INTO filtros (fila, registro) VALUES (?, ?)",
+                    self._filas_filtros(registros, 0)
+                )
+                self._fijar_meta(conexion, {
+                    "columnas": json.dumps(list(registros[0].keys()) if registros else [], ensure_ascii=False),
+                    "version": str(version), "etag_remoto": etag_remoto or "", "hash_remoto": hash_remoto or "",
+                })
+        finally:
+            conexion.close()
+
+    def anexar_filtros(self, registros):
+        """Agregar filas al final de la hoja de filtros."""
+        conexion = self._conectar()
+        try:
+            with conexion:
+                filas = conexion.execute("SELECT COUNT(*) FROM filtros").fetchone()[0]
+                version = int(self._meta(conexion, "version") or 0) + 1
+                conexion.executemany(
+                    "INSERT INTO filtros (fila, registro) VALUES (?, ?)",
+                    self._filas_filtros(registros, filas)
+                )
+                # La hoja remota ya no coincide con el ETag/hash de la última copia completa
+                self._fijar_meta(conexion, {"version": str(version), "etag_remoto": "", "hash_remoto": ""})
+        finally:
+            conexion.close()
+
+    def estado_filtros(self):
+        """(columnas, filas, etag_remoto, hash_remoto) de la copia; columnas None si nunca se cargó."""
+        conexion = self._conectar()
+        try:
+            columnas = self._meta(conexion, "columnas")
+            filas = conexion.execute("SELECT COUNT(*) FROM filtros").fetchone()[0]
+            return (json.loads(columnas) if columnas is not None else None, filas,
+                    self._meta(conexion, "etag_remoto") or None, self._meta(conexion, "hash_remoto") or None)
+        finally:
+            conexion.close()
+
+    def leer_filtros(self, etag=None):
+        """Hoja de filtros en el formato de SheetDB; None si todavía no se cargó ninguna."""
+        conexion = self._conectar()
+        try:
+            version = self._meta(conexion, "version")
+            if version is None:
+                log.error("No hay hoja de filtros en el almacenamiento SQLite (importar_filtros)")
+                return None
+            etag_local = f'"sqlite-{version}"'
+            if etag == etag_local:
+                return {"sin_cambios": True}
+            registros = [r for (r,) in conexion.execute("SELECT registro FROM filtros ORDER BY fila")]
+        finally:
+            conexion.close()
+        return _respuesta_filtros(f"[{','.join(registros)}]".encode(), etag_local)
+
+    def leer_delta_filtros(self, columnas, filas):
+        """Mismo contrato que AlmacenSheetDB.leer_delta_filtros, sobre la copia local."""
+        conexion = self._conectar()
+        try:
+            columnas_actuales = self._meta(conexion, "columnas")
+            if columnas_actuales is None:
+                log.error("No hay hoja de filtros en el almacenamiento SQLite (importar_filtros)")
+                return None
+            if json.loads(columnas_actuales) != columnas:
+                return {"tipo": "completo", "motivo": "cambiaron las columnas de la hoja"}
+            filas_actuales = conexion.execute("SELECT COUNT(*) FROM filtros").fetchone()[0]
+            if filas_actuales == filas:
+                return {"tipo": "sin_cambios"}
+            if filas_actuales < filas:
+                return {"tipo": "completo", "motivo": "se borraron filas"}
+            nuevas = [r for (r,) in conexion.execute("SELECT registro FROM filtros WHERE fila >= ? ORDER BY fila", (filas,))]
+        finally:
+            conexion.close()
+        contenido = f"[{','.join(nuevas)}]".encode()
+        return {"tipo": "anexar", "registros": json.loads(contenido), "contenido": contenido}
+
+    def guardar_resultados(self, hoja, registros):
+        """Insertar registros aplanados de la hoja ("TP" o "P")."""
+        self.confirmar(self._insertar_resultados, hoja, registros)
+
+    def _insertar_resultados(self, hoja, registros):
+        ahora = time.time()
+        conexion = self._conectar()
+        try:
+            with conexion:
+                conexion.executemany(
+                    "INSERT INTO resultados (hoja, NRC, registro, creado_en) VALUES (?, ?, ?, ?)",
+                    [(hoja, None if r.get('NRC') is None else str(r['NRC']).strip(), json.dumps(r, ensure_ascii=False), ahora)
+                     for r in registros]
+                )
+        finally:
+            conexion.close()
+
+    def leer_resultados(self, hoja, nrc=None):
+        """Evaluaciones de la hoja en orden de guardado, opcionalmente solo las de un NRC."""
+        consulta = "SELECT registro FROM resultados WHERE hoja = ?"
+        parametros = [hoja]
+        if nrc is not None:
+            consulta += " AND NRC = ?"
+            parametros.append(str(nrc).strip())
+        conexion = self._conectar()
+        try:
+            return [json.loads(r) for (r,) in conexion.execute(consulta + " ORDER BY id", parametros)]
+        finally:
+            conexion.close()
+
+    def iniciar(self):
+        """Nada que arrancar: las escrituras son síncronas y locales."""
+
+
+class AlmacenEspejo:
+    """Lecturas desde la copia SQLite, escrituras replicadas a SheetDB por la cola."""
+
+    nombre = "espejo"
+
+    def __init__(self, local, remoto):
+        self.local = local
+        self.remoto = remoto
+
+    def leer_filtros(self, etag=None):
+        """Poner al día la copia con la hoja de SheetDB (si responde) y leer la copia."""
+        _, _, etag_remoto, hash_remoto = self.local.estado_filtros()
+        remoto = self.remoto.leer_filtros(etag_remoto)
+        if remoto is None:
+            log.warning("SheetDB no respondió; se sirve la copia SQLite de la hoja de filtros")
+        elif not remoto["sin_cambios"] and remoto["hash"] != hash_remoto:
+            self.local.reemplazar_filtros(json.loads(remoto["contenido"]), remoto["etag"], remoto["hash"])
+        return self.local.leer_filtros(etag)
+
+    def leer_delta_filtros(self, columnas, filas):
+        """Copiar a SQLite las filas añadidas en SheetDB y devolver el delta de la copia."""
+        columnas_local, filas_local, _, _ = self.local.estado_filtros()
+        if columnas_local is None:
+            return {"tipo": "completo", "motivo": "la copia SQLite está vacía"}
+        remoto = self.remoto.leer_delta_filtros(columnas_local, filas_local)
+        if remoto is None:
+            log.warning("SheetDB no respondió; el delta se calcula sobre la copia SQLite")
+        elif remoto["tipo"] == "completo":
+            return remoto
+        elif remoto["tipo"] == "anexar":
+            self.local.anexar_filtros(remoto["registros"])
+        return self.local.leer_delta_filtros(columnas, filas)
+
+    def guardar_resultados(self, hoja, registros):
+        self.local.guardar_resultados(hoja, registros)
+        self.remoto.guardar_resultados(hoja, registros)
+
+    def enviar_resultados(self, hoja, registros):
+        return self.remoto.enviar_resultados(hoja, registros)
+
+    def leer_resultados(self, hoja, nrc=None):
+        return self.local.leer_resultados(hoja, nrc)
+
+    def iniciar(self):
+        self.remoto.iniciar()
+
+
+def crear(modo, url_filtros, url_resultados, ruta_db=None, confirmar=_solo_guardar):
+    """Almacén para ALMACENAMIENTO_MODO ("sheetdb", "sqlite" o "espejo")."""
+    if modo == "sheetdb":
+        return AlmacenSheetDB(url_filtros, url_resultados, confirmar)
+    if modo == "sqlite":
+        return AlmacenSQLite(ruta_db, confirmar)
+    if modo == "espejo":
+        # Las lecturas salen de la copia local: ahí se confirma, no al replicar a SheetDB
+        return AlmacenEspejo(AlmacenSQLite(ruta_db, confirmar), AlmacenSheetDB(url_filtros, url_resultados))
+    raise ValueError(f"ALMACENAMIENTO_MODO desconocido: {modo!r} (válidos: {', '.join(MODOS)})")
+
+
+def _leer_archivo_filtros(ruta):
+    """Registros de la hoja de filtros desde un .json (como lo entrega SheetDB), .xlsx o .csv."""
+    if ruta.lower().endswith('.json'):
+        with open(ruta, encoding='utf-8') as f:
+            return json.load(f)
+    import pandas as pd
+    if ruta.lower().endswith('.csv'):
+        df = pd.read_csv(ruta, dtype=str, keep_default_na=False)
+    else:
+        df = pd.read_excel(ruta, dtype=str, keep_default_na=False)
+    return df.to_dict('records')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] != 'importar_filtros':
+        print("Uso: python almacenamiento.py importar_filtros <archivo .json/.xlsx/.csv>")
+        sys.exit(2)
+    registros = _leer_archivo_filtros(sys.argv[2])
+    AlmacenSQLite().reemplazar_filtros(registros)
+    print(f"{len(registros)} filas de filtros importadas en {ALMACENAMIENTO_DB_PATH}")
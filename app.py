@@ -1,70 +1,743 @@
 import os
 import pandas as pd
-from flask import Flask, render_template, request, jsonify
-import requests  # Necesitamos esta librería para interactuar con SheetDB
+from flask import Flask, render_template, request, jsonify, Response, send_file, flash, redirect
+from werkzeug.utils import secure_filename
+import sheetdb_client  # Cliente compartido (sesión keep-alive + reintentos) para interactuar con SheetDB
 import datetime  # Necesario para la marca de tiempo en los logs
+import time
+import threading  # Refresco de los filtros en segundo plano
+import hashlib  # Huella del contenido de la hoja de filtros
+import json
+import pickle  # Copia local del snapshot de filtros
+import tempfile
+import cola_resultados  # Cola local de envíos a las hojas TP y P
+import generador_nrcs  # Generación de NRCs en segundo plano (/procesar_nrcs)
+import asistencias  # Conteo de asistencias OPERATIC por rangos de fechas
+import resumen_resultados  # Promedios y conteos pre-agregados de las evaluaciones
+import esquema_resultados  # Columnas y aplanado de los payloads TP y P
+import almacenamiento  # SheetDB, SQLite local o espejo para filtros y resultados
+import buscador  # Índice de búsqueda por texto de los cursos (/api/buscar)
+import base_local  # Carpeta procesados/ y bases SQLite locales
+import functools
+try:
+    import fcntl  # Elección del proceso que refresca desde SheetDB (solo Unix)
+except ImportError:
+    fcntl = None
+from collections import OrderedDict  # LRU de respuestas serializadas
+import bitacora  # Logging con niveles (reemplaza los print)
+import metricas  # Exposición de métricas para Prometheus (/metrics)
+
+log = bitacora.obtener(__name__)
 
 app = Flask(__name__)
-app.secret_key = os.urandom(24)  # Necesario para manejar sesiones
+# Necesario para manejar sesiones y mensajes flash; fijarla por entorno si hay varios procesos sin preload
+app.secret_key = os.environ.get("SECRET_KEY") or os.urandom(24)
 
 # URL de la API de SheetDB para los resultados (esto ya lo tienes)
-SHEETDB_API_URL = "https://sheetdb.io/api/v1/t5uvp45rl7ias"  # URL para los resultados
+SHEETDB_API_URL = os.environ.get("SHEETDB_API_URL", "https://sheetdb.io/api/v1/t5uvp45rl7ias")  # URL para los resultados
 
 # URL de la API de SheetDB para los filtros (deberás poner esta URL específica para tu caso)
-SHEETDB_API_URL_FILTERS = "https://sheetdb.io/api/v1/4m9mlphf2sk56"  # Reemplaza con la URL de tu hoja de filtros
+SHEETDB_API_URL_FILTERS = os.environ.get("SHEETDB_API_URL_FILTERS", "https://sheetdb.io/api/v1/4m9mlphf2sk56")  # Reemplaza con la URL de tu hoja de filtros
 
 # Alias para estandarizar y evitar NameError
 SHEETDB_API_URL_RESULTADOS = SHEETDB_API_URL
 
-# Variable global para almacenar el DataFrame cargado
-df_evaluacion = pd.DataFrame()
+# De dónde se leen los filtros y dónde se guardan las evaluaciones (ver almacenamiento.py):
+# "sheetdb", "sqlite" (todo local, sin red) o "espejo" (lecturas desde la copia SQLite,
+# escrituras replicadas a SheetDB en segundo plano)
+ALMACENAMIENTO_MODO = os.environ.get("ALMACENAMIENTO_MODO", "sheetdb")
+almacen = almacenamiento.crear(ALMACENAMIENTO_MODO, SHEETDB_API_URL_FILTERS, SHEETDB_API_URL_RESULTADOS,
+                               confirmar=resumen_resultados.guardar_y_registrar)
+
+# Cada cuánto se vuelve a leer la hoja de filtros en segundo plano (segundos)
+SNAPSHOT_TTL_SEGUNDOS = int(os.environ.get("SNAPSHOT_TTL_SEGUNDOS", 900))
+# Espera antes de reintentar cuando SheetDB falla (segundos)
+SNAPSHOT_REINTENTO_SEGUNDOS = int(os.environ.get("SNAPSHOT_REINTENTO_SEGUNDOS", 60))
+
+# Copia local del snapshot normalizado: permite arrancar sin esperar a SheetDB
+SNAPSHOT_LOCAL_PATH = os.environ.get("SNAPSHOT_LOCAL_PATH", os.path.join(base_local.CARPETA_PROCESADOS, 'filtros_snapshot.pkl'))
+# Subir este número cuando cambie la normalización o el formato del archivo
+SNAPSHOT_VERSION_ESQUEMA = 3
+# Con varios procesos (gunicorn) solo el que tiene este lock lee SheetDB; el resto
+# vuelve a cargar la copia local cuando cambia, cada SNAPSHOT_SEGUIDOR_INTERVALO segundos
+SNAPSHOT_LOCK_PATH = f"{SNAPSHOT_LOCAL_PATH}.lock"
+SNAPSHOT_SEGUIDOR_INTERVALO = int(os.environ.get("SNAPSHOT_SEGUIDOR_INTERVALO", 15))
+# Un seguidor que recibe /load_data deja aquí el pedido de refresco; el líder lo revisa
+# cada SNAPSHOT_SEGUIDOR_INTERVALO segundos, así solo el líder escribe la copia local
+SNAPSHOT_SOLICITUD_PATH = f"{SNAPSHOT_LOCAL_PATH}.solicitud"
+# "completo" (por defecto): en cada refresco se pide la hoja entera con If-None-Match; un 304
+# o el mismo hash no vuelven a normalizar nada, y cualquier cambio se ve en un TTL.
+# "delta": solo se piden las filas añadidas al final de la hoja (/keys, /count y
+# limit/offset) y se anexan al snapshot. El delta compara solo el número de filas: las
+# ediciones o borrados en medio de la hoja no se ven hasta la recarga completa que se hace
+# al arrancar, con /load_data y cada SNAPSHOT_DELTA_CICLOS_COMPLETO refrescos. En modo delta
+# una edición puede tardar hasta (SNAPSHOT_DELTA_CICLOS_COMPLETO + 1) × SNAPSHOT_TTL_SEGUNDOS
+# en aparecer (75 minutos con los valores por defecto).
+SNAPSHOT_SYNC_MODO = os.environ.get("SNAPSHOT_SYNC_MODO", "completo")
+SNAPSHOT_DELTA_CICLOS_COMPLETO = int(os.environ.get("SNAPSHOT_DELTA_CICLOS_COMPLETO", 4))
+
+# Caché HTTP de las respuestas de la cascada (dependen solo de la versión del snapshot)
+CACHE_MAX_AGE_SEGUNDOS = int(os.environ.get("CACHE_MAX_AGE_SEGUNDOS", 60))
+CACHE_RESPUESTAS_MAXIMO = int(os.environ.get("CACHE_RESPUESTAS_MAXIMO", 4096))
+
+# /api/buscar: resultados por defecto y máximos, y largo mínimo de la consulta normalizada
+BUSQUEDA_LIMITE = 10
+BUSQUEDA_LIMITE_MAXIMO = 50
+BUSQUEDA_MINIMO_CARACTERES = 2
+
 is_data_loaded = False  # Variable global para controlar si los datos están cargados
 
-def cargar_datos_desde_sheetdb():
-    """Leer datos desde Google Sheets usando SheetDB para los filtros."""
-    global df_evaluacion, is_data_loaded
-    try:
-        # Solicitud a la API de SheetDB
-        response = requests.get(SHEETDB_API_URL_FILTERS, timeout=30)
-
-        if response.status_code == 200:
-            # Cargar JSON a DataFrame
-            df_evaluacion = pd.DataFrame(response.json())
-
-            # --- Normalización de columnas y datos ---
-            # Quitar espacios en los nombres de columnas
-            df_evaluacion.columns = [str(c).strip() for c in df_evaluacion.columns]
-
-            # Reemplazar strings vacíos por NA
-            df_evaluacion = df_evaluacion.replace(r'^\s*$', pd.NA, regex=True)
-
-            # Normalizar columnas de texto (si existen)
-            texto_cols = ['SEDE_PRINCIPAL', 'SEDE_CURSO', 'Carrera', 'Asignatura', 'INSTRUCTOR', 'Tipo_Curso']
-            for col in texto_cols:
-                if col in df_evaluacion.columns:
-                    df_evaluacion[col] = df_evaluacion[col].astype(str).str.strip()
-
-            # Normalizar columnas numéricas (SheetDB suele entregar strings)
-            num_cols = ['ANO', 'PERIODO', 'Seccion', 'NRC']
-            for col in num_cols:
-                if col in df_evaluacion.columns:
-                    df_evaluacion[col] = pd.to_numeric(df_evaluacion[col], errors='coerce')
-
-            # Log útil
-            print("[INFO] dtypes tras normalización:\n", df_evaluacion.dtypes)
-            print("[INFO] Primeros 5 registros del DataFrame:\n", df_evaluacion.head())
-
-            is_data_loaded = True
-            print("[INFO] Datos de filtros cargados correctamente desde SheetDB.")
+# Niveles de la cascada de filtros, en el orden en que se eligen en evaluacion_docente.html
+NIVELES_CASCADA = ['ANO', 'PERIODO', 'SEDE_PRINCIPAL', 'Carrera', 'Seccion', 'Asignatura', 'INSTRUCTOR']
+NIVELES_NUMERICOS = {'ANO', 'PERIODO', 'Seccion'}
+# Nombre del parámetro de query string que usa el front para cada nivel
+PARAMETROS_CASCADA = ['ano', 'periodo', 'sede', 'carrera', 'seccion', 'asignatura', 'instructor']
+
+# Snapshot de los filtros: DataFrame normalizado + índices derivados. Se reemplaza
+# completo (una sola asignación) para que los lectores siempre vean un estado consistente.
+# "indice" es el índice jerárquico ANO→PERIODO→SEDE_PRINCIPAL→Carrera→Seccion→Asignatura→INSTRUCTOR:
+# cada nodo es {"opciones": [...ordenadas], "hijos": {valor: nodo}} y el último nivel
+# apunta a la hoja {"NRC", "SEDE_CURSO", "Tipo_Curso"} del primer registro que coincide.
+# "hash"/"etag" identifican el contenido de SheetDB del que salió, para revalidarlo, y
+# "version" es lo que se usa para las ETag de las respuestas. "columnas_crudas" y
+# "filas_crudas" son el encabezado y el número de filas de la hoja tal como los entrega
+# SheetDB, que es contra lo que se compara el sync incremental.
+snapshot = {"df": pd.DataFrame(), "indice": {"opciones": [], "hijos": {}}, "busqueda": buscador.construir_indice(None),
+            "cargado_en": None, "hash": None, "etag": None, "version": None, "columnas_crudas": None, "filas_crudas": 0}
+
+# Hilo que refresca el snapshot y evento para pedirle un refresco inmediato
+_hilo_refresco = None
+_lock_refresco = threading.Lock()
+_evento_refresco = threading.Event()
+_archivo_lock_lider = None  # Se mantiene abierto mientras el proceso sea el que refresca
+_mtime_snapshot_local = None
+# Refrescos incrementales desde la última recarga completa (arranca lleno: la primera es completa)
+_ciclos_delta = SNAPSHOT_DELTA_CICLOS_COMPLETO
+
+# LRU de respuestas JSON ya serializadas: (ruta, parámetros, versión) -> (cuerpo, status)
+_cache_respuestas = OrderedDict()
+_lock_cache = threading.Lock()
+estadisticas_cache = {"aciertos": 0, "fallos": 0, "no_modificado": 0}
+
+# Instructores genéricos que no se deben ofrecer en la cascada
+INSTRUCTORES_EXCLUIR = [
+    'LIM EOM AS INSTRUCTOR', 'LIM PM AS INSTRUCTOR', 'LIM SI AS INSTRUCTOR',
+    'LIM MMP AS INSTRUCTOR', 'LIM MSEII AS INSTRUCTOR',
+    'AQP EOM AS INSTRUCTOR', 'AQP SI AS INSTRUCTOR', 'AQP PM AS INSTRUCTOR',
+    'AQP MMP AS INSTRUCTOR', 'AQP MSEII AS INSTRUCTOR'
+]
+
+
+def _valor_nivel(nivel, valor):
+    """Convierte el valor de una celda a la clave usada en el índice (None si está vacío)."""
+    if valor is None or valor is pd.NA:
+        return None
+    if nivel in NIVELES_NUMERICOS:
+        if pd.isna(valor):
+            return None
+        return int(valor)
+    return str(valor)
+
+
+def _agregar_filas_indice(raiz, df):
+    """Inserta las filas de `df` en el índice que cuelga de `raiz`.
+
+    Los nodos que no son nuevos se copian antes de modificarlos (copy-on-write), así
+    un índice ya publicado no cambia mientras otro hilo lo lee. Devuelve los nodos
+    creados o copiados, que son los únicos cuyas opciones hay que volver a ordenar.
+    """
+    propios = {id(raiz): raiz}
+    columnas_hoja = [c for c in ('NRC', 'SEDE_CURSO', 'Tipo_Curso') if c in df.columns]
+    for fila in df[NIVELES_CASCADA + columnas_hoja].itertuples(index=False, name=None):
+        nodo = raiz
+        for nivel, valor in zip(NIVELES_CASCADA, fila):
+            clave = _valor_nivel(nivel, valor)
+            if clave is None:
+                break
+            hijo = nodo["hijos"].get(clave)
+            if hijo is None:
+                hijo = {"opciones": [], "hijos": {}}
+            elif id(hijo) not in propios:
+                hijo = dict(hijo, hijos=dict(hijo["hijos"]))
+            else:
+                nodo = hijo
+                continue
+            nodo["hijos"][clave] = hijo
+            propios[id(hijo)] = hijo
+            nodo = hijo
         else:
-            print(f"[ERROR] Error al obtener datos de SheetDB para filtros: {response.text}")
-            is_data_loaded = False
+            # Registro completo: la hoja se queda con el primer registro (como iloc[0])
+            if "hoja" not in nodo:
+                datos = dict(zip(columnas_hoja, fila[len(NIVELES_CASCADA):]))
+                nrc = datos.get('NRC')
+                nodo["hoja"] = {
+                    'NRC': None if nrc is None or pd.isna(nrc) else int(nrc),
+                    'SEDE_CURSO': str(datos.get('SEDE_CURSO')),
+                    'Tipo_Curso': datos.get('Tipo_Curso'),
+                }
+    return propios.values()
+
+
+def construir_indice_filtros(df, base=None):
+    """Construye el índice jerárquico de la cascada a partir del DataFrame normalizado.
+
+    Un registro aporta opciones hasta el primer nivel vacío, igual que el filtrado
+    con máscaras + dropna() que hacían antes los endpoints. Con `base` (un índice ya
+    construido) solo se agregan las filas de `df` encima de él, sin modificarlo.
+    """
+    if base is None:
+        raiz = {"opciones": [], "hijos": {}}
+    else:
+        raiz = dict(base, hijos=dict(base["hijos"]))
+    if df is None or df.empty or not all(c in df.columns for c in NIVELES_CASCADA):
+        return raiz
+
+    # Ordenar las opciones de cada nodo tocado una sola vez
+    for nodo in _agregar_filas_indice(raiz, df):
+        nodo["opciones"] = sorted(nodo["hijos"])
+    return raiz
+
+
+def _valor_json(valor):
+    """Convierte un valor de celda (numpy, NA, Timestamp) en algo serializable por jsonify."""
+    if valor is None or valor is pd.NA or (not isinstance(valor, str) and pd.isna(valor)):
+        return None
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    if hasattr(valor, 'item'):  # escalares numpy
+        return valor.item()
+    return valor
+
+
+def construir_indice_nrc(df, base=None):
+    """Construye los índices hash por NRC a partir del DataFrame normalizado.
+
+    Devuelve (por_nrc, nrc_por_clave):
+    - por_nrc: NRC (int) -> registro completo de la primera fila con ese NRC.
+    - nrc_por_clave: (ANO, PERIODO, SEDE_PRINCIPAL, Carrera, Seccion, Asignatura, INSTRUCTOR)
+      -> (NRC, SEDE_CURSO) de la primera fila con esa combinación (lo que devolvía iloc[0]
+      en /get_nrc). La SEDE_CURSO sale de esa misma fila y no de por_nrc: un NRC puede
+      aparecer con varias combinaciones, y así /get_nrc coincide con la hoja de /api/cascade.
+    Con `base` (un par ya construido) se parte de copias de esos diccionarios y solo se
+    recorren las filas de `df`.
+    """
+    por_nrc = dict(base[0]) if base else {}
+    nrc_por_clave = dict(base[1]) if base else {}
+    if df is None or df.empty or 'NRC' not in df.columns:
+        return por_nrc, nrc_por_clave
+
+    columnas = list(df.columns)
+    posicion_nrc = columnas.index('NRC')
+    posicion_sede = columnas.index('SEDE_CURSO') if 'SEDE_CURSO' in columnas else None
+    posiciones_clave = [columnas.index(c) for c in NIVELES_CASCADA] if all(c in columnas for c in NIVELES_CASCADA) else None
+    for fila in df.itertuples(index=False, name=None):
+        nrc = fila[posicion_nrc]
+        if nrc is pd.NA or pd.isna(nrc):
+            continue
+        nrc = int(nrc)
+        if nrc not in por_nrc:
+            por_nrc[nrc] = {c: _valor_json(v) for c, v in zip(columnas, fila)}
+        if posiciones_clave is not None:
+            clave = tuple(_valor_nivel(n, fila[p]) for n, p in zip(NIVELES_CASCADA, posiciones_clave))
+            if None not in clave and clave not in nrc_por_clave:
+                sede_curso = fila[posicion_sede] if posicion_sede is not None else None
+                nrc_por_clave[clave] = (nrc, str(sede_curso))
+    return por_nrc, nrc_por_clave
+
+
+def _nodo_indice(*claves):
+    """Devuelve el nodo del índice para el prefijo de claves dado, o None si no existe."""
+    nodo = snapshot["indice"]
+    for clave in claves:
+        nodo = nodo["hijos"].get(clave)
+        if nodo is None:
+            return None
+    return nodo
+
+
+def resolver_cascada(valores):
+    """Resuelve un prefijo de la ruta de filtros y devuelve las opciones de cada nivel.
+
+    Recorre el índice con los valores recibidos (ano, periodo, sede, ...). Cuando un
+    nivel no viene pero tiene una única opción se selecciona automáticamente, así una
+    sola llamada puede llenar varios desplegables. Si la ruta queda completa se añade
+    el curso (NRC, SEDE_CURSO, Tipo_Curso).
+    """
+    opciones = {}
+    seleccion = {}
+    nodo = snapshot["indice"]
+    for nivel, parametro in zip(NIVELES_CASCADA, PARAMETROS_CASCADA):
+        disponibles = nodo["opciones"]
+        if nivel == 'INSTRUCTOR':
+            disponibles = [i for i in disponibles if i not in INSTRUCTORES_EXCLUIR]
+        opciones[parametro] = [str(v) for v in disponibles] if nivel == 'Seccion' else list(disponibles)
+
+        valor = valores.get(parametro)
+        clave = None
+        if valor:
+            try:
+                clave = int(valor) if nivel in NIVELES_NUMERICOS else valor
+            except ValueError:
+                clave = None
+        elif len(disponibles) == 1:
+            clave = disponibles[0]
+
+        if clave is None or clave not in nodo["hijos"]:
+            break
+        seleccion[parametro] = str(clave) if nivel == 'Seccion' else clave
+        nodo = nodo["hijos"][clave]
+
+    curso = None
+    if len(seleccion) == len(NIVELES_CASCADA) and "hoja" in nodo:
+        curso = {
+            'nrc': str(nodo["hoja"]['NRC']),
+            'sede_curso': nodo["hoja"]['SEDE_CURSO'],
+            'tipo_curso': nodo["hoja"]['Tipo_Curso'],
+        }
+    return {"opciones": opciones, "seleccion": seleccion, "curso": curso}
+
+
+def normalizar_df_filtros(registros):
+    """Convertir los registros JSON de la hoja de filtros en el DataFrame normalizado."""
+    # Cargar JSON a DataFrame
+    df = pd.DataFrame(registros)
+
+    # --- Normalización de columnas y datos ---
+    # Quitar espacios en los nombres de columnas
+    df.columns = [str(c).strip() for c in df.columns]
+
+    # Reemplazar strings vacíos por NA
+    df = df.replace(r'^\s*$', pd.NA, regex=True)
+
+    # Normalizar columnas de texto (si existen) y guardarlas como categóricas:
+    # pocos valores distintos repetidos en miles de filas -> códigos enteros + diccionario
+    texto_cols = ['SEDE_PRINCIPAL', 'SEDE_CURSO', 'Carrera', 'Asignatura', 'INSTRUCTOR', 'Tipo_Curso']
+    for col in texto_cols:
+        if col in df.columns:
+            df[col] = df[col].astype(str).str.strip().astype('category')
+
+    # Normalizar columnas numéricas (SheetDB suele entregar strings) a enteros nullable
+    # en lugar de float64; si hubiera decimales se dejan como float
+    num_cols = ['ANO', 'PERIODO', 'Seccion', 'NRC']
+    for col in num_cols:
+        if col in df.columns:
+            serie = pd.to_numeric(df[col], errors='coerce')
+            valores = serie.dropna()
+            if (valores == valores.round()).all() and (valores.abs() < 2 ** 31).all():
+                serie = serie.astype('Int32')
+            df[col] = serie
+
+    # Log útil
+    log.debug("dtypes tras normalización:\n%s", df.dtypes)
+    log.debug("Primeros 5 registros del DataFrame:\n%s", df.head())
+    return df
+
+
+def construir_snapshot(df, hash_contenido=None, etag=None, cargado_en=None, columnas_crudas=None, filas_crudas=None):
+    """Arma un snapshot nuevo (DataFrame + índices derivados) a partir del DataFrame normalizado."""
+    por_nrc, nrc_por_clave = construir_indice_nrc(df)
+    cargado_en = cargado_en or datetime.datetime.now()
+    return {
+        "df": df,
+        # Índice de la cascada: los endpoints /get_* responden con búsquedas en diccionario
+        "indice": construir_indice_filtros(df),
+        # Índices hash por NRC: /get_nrc, /get_tipo_curso_por_nrc y /api/nrc/<nrc>
+        "por_nrc": por_nrc,
+        "nrc_por_clave": nrc_por_clave,
+        # Índice por palabras, prefijos y trigramas de INSTRUCTOR, Asignatura, Carrera y NRC: /api/buscar
+        "busqueda": buscador.construir_indice(df, INSTRUCTORES_EXCLUIR),
+        "cargado_en": cargado_en,
+        "hash": hash_contenido,
+        "etag": etag,
+        # Sin hash (no debería pasar) se usa la hora de carga para no repetir versiones
+        "version": (hash_contenido or hashlib.sha256(cargado_en.isoformat().encode()).hexdigest())[:20],
+        "columnas_crudas": columnas_crudas,
+        "filas_crudas": len(df) if filas_crudas is None else filas_crudas,
+    }
+
+
+def anexar_filas_filtros(df, nuevas):
+    """DataFrame con las filas normalizadas `nuevas` al final de `df`, con los mismos dtypes.
+
+    Las categóricas se amplían con las categorías nuevas (los códigos existentes no
+    cambian). Devuelve None si las filas nuevas no encajan en el esquema actual (otras
+    columnas, o decimales en una columna entera): ahí corresponde una recarga completa.
+    """
+    if list(nuevas.columns) != list(df.columns):
+        return None
+    df = df.copy(deep=False)
+    for columna in df.columns:
+        actual = df[columna].dtype
+        if isinstance(actual, pd.CategoricalDtype):
+            nuevas_categorias = pd.Index(nuevas[columna].dropna().unique()).difference(actual.categories)
+            if len(nuevas_categorias):
+                df[columna] = df[columna].cat.add_categories(nuevas_categorias)
+            nuevas[columna] = pd.Categorical(nuevas[columna], dtype=df[columna].dtype)
+        elif nuevas[columna].dtype != actual:
+            try:
+                nuevas[columna] = nuevas[columna].astype(actual)
+            except (TypeError, ValueError):
+                return None
+    return pd.concat([df, nuevas], ignore_index=True)
+
+
+def aplicar_delta_snapshot(anterior, registros, contenido):
+    """Snapshot nuevo con los registros crudos añadidos al final de la hoja (None si no encajan).
+
+    Solo se normalizan las filas nuevas; el índice de la cascada, los de NRC y el de
+    búsqueda se extienden a partir de los del snapshot anterior, que queda intacto.
+    """
+    nuevas = normalizar_df_filtros(registros)
+    df = anexar_filas_filtros(anterior["df"], nuevas)
+    if df is None:
+        return None
+
+    cargado_en = datetime.datetime.now()
+    # La hoja completa no se descarga: la huella encadena la anterior con las filas nuevas
+    hash_contenido = hashlib.sha256((anterior["hash"] or "").encode() + contenido).hexdigest()
+    por_nrc, nrc_por_clave = construir_indice_nrc(nuevas, base=(anterior["por_nrc"], anterior["nrc_por_clave"]))
+    return dict(
+        anterior,
+        df=df,
+        indice=construir_indice_filtros(nuevas, base=anterior["indice"]),
+        por_nrc=por_nrc,
+        nrc_por_clave=nrc_por_clave,
+        busqueda=buscador.construir_indice(nuevas, INSTRUCTORES_EXCLUIR, base=anterior["busqueda"]),
+        cargado_en=cargado_en,
+        hash=hash_contenido,
+        etag=None,
+        version=hash_contenido[:20],
+        filas_crudas=anterior["filas_crudas"] + len(registros),
+    )
+
+
+def guardar_snapshot_local(snap):
+    """Persistir el DataFrame normalizado en procesados/ para el próximo arranque."""
+    try:
+        datos = {
+            "version": SNAPSHOT_VERSION_ESQUEMA,
+            "hash": snap["hash"],
+            "etag": snap["etag"],
+            "cargado_en": snap["cargado_en"],
+            "columnas_crudas": snap["columnas_crudas"],
+            "filas_crudas": snap["filas_crudas"],
+            "df": snap["df"],
+        }
+        # Escribir a un temporal propio de esta escritura y renombrar: nunca queda un archivo
+        # a medias ni se mezclan dos escrituras simultáneas
+        descriptor, temporal = tempfile.mkstemp(prefix=os.path.basename(SNAPSHOT_LOCAL_PATH) + '.',
+                                                suffix='.tmp', dir=os.path.dirname(SNAPSHOT_LOCAL_PATH))
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                pickle.dump(datos, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporal, SNAPSHOT_LOCAL_PATH)
+        except BaseException:
+            os.unlink(temporal)
+            raise
+    except Exception as e:
+        log.error("No se pudo guardar el snapshot local de filtros: %s", e)
+
+
+def _registrar_carga(origen, inicio):
+    """Anotar en las métricas y el log una carga del snapshot recién publicado."""
+    segundos = time.perf_counter() - inicio
+    filas = len(snapshot["df"])
+    metricas.registrar_carga_snapshot(origen, segundos, filas)
+    log.info("Snapshot de filtros publicado", extra=bitacora.campos(
+        origen=origen, filas=filas, segundos=round(segundos, 3), version=snapshot["version"]))
+
+
+def _publicar_snapshot(nuevo):
+    """Reemplazar el snapshot publicado (una sola asignación) y vaciar las respuestas cacheadas."""
+    global snapshot, is_data_loaded
+    snapshot = nuevo
+    is_data_loaded = True
+    # Las respuestas de la versión anterior ya no se van a pedir
+    with _lock_cache:
+        _cache_respuestas.clear()
+
+
+def cargar_snapshot_local():
+    """Publicar el snapshot guardado en disco, si existe y es de la versión de esquema actual."""
+    global _mtime_snapshot_local
+    if not os.path.exists(SNAPSHOT_LOCAL_PATH):
+        return False
+    inicio = time.perf_counter()
+    try:
+        _mtime_snapshot_local = os.path.getmtime(SNAPSHOT_LOCAL_PATH)
+        with open(SNAPSHOT_LOCAL_PATH, 'rb') as f:
+            datos = pickle.load(f)
+        if datos.get("version") != SNAPSHOT_VERSION_ESQUEMA:
+            log.warning("Snapshot local con versión de esquema %s, se ignora.", datos.get('version'))
+            return False
+        if datos["hash"] is not None and datos["hash"] == snapshot["hash"]:
+            return True
+        _publicar_snapshot(construir_snapshot(
+            datos["df"], datos["hash"], datos["etag"], datos["cargado_en"], datos["columnas_crudas"], datos["filas_crudas"]
+        ))
+        _registrar_carga("local", inicio)
+        return True
+    except Exception as e:
+        log.error("No se pudo leer el snapshot local de filtros: %s", e)
+        return False
+
+
+def _snapshot_local_cambio():
+    """True si otro proceso reescribió la copia local desde la última vez que se leyó."""
+    try:
+        return os.path.getmtime(SNAPSHOT_LOCAL_PATH) != _mtime_snapshot_local
+    except OSError:
+        return False
+
+
+def sincronizar_delta_filtros():
+    """Aplicar al snapshot publicado solo las filas añadidas en SheetDB.
+
+    Devuelve True si quedó al día, False si SheetDB falló, o None cuando el cambio
+    no se puede aplicar como parche y hace falta una recarga completa.
+    """
+    anterior = snapshot
+    inicio = time.perf_counter()
+    delta = almacen.leer_delta_filtros(anterior["columnas_crudas"], anterior["filas_crudas"])
+    if delta is None:
+        return False
+    if delta["tipo"] == "completo":
+        log.info("Sync incremental de filtros no aplicable (%s); se recarga la hoja completa.", delta['motivo'])
+        return None
+    if delta["tipo"] == "sin_cambios":
+        log.info("Hoja de filtros sin filas nuevas en SheetDB; se mantiene el snapshot actual.")
+        return True
 
+    try:
+        nuevo = aplicar_delta_snapshot(anterior, delta["registros"], delta["contenido"])
+    except Exception as e:
+        log.error("Error al aplicar las filas nuevas de SheetDB: %s", e)
+        return None
+    if nuevo is None:
+        log.info("Las filas nuevas no encajan en el esquema actual; se recarga la hoja completa.")
+        return None
+
+    _publicar_snapshot(nuevo)
+    log.info("Filas nuevas de filtros aplicadas", extra=bitacora.campos(filas_nuevas=len(delta['registros'])))
+    _registrar_carga("delta", inicio)
+    guardar_snapshot_local(snapshot)
+    return True
+
+
+def cargar_datos_desde_sheetdb(completo=False):
+    """Leer datos desde Google Sheets usando SheetDB para los filtros y publicar el snapshot.
+
+    En modo "delta" se intenta primero el sync incremental; la hoja completa se lee con
+    `completo=True`, cada SNAPSHOT_DELTA_CICLOS_COMPLETO refrescos o cuando el delta no
+    se puede aplicar. Solo se vuelve a normalizar cuando el contenido cambió (ETag o
+    hash distintos). Si la lectura falla se conserva el snapshot anterior. Devuelve
+    True si el snapshot publicado está al día con SheetDB.
+    """
+    global _ciclos_delta
+    if (SNAPSHOT_SYNC_MODO == "delta" and not completo and snapshot["columnas_crudas"] is not None
+            and _ciclos_delta < SNAPSHOT_DELTA_CICLOS_COMPLETO):
+        resultado = sincronizar_delta_filtros()
+        if resultado is not None:
+            _ciclos_delta += 1
+            return resultado
+
+    inicio = time.perf_counter()
+    descarga = almacen.leer_filtros(snapshot["etag"])
+    if descarga is None:
+        return False
+    _ciclos_delta = 0
+
+    if descarga["sin_cambios"] or descarga["hash"] == snapshot["hash"]:
+        log.info("Hoja de filtros sin cambios en SheetDB; se mantiene el snapshot actual.")
+        return True
+
+    try:
+        registros = json.loads(descarga["contenido"])
+        df = normalizar_df_filtros(registros)
     except Exception as e:
-        print(f"[ERROR] Error al obtener datos desde SheetDB: {e}")
-        is_data_loaded = False
+        log.error("Error al normalizar los datos de SheetDB: %s", e)
+        return False
+
+    # Intercambio atómico: el snapshot completo se construye antes de publicarlo
+    columnas_crudas = list(registros[0].keys()) if registros else []
+    _publicar_snapshot(construir_snapshot(df, descarga["hash"], descarga["etag"],
+                                          columnas_crudas=columnas_crudas, filas_crudas=len(registros)))
+    _registrar_carga("completa", inicio)
+    guardar_snapshot_local(snapshot)
+    return True
+
+
+def _es_lider_refresco():
+    """Intenta quedarse con el lock de refresco; True si este proceso es el que lee SheetDB."""
+    global _archivo_lock_lider
+    if fcntl is None or _archivo_lock_lider is not None:
+        return True
+    archivo = open(SNAPSHOT_LOCK_PATH, 'a')
+    try:
+        fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        archivo.close()
+        return False
+    _archivo_lock_lider = archivo
+    log.info("Proceso %s a cargo del refresco de filtros desde SheetDB.", os.getpid())
+    return True
+
+
+def _pedir_refresco_al_lider():
+    """Dejar pedido un refresco explícito para el proceso líder (lo atiende en su próxima revisión)."""
+    try:
+        with open(SNAPSHOT_SOLICITUD_PATH, 'w') as f:
+            f.write(str(os.getpid()))
+        log.info("Refresco de filtros solicitado al proceso líder.")
+    except OSError as e:
+        log.error("No se pudo pedir el refresco de filtros al proceso líder: %s", e)
+
+
+def _tomar_pedido_refresco():
+    """True si algún seguidor pidió un refresco explícito; el pedido queda atendido."""
+    try:
+        os.remove(SNAPSHOT_SOLICITUD_PATH)
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        log.error("No se pudo leer el pedido de refresco de filtros: %s", e)
+        return False
+
+
+def _esperar_refresco_lider(espera):
+    """Esperar hasta `espera` segundos; True si antes llega un refresco explícito (local o de un seguidor)."""
+    limite = time.monotonic() + espera
+    while True:
+        restante = limite - time.monotonic()
+        if restante <= 0:
+            return False
+        if _evento_refresco.wait(min(restante, SNAPSHOT_SEGUIDOR_INTERVALO)):
+            _evento_refresco.clear()
+            return True
+        if _tomar_pedido_refresco():
+            return True
+
+
+def _bucle_refresco():
+    """Refresca el snapshot cada SNAPSHOT_TTL_SEGUNDOS o cuando se solicita explícitamente.
+
+    Solo el proceso líder lee SheetDB y escribe la copia local; el resto la vuelve a
+    cargar cuando cambia. Un refresco explícito (/load_data o el cronjob) que llega a
+    un seguidor se le pasa al líder, así todos los procesos terminan con el mismo
+    snapshot sin importar cuál atendió la petición.
+    """
+    explicito = False
+    while True:
+        if _es_lider_refresco():
+            ok = cargar_datos_desde_sheetdb(completo=explicito or _tomar_pedido_refresco())
+            explicito = _esperar_refresco_lider(SNAPSHOT_TTL_SEGUNDOS if ok else SNAPSHOT_REINTENTO_SEGUNDOS)
+        else:
+            if explicito:
+                _pedir_refresco_al_lider()
+            if _snapshot_local_cambio():
+                cargar_snapshot_local()
+            explicito = _evento_refresco.wait(min(SNAPSHOT_TTL_SEGUNDOS, SNAPSHOT_SEGUIDOR_INTERVALO))
+            _evento_refresco.clear()
+
+
+def iniciar_refresco_snapshot():
+    """Arranca (una sola vez por proceso) el hilo de refresco de los filtros."""
+    global _hilo_refresco
+    if _hilo_refresco is not None and _hilo_refresco.is_alive():
+        return
+    with _lock_refresco:
+        if _hilo_refresco is None or not _hilo_refresco.is_alive():
+            _hilo_refresco = threading.Thread(target=_bucle_refresco, name="refresco-snapshot", daemon=True)
+            _hilo_refresco.start()
+
+
+def solicitar_refresco_snapshot():
+    """Pide al hilo de refresco que vuelva a leer SheetDB sin esperar al TTL."""
+    iniciar_refresco_snapshot()
+    _evento_refresco.set()
+
+
+def respuesta_cacheable(vista):
+    """Decorador para endpoints GET cuya respuesta depende solo de la URL y del snapshot.
+
+    Emite una ETag fuerte derivada de la versión del snapshot y de los parámetros,
+    responde 304 a If-None-Match sin ejecutar la vista, y guarda el JSON serializado
+    en un LRU en memoria por (ruta, parámetros, versión).
+    """
+    @functools.wraps(vista)
+    def envoltura(*args, **kwargs):
+        snap = snapshot
+        if not is_data_loaded or snap["version"] is None:
+            return vista(*args, **kwargs)
+
+        parametros = tuple(sorted(request.args.items(multi=True)))
+        clave = (request.path, parametros, snap["version"])
+        etag = hashlib.sha1(repr(clave).encode()).hexdigest()
+
+        if etag in request.if_none_match:
+            with _lock_cache:
+                estadisticas_cache["no_modificado"] += 1
+            respuesta = Response(status=304)
+        else:
+            # Los contadores se suman bajo el lock: con workers gthread hay varios hilos a la vez
+            with _lock_cache:
+                entrada = _cache_respuestas.get(clave)
+                if entrada is not None:
+                    _cache_respuestas.move_to_end(clave)
+                    estadisticas_cache["aciertos"] += 1
+                else:
+                    estadisticas_cache["fallos"] += 1
+            if entrada is None:
+                resultado = app.make_response(vista(*args, **kwargs))
+                entrada = (resultado.get_data(), resultado.status_code)
+                with _lock_cache:
+                    _cache_respuestas[clave] = entrada
+                    while len(_cache_respuestas) > CACHE_RESPUESTAS_MAXIMO:
+                        _cache_respuestas.popitem(last=False)
+            respuesta = Response(entrada[0], status=entrada[1], mimetype='application/json')
+
+        respuesta.set_etag(etag)
+        respuesta.headers['Cache-Control'] = f"public, max-age={CACHE_MAX_AGE_SEGUNDOS}"
+        return respuesta
+    return envoltura
+
+
+def preparar_snapshot_inicial():
+    """Deja un snapshot publicado antes de atender peticiones (la usa wsgi.py antes del fork).
+
+    Si no hay copia local se lee SheetDB de forma síncrona una única vez.
+    """
+    if not is_data_loaded:
+        cargar_datos_desde_sheetdb()
+    return is_data_loaded
+
+
+# Arranque en frío: se sirve la copia local mientras el hilo revalida contra SheetDB
+cargar_snapshot_local()
+
+
+@app.before_request
+def _iniciar_medicion():
+    request.environ['evaluacion.inicio'] = time.perf_counter()
 
 
+@app.after_request
+def _registrar_medicion(respuesta):
+    inicio = request.environ.get('evaluacion.inicio')
+    if inicio is not None:
+        # La regla (p. ej. /api/nrc/<nrc>) y no la URL, para no crear una serie por NRC
+        ruta = request.url_rule.rule if request.url_rule is not None else 'sin_ruta'
+        metricas.registrar_ruta(ruta, request.method, respuesta.status_code, time.perf_counter() - inicio)
+    return respuesta
+
+
+@app.before_request
+def _asegurar_refresco_snapshot():
+    # Se arranca con la primera petición para no lanzar el hilo en el proceso del reloader
+    iniciar_refresco_snapshot()
+    almacen.iniciar()
+
 
 @app.route('/')
 def home():
@@ -77,88 +750,57 @@ def evaluacion_docente():
 
 @app.route('/load_data', methods=['POST'])
 def load_data():
-    """Carga los datos desde Google Sheets usando SheetDB al hacer clic en el botón."""
-    global is_data_loaded
-    if not is_data_loaded:  # Verifica si los datos ya han sido cargados
-        cargar_datos_desde_sheetdb()  # Cargar datos desde SheetDB
-        if is_data_loaded:
-            print(f"[INFO] Datos de filtros cargados correctamente.")  # Debug
-            return jsonify({"status": "success", "message": "Datos de filtros cargados correctamente"})
-        else:
-            return jsonify({"status": "error", "message": "Error al cargar los datos desde SheetDB"})
-    else:
-        return jsonify({"status": "info", "message": "Los datos de filtros ya están cargados"})
+    """Pide al hilo de refresco que vuelva a leer los filtros desde SheetDB al hacer clic en el botón."""
+    solicitar_refresco_snapshot()  # No bloquea: la lectura se hace en segundo plano
+    if is_data_loaded:
+        return jsonify({"status": "info", "message": "Los datos de filtros ya están cargados; se solicitó una actualización"})
+    return jsonify({"status": "pendiente", "message": "Cargando los datos de filtros en segundo plano"})
 
 @app.route('/get_anos')
+@respuesta_cacheable
 def get_anos():
     """Obtiene los años del archivo procesado."""  
     global is_data_loaded
     if is_data_loaded:
         try:
-            anos = sorted(df_evaluacion['ANO'].dropna().unique())
-            anos = [int(a) for a in anos]  # Convertir a tipos nativos de Python
-            print(f"[INFO] Años disponibles en el archivo: {anos}")
+            anos = list(snapshot["indice"]["opciones"])
+            log.debug("/get_anos -> %s", anos)
             return jsonify(anos)
         except Exception as e:
-            print(f"[ERROR] al obtener años: {e}")
+            log.error("Al obtener años: %s", e)
             return jsonify([])
     else:
         return jsonify({"status": "error", "message": "No data loaded"})
 
 @app.route('/get_periodos')
+@respuesta_cacheable
 def get_periodos():
     """Obtiene los periodos del archivo procesado filtrados por año."""
-    global is_data_loaded, df_evaluacion
+    global is_data_loaded
 
     # Toma el año ya casteado a int; si no viene, devolvemos lista vacía
     ano = request.args.get('ano', type=int)
     if ano is None:
-        print("[WARN] /get_periodos llamado sin parámetro 'ano'")
+        log.warning("/get_periodos llamado sin parámetro 'ano'")
         return jsonify([])
 
-    # Si aún no hay datos en memoria, intenta cargarlos
-    if not is_data_loaded:
-        cargar_datos_desde_sheetdb()
-
-    # Validaciones básicas
-    if df_evaluacion is None or df_evaluacion.empty:
-        print("[ERROR] /get_periodos: df_evaluacion vacío o no cargado")
+    # Validaciones básicas (los datos se cargan en segundo plano, nunca aquí)
+    if not snapshot["indice"]["hijos"]:
+        log.error("/get_periodos: índice de filtros vacío o no cargado")
         return jsonify([])
 
-    if 'ANO' not in df_evaluacion.columns or 'PERIODO' not in df_evaluacion.columns:
-        print("[ERROR] /get_periodos: columnas requeridas no presentes en df_evaluacion")
+    nodo = _nodo_indice(ano)
+    if nodo is None:
+        log.debug("/get_periodos: no hay filas para ANO=%s", ano)
         return jsonify([])
 
-    try:
-        # Cast defensivo: asegura que las columnas relevantes son numéricas
-        anos_series = pd.to_numeric(df_evaluacion['ANO'], errors='coerce')
-        periodos_col = pd.to_numeric(df_evaluacion['PERIODO'], errors='coerce')
-
-        # Filtra por el año solicitado
-        mask = anos_series == ano
-        if not mask.any():
-            print(f"[INFO] /get_periodos: no hay filas para ANO={ano}")
-            return jsonify([])
-
-        # Extrae periodos únicos, válidos y ordenados
-        periodos = (
-            periodos_col[mask]
-            .dropna()
-            .astype(int)
-            .unique()
-            .tolist()
-        )
-        periodos.sort()
-
-        print(f"[DEBUG] /get_periodos -> ANO={ano}, PERIODOS={periodos}")
-        return jsonify(periodos)
-
-    except Exception as e:
-        print(f"[ERROR] /get_periodos exception: {e}")
-        return jsonify([])
+    periodos = list(nodo["opciones"])
+    log.debug("/get_periodos -> ANO=%s, PERIODOS=%s", ano, periodos)
+    return jsonify(periodos)
 
 
 @app.route('/get_sedes')
+@respuesta_cacheable
 def get_sedes():
     """Obtiene las sedes del archivo procesado filtrados por año y periodo."""
     ano = request.args.get('ano')
@@ -166,20 +808,17 @@ def get_sedes():
     global is_data_loaded
     if ano and periodo:
         try:
-            df_filtrado = df_evaluacion[
-                (df_evaluacion['ANO'] == int(ano)) &
-                (df_evaluacion['PERIODO'] == int(periodo))
-            ]
-            sedes = sorted(df_filtrado['SEDE_PRINCIPAL'].dropna().unique())
-            sedes = [str(s) for s in sedes]
-            print(f"[INFO] Sedes disponibles para el año {ano} y periodo {periodo}: {sedes}")
+            nodo = _nodo_indice(int(ano), int(periodo))
+            sedes = list(nodo["opciones"]) if nodo else []
+            log.debug("/get_sedes -> ANO=%s, PERIODO=%s, SEDES=%s", ano, periodo, sedes)
             return jsonify(sedes)
         except Exception as e:
-            print(f"[ERROR] al obtener sedes: {e}")
+            log.error("Al obtener sedes: %s", e)
             return jsonify([])
     return jsonify([])
 
 @app.route('/get_carreras')
+@respuesta_cacheable
 def get_carreras():
     """Obtiene las carreras del archivo procesado filtrados por año, periodo y sede."""
     ano = request.args.get('ano')
@@ -188,21 +827,17 @@ def get_carreras():
     global is_data_loaded
     if ano and periodo and sede:
         try:
-            df_filtrado = df_evaluacion[
-                (df_evaluacion['ANO'] == int(ano)) &
-                (df_evaluacion['PERIODO'] == int(periodo)) &
-                (df_evaluacion['SEDE_PRINCIPAL'] == sede)
-            ]
-            carreras = sorted(df_filtrado['Carrera'].dropna().unique())
-            carreras = [str(c) for c in carreras]
-            print(f"[INFO] Carreras disponibles para el año {ano}, periodo {periodo} y sede {sede}: {carreras}")
+            nodo = _nodo_indice(int(ano), int(periodo), sede)
+            carreras = list(nodo["opciones"]) if nodo else []
+            log.debug("/get_carreras -> ANO=%s, PERIODO=%s, SEDE=%s, CARRERAS=%s", ano, periodo, sede, carreras)
             return jsonify(carreras)
         except Exception as e:
-            print(f"[ERROR] al obtener carreras: {e}")
+            log.error("Al obtener carreras: %s", e)
             return jsonify([])
     return jsonify([])
 
 @app.route('/get_secciones')
+@respuesta_cacheable
 def get_secciones():
     """Obtiene las secciones del archivo procesado filtrados por año, periodo, sede y carrera."""
     ano = request.args.get('ano')
@@ -212,22 +847,17 @@ def get_secciones():
     global is_data_loaded
     if ano and periodo and sede and carrera:
         try:
-            df_filtrado = df_evaluacion[
-                (df_evaluacion['ANO'] == int(ano)) &
-                (df_evaluacion['PERIODO'] == int(periodo)) &
-                (df_evaluacion['SEDE_PRINCIPAL'] == sede) &
-                (df_evaluacion['Carrera'] == carrera)
-            ]
-            secciones = sorted(df_filtrado['Seccion'].dropna().unique())
-            secciones = [str(s) for s in secciones]
-            print(f"[INFO] Secciones disponibles para el año {ano}, periodo {periodo}, sede {sede} y carrera {carrera}: {secciones}")
+            nodo = _nodo_indice(int(ano), int(periodo), sede, carrera)
+            secciones = [str(s) for s in nodo["opciones"]] if nodo else []
+            log.debug("/get_secciones -> ANO=%s, PERIODO=%s, SEDE=%s, CARRERA=%s, SECCIONES=%s", ano, periodo, sede, carrera, secciones)
             return jsonify(secciones)
         except Exception as e:
-            print(f"[ERROR] al obtener secciones: {e}")
+            log.error("Al obtener secciones: %s", e)
             return jsonify([])
     return jsonify([])
 
 @app.route('/get_asignaturas')
+@respuesta_cacheable
 def get_asignaturas():
     ano = request.args.get('ano')
     periodo = request.args.get('periodo')
@@ -237,27 +867,18 @@ def get_asignaturas():
     global is_data_loaded
     if all([ano, periodo, sede, carrera, seccion]):
         try:
-            print(f"[DEBUG] Filtros recibidos: año={ano}, periodo={periodo}, sede={sede}, carrera={carrera}, seccion={seccion}")
-            print("[DEBUG] Valores únicos en df_evaluacion['Carrera']:", df_evaluacion['Carrera'].unique())
-            print("[DEBUG] Valores únicos en df_evaluacion['Seccion']:", df_evaluacion['Seccion'].unique())
-            print("[DEBUG] Valores únicos en df_evaluacion['SEDE_PRINCIPAL']:", df_evaluacion['SEDE_PRINCIPAL'].unique())
-
-            df_filtrado = df_evaluacion[
-                (df_evaluacion['ANO'] == int(ano)) &
-                (df_evaluacion['PERIODO'] == int(periodo)) &
-                (df_evaluacion['SEDE_PRINCIPAL'] == sede) &
-                (df_evaluacion['Carrera'] == carrera) &
-                (df_evaluacion['Seccion'] == int(seccion))  # CORREGIDO AQUÍ
-            ]
-            asignaturas = sorted(df_filtrado['Asignatura'].dropna().unique())
-            asignaturas = [str(a) for a in asignaturas]
+            log.debug("/get_asignaturas: año=%s, periodo=%s, sede=%s, carrera=%s, seccion=%s", ano, periodo, sede, carrera, seccion)
+
+            nodo = _nodo_indice(int(ano), int(periodo), sede, carrera, int(seccion))
+            asignaturas = list(nodo["opciones"]) if nodo else []
             return jsonify(asignaturas)
         except Exception as e:
-            print(f"[ERROR] al obtener asignaturas: {e}")
+            log.error("Al obtener asignaturas: %s", e)
             return jsonify([])
     return jsonify([])
 
 @app.route('/get_instructores')
+@respuesta_cacheable
 def get_instructores():
     ano = request.args.get('ano')
     periodo = request.args.get('periodo')
@@ -268,208 +889,239 @@ def get_instructores():
     
     if all([ano, periodo, sede, carrera, seccion, asignatura]):
         try:
-            df_filtrado = df_evaluacion[
-                (df_evaluacion['ANO'] == int(ano)) &
-                (df_evaluacion['PERIODO'] == int(periodo)) &
-                (df_evaluacion['SEDE_PRINCIPAL'] == sede) &
-                (df_evaluacion['Carrera'] == carrera) &
-                (df_evaluacion['Seccion'] == int(seccion)) &
-                (df_evaluacion['Asignatura'] == asignatura)
-            ]
-
-            instructores = sorted(df_filtrado['INSTRUCTOR'].dropna().unique())
-
-            # Lista de instructores a excluir
-            instructores_excluir = [
-                'LIM EOM AS INSTRUCTOR', 'LIM PM AS INSTRUCTOR', 'LIM SI AS INSTRUCTOR',
-                'LIM MMP AS INSTRUCTOR', 'LIM MSEII AS INSTRUCTOR',
-                'AQP EOM AS INSTRUCTOR', 'AQP SI AS INSTRUCTOR', 'AQP PM AS INSTRUCTOR',
-                'AQP MMP AS INSTRUCTOR', 'AQP MSEII AS INSTRUCTOR'
-            ]
-
-            instructores_filtrados = [i for i in instructores if i not in instructores_excluir]
+            nodo = _nodo_indice(int(ano), int(periodo), sede, carrera, int(seccion), asignatura)
+            instructores = nodo["opciones"] if nodo else []
+
+            instructores_filtrados = [i for i in instructores if i not in INSTRUCTORES_EXCLUIR]
 
             return jsonify(instructores_filtrados)
         except Exception as e:
-            print(f"[ERROR] al obtener instructores: {e}")
+            log.error("Al obtener instructores: %s", e)
             return jsonify([])
     
     return jsonify([])
 
 @app.route('/get_nrc')
+@respuesta_cacheable
 def get_nrc():
     try:
-        filtros = {
-            'ANO': int(request.args.get('ano')),
-            'PERIODO': int(request.args.get('periodo')),
-            'SEDE_PRINCIPAL': request.args.get('sede'),
-            'Carrera': request.args.get('carrera'),
-            'Seccion': int(request.args.get('seccion')),
-            'Asignatura': request.args.get('asignatura'),
-            'INSTRUCTOR': request.args.get('instructor')
-        }
-
-        df_filtrado = df_evaluacion.copy()
-
-        for k, v in filtros.items():
-            if v is not None:
-                df_filtrado = df_filtrado[df_filtrado[k] == v]
+        clave = (
+            int(request.args.get('ano')),
+            int(request.args.get('periodo')),
+            request.args.get('sede'),
+            request.args.get('carrera'),
+            int(request.args.get('seccion')),
+            request.args.get('asignatura'),
+            request.args.get('instructor')
+        )
 
-        if not df_filtrado.empty:
-            return jsonify({
-                'nrc': str(df_filtrado.iloc[0]['NRC']),
-                'sede_curso': str(df_filtrado.iloc[0]['SEDE_CURSO'])
-            })
+        curso = snapshot["nrc_por_clave"].get(clave)
+        if curso is not None:
+            nrc, sede_curso = curso
+            return jsonify({'nrc': str(nrc), 'sede_curso': sede_curso})
 
         return jsonify({'nrc': None, 'sede_curso': None})
     
     except Exception as e:
-        print(f"[ERROR] en /get_nrc: {e}")
+        log.error("En /get_nrc: %s", e)
         return jsonify({'nrc': None, 'sede_curso': None})
 
+@app.route('/api/cascade')
+@respuesta_cacheable
+def api_cascade():
+    """Devuelve en una sola respuesta las opciones de todos los niveles de la cascada."""
+    try:
+        return jsonify(resolver_cascada(request.args))
+    except Exception as e:
+        log.error("En /api/cascade: %s", e)
+        return jsonify({"opciones": {}, "seleccion": {}, "curso": None})
+
+@app.route('/api/buscar')
+@respuesta_cacheable
+def api_buscar():
+    """Cursos cuyo instructor, asignatura, carrera o NRC coinciden con `q`, del más relevante al menos.
+
+    Cada resultado es el registro completo de la hoja de filtros más su "puntaje";
+    "total" es la cantidad de cursos que coinciden (se devuelven hasta `limite`).
+    """
+    q = request.args.get('q', '')
+    limite = max(1, min(request.args.get('limite', BUSQUEDA_LIMITE, type=int) or BUSQUEDA_LIMITE, BUSQUEDA_LIMITE_MAXIMO))
+    if len(buscador.normalizar(q)) < BUSQUEDA_MINIMO_CARACTERES:
+        return jsonify({"q": q, "total": 0, "resultados": []})
+
+    snap = snapshot
+    posiciones, total = buscador.buscar(snap["busqueda"], q, limite)
+    resultados = []
+    if posiciones:
+        df = snap["df"]
+        columnas = list(df.columns)
+        filas = df.iloc[[posicion for posicion, _ in posiciones]].itertuples(index=False, name=None)
+        for (_, puntaje), fila in zip(posiciones, filas):
+            registro = {c: _valor_json(v) for c, v in zip(columnas, fila)}
+            registro["puntaje"] = puntaje
+            resultados.append(registro)
+    log.debug("/api/buscar q=%r -> %s de %s", q, len(resultados), total)
+    return jsonify({"q": q, "total": total, "resultados": resultados})
+
 @app.route('/get_tipo_curso_por_nrc')
+@respuesta_cacheable
 def get_tipo_curso_por_nrc():
     nrc = request.args.get('nrc')
     if not nrc:
         return jsonify({'tipo_curso': None})
-    
-    df_filtrado = df_evaluacion[df_evaluacion['NRC'].astype(str) == str(nrc)]
 
-    if not df_filtrado.empty:
-        tipo = df_filtrado.iloc[0]['Tipo_Curso']
-        return jsonify({'tipo_curso': tipo})
-    return jsonify({'tipo_curso': None})
-    
-import io
-import pandas as pd
+    try:
+        registro = snapshot["por_nrc"].get(int(nrc))
+    except ValueError:
+        registro = None
 
-import requests  # Necesitamos esta librería para interactuar con SheetDB
+    if registro is not None:
+        return jsonify({'tipo_curso': registro.get('Tipo_Curso')})
+    return jsonify({'tipo_curso': None})
 
-@app.route('/guardar_resultado_tp', methods=['POST'])
-def guardar_resultado_tp():
-    """Guardar el resultado del formulario TP en Google Sheets usando SheetDB (aplanando respuestas)."""
+@app.route('/api/nrc/<nrc>')
+@respuesta_cacheable
+def api_nrc(nrc):
+    """Devuelve el registro completo del curso asociado a un NRC."""
     try:
-        data = request.get_json()
-        print(f"[INFO] Datos recibidos: {data}")
-
-        # --- Campos base (filtros + totales por sección) ---
-        nuevo_registro = {
-            "ANO": data.get("ANO", ""),
-            "PERIODO": data.get("PERIODO", ""),
-            "SEDE_CURSO": data.get("SEDE_CURSO", ""),
-            "Carrera": data.get("Carrera", ""),
-            "Seccion": data.get("Seccion", ""),
-            "Asignatura": data.get("Asignatura", ""),
-            "INSTRUCTOR": data.get("INSTRUCTOR", ""),
-            "NRC": data.get("NRC", ""),
-            # Totales/porcentajes y resultados por sección
-            "Aula_Porcentaje": data.get("Eval_Aula", ""),
-            "Aula_Resultado": data.get("Resultado_Aula", ""),
-            "Carpeta_Porcentaje": data.get("Eval_Carpeta", ""),
-            "Carpeta_Resultado": data.get("Resultado_Carpeta", ""),
-            "fechaRegistro": data.get("fechaRegistro", ""),  # Asegúrate de capturar la hora
-            "fechaEvaluacion": data.get("fechaEvaluacion", "")  # Esta es la fecha manual
-        }
+        registro = snapshot["por_nrc"].get(int(nrc))
+    except ValueError:
+        registro = None
 
-        # --- Sección AULA: aplanar preguntas ---
-        # Espera data.respuestasAula como lista de objetos:
-        # { valoracion: str, puntaje: str/num, observaciones: str, recomendaciones: str }
-        respuestas_aula = data.get("respuestasAula", []) or []
-        for idx, item in enumerate(respuestas_aula, start=1):
-            nuevo_registro[f"A{idx}_Valoracion"] = (item.get("valoracion") or "").strip()
-            nuevo_registro[f"A{idx}_Puntaje"] = item.get("puntaje") or ""
-            nuevo_registro[f"A{idx}_Observaciones"] = (item.get("observaciones") or "").strip()
-            nuevo_registro[f"A{idx}_Recomendaciones"] = (item.get("recomendaciones") or "").strip()
-
-        # --- Sección CARPETA: aplanar preguntas ---
-        # Espera data.respuestasCarpeta como lista de objetos:
-        # { valoracion: str, observaciones: str, recomendaciones: str }
-        respuestas_carpeta = data.get("respuestasCarpeta", []) or []
-        for idx, item in enumerate(respuestas_carpeta, start=1):
-            nuevo_registro[f"C{idx}_Valoracion"] = (item.get("valoracion") or "").strip()
-            nuevo_registro[f"C{idx}_Observaciones"] = (item.get("observaciones") or "").strip()
-            nuevo_registro[f"C{idx}_Recomendaciones"] = (item.get("recomendaciones") or "").strip()
-
-        # --- Envío a SheetDB ---
-        response = requests.post(
-    f"{SHEETDB_API_URL_RESULTADOS}?sheet=TP",
-    json=nuevo_registro,
-    timeout=30
-)
-        response_data = {}
-        try:
-            response_data = response.json()
-        except Exception:
-            pass
+    if registro is None:
+        return jsonify({"status": "error", "message": f"NRC {nrc} no encontrado"}), 404
+    return jsonify(registro)
 
-        print(f"[INFO] Respuesta de SheetDB: {response.status_code} {response_data}")
 
-        if response.status_code == 200 or response_data.get('created') == 1:
-            return jsonify({"status": "ok", "mensaje": "Evaluación guardada exitosamente"})
-        else:
-            return jsonify({"status": "error", "mensaje": f"Error al guardar: {response_data or response.text}"})
+def _guardar_evaluaciones(hoja, data):
+    """Aplanar según el esquema del formulario y guardar en el almacén. Devuelve cuántas se guardaron.
+
+    `data` es el payload de un formulario o una lista de payloads (carga en lote).
+    Un payload mal formado lanza esquema_resultados.ErrorPayload antes de guardar nada.
+    El resumen de resultados se suma cuando el almacén confirma la escritura (con SheetDB,
+    cuando la cola envía el lote).
+    """
+    if isinstance(data, list):
+        filas = esquema_resultados.aplanar_lote(hoja, data)
+    else:
+        filas = [esquema_resultados.aplanar(hoja, data)]
+    registros = [esquema_resultados.a_registro(hoja, fila) for fila in filas]
+    almacen.guardar_resultados(hoja, registros)
+    if len(registros) == 1:
+        log.info("Evaluación guardada", extra=bitacora.campos(hoja=hoja, almacen=almacen.nombre, nrc=registros[0]['NRC']))
+    else:
+        log.info("Evaluaciones guardadas en lote",
+                 extra=bitacora.campos(hoja=hoja, almacen=almacen.nombre, cantidad=len(registros)))
+    return len(registros)
+
 
+@app.route('/guardar_resultado_tp', methods=['POST'])
+def guardar_resultado_tp():
+    """Guardar el resultado del formulario TP (o una lista de ellos) en la hoja TP de SheetDB."""
+    try:
+        # Con SheetDB (o en espejo) el envío a la hoja lo hace la cola de resultados, en lotes y en segundo plano
+        guardadas = _guardar_evaluaciones("TP", request.get_json(silent=True))
+        return jsonify({"status": "ok", "mensaje": "Evaluación guardada exitosamente", "guardadas": guardadas})
+
+    except esquema_resultados.ErrorPayload as e:
+        log.warning("Evaluación rechazada: %s", e, extra=bitacora.campos(hoja="TP"))
+        return jsonify({"status": "error", "mensaje": str(e)}), 400
     except Exception as e:
-        print(f"[ERROR] Error al guardar la evaluación: {e}")
+        log.exception("Error al guardar la evaluación", extra=bitacora.campos(hoja="TP"))
         return jsonify({"status": "error", "mensaje": str(e)})
 
 @app.route('/guardar_resultado_p', methods=['POST'])
 def guardar_resultado_p():
-    """Guardar el resultado del formulario P en Google Sheets usando SheetDB."""
+    """Guardar el resultado del formulario P (o una lista de ellos) en la hoja P de SheetDB."""
     try:
-        data = request.get_json()
-        print(f"[INFO] Datos recibidos (P): {data}")
-
-        # --- Metadatos + totales ---
-        nuevo_registro = {
-            "ANO": data.get("ANO", ""),
-            "PERIODO": data.get("PERIODO", ""),
-            "SEDE_CURSO": data.get("SEDE_CURSO", ""),
-            "Carrera": data.get("Carrera", ""),
-            "Seccion": data.get("Seccion", ""),
-            "Asignatura": data.get("Asignatura", ""),
-            "INSTRUCTOR": data.get("INSTRUCTOR", ""),
-            "NRC": data.get("NRC", ""),
-            "Aula_Porcentaje": data.get("Eval_Aula", ""),
-            "Aula_Resultado": data.get("Resultado_Aula", ""),
-            "Carpeta_Porcentaje": data.get("Eval_Carpeta", ""),
-            "Carpeta_Resultado": data.get("Resultado_Carpeta", ""),
-            "fechaRegistro": data.get("fechaRegistro", ""),  # Asegúrate de capturar la hora
-            "fechaEvaluacion": data.get("fechaEvaluacion", "")  # Esta es la fecha manual
-        }
-
-        # --- AULA (criterios): Puntaje, Observaciones, Recomendaciones ---
-        # Espera: data.respuestasAula = [{puntaje, observaciones, recomendaciones}, ...]
-        respuestas_aula = data.get("respuestasAula", []) or []
-        for idx, item in enumerate(respuestas_aula, start=1):
-            nuevo_registro[f"A{idx}_Puntaje"] = item.get("puntaje") or ""
-            nuevo_registro[f"A{idx}_Observaciones"] = (item.get("observaciones") or "").strip()
-            nuevo_registro[f"A{idx}_Recomendaciones"] = (item.get("recomendaciones") or "").strip()
-
-        # --- CARPETA: Valoracion, Observaciones, Recomendaciones ---
-        # Espera: data.respuestasCarpeta = [{valoracion, observaciones, recomendaciones}, ...]
-        respuestas_carpeta = data.get("respuestasCarpeta", []) or []
-        for idx, item in enumerate(respuestas_carpeta, start=1):
-            nuevo_registro[f"C{idx}_Valoracion"] = (item.get("valoracion") or "").strip()
-            nuevo_registro[f"C{idx}_Observaciones"] = (item.get("observaciones") or "").strip()
-            nuevo_registro[f"C{idx}_Recomendaciones"] = (item.get("recomendaciones") or "").strip()
-
-        # --- Envío a la hoja "P" ---
-        resp = requests.post(f"{SHEETDB_API_URL}?sheet=P", json=nuevo_registro, timeout=30)
-        try:
-            data_resp = resp.json()
-        except Exception:
-            data_resp = {}
-
-        print(f"[INFO] SheetDB P -> {resp.status_code} {data_resp}")
-        if resp.status_code == 200 or data_resp.get("created") == 1:
-            return jsonify({"status": "ok", "mensaje": "Evaluación P guardada"})
-        else:
-            return jsonify({"status": "error", "mensaje": f"Error al guardar: {data_resp or resp.text}"})
+        guardadas = _guardar_evaluaciones("P", request.get_json(silent=True))
+        return jsonify({"status": "ok", "mensaje": "Evaluación P guardada", "guardadas": guardadas})
+    except esquema_resultados.ErrorPayload as e:
+        log.warning("Evaluación rechazada: %s", e, extra=bitacora.campos(hoja="P"))
+        return jsonify({"status": "error", "mensaje": str(e)}), 400
     except Exception as e:
-        print(f"[ERROR] guardar_resultado_p: {e}")
+        log.exception("Error al guardar la evaluación", extra=bitacora.campos(hoja="P"))
         return jsonify({"status": "error", "mensaje": str(e)})
     
+@app.route('/api/cola_resultados')
+def api_cola_resultados():
+    """Estado de la cola de resultados pendientes de enviar a SheetDB."""
+    return jsonify(cola_resultados.estado_cola())
+
+@app.route('/api/cola_resultados/reintentar', methods=['POST'])
+def api_cola_resultados_reintentar():
+    """Vuelve a poner en cola los resultados que agotaron sus reintentos."""
+    reintentados = cola_resultados.reintentar_fallidos()
+    return jsonify({"status": "ok", "reintentados": reintentados})
+
+@app.route('/api/resultados/resumen')
+def api_resultados_resumen():
+    """Promedios de Aula/Carpeta, distribución de A{n}_Puntaje y conteos por grupo.
+
+    Parámetros opcionales: hoja (TP o P), agrupar (lista separada por comas de
+    ano, periodo, sede, carrera, instructor; por defecto todas) y filtros exactos
+    con esos mismos nombres.
+    """
+    columnas = {parametro: columna for columna, parametro in resumen_resultados.DIMENSIONES.items()}
+    hoja = request.args.get('hoja') or None
+    if hoja is not None and hoja not in resumen_resultados.HOJAS:
+        return jsonify({"status": "error", "mensaje": "hoja debe ser TP o P"}), 400
+
+    agrupar = None
+    if 'agrupar' in request.args:
+        parametros = [p.strip() for p in request.args['agrupar'].split(',') if p.strip()]
+        desconocidos = [p for p in parametros if p not in columnas]
+        if desconocidos:
+            return jsonify({"status": "error", "mensaje": f"No se puede agrupar por: {', '.join(desconocidos)}"}), 400
+        agrupar = [columnas[p] for p in parametros]
+    filtros = {columna: request.args[parametro] for parametro, columna in columnas.items() if request.args.get(parametro)}
+
+    grupos = resumen_resultados.consultar(agrupar, filtros, hoja)
+    return jsonify({"status": "ok", "hoja": hoja, "grupos": grupos})
+
+@app.route('/api/resultados/resumen/reconstruir', methods=['POST'])
+def api_resultados_resumen_reconstruir():
+    """Rehace el resumen leyendo una vez las hojas TP y P completas del almacenamiento."""
+    try:
+        leidos = resumen_resultados.reconstruir(almacen.leer_resultados)
+    except Exception as e:
+        log.error("No se pudo reconstruir el resumen de resultados: %s", e)
+        return jsonify({"status": "error", "mensaje": str(e)}), 502
+    log.info("Resumen de resultados reconstruido", extra=bitacora.campos(**leidos))
+    return jsonify({"status": "ok", "registros": leidos})
+
+@app.route('/metrics')
+def metrics():
+    """Métricas del proceso en formato de exposición de Prometheus."""
+    snap = snapshot
+    with _lock_cache:
+        aciertos, fallos, no_modificado = (estadisticas_cache[k] for k in ("aciertos", "fallos", "no_modificado"))
+    consultas = aciertos + fallos + no_modificado
+    simples = [
+        ("snapshot_filas", "gauge", "Filas del snapshot de filtros publicado", [({}, len(snap["df"]))]),
+        ("snapshot_edad_segundos", "gauge", "Segundos desde que se cargó el snapshot publicado",
+         [({}, (datetime.datetime.now() - snap["cargado_en"]).total_seconds() if snap["cargado_en"] else None)]),
+        ("cache_respuestas_total", "counter", "Respuestas de la cascada por resultado en la caché",
+         [({"resultado": "acierto"}, aciertos), ({"resultado": "fallo"}, fallos), ({"resultado": "no_modificado"}, no_modificado)]),
+        ("cache_respuestas_ratio_aciertos", "gauge", "Fracción de respuestas servidas sin ejecutar la vista (LRU o 304)",
+         [({}, (aciertos + no_modificado) / consultas if consultas else None)]),
+        ("cache_respuestas_entradas", "gauge", "Respuestas guardadas en el LRU", [({}, len(_cache_respuestas))]),
+    ]
+    try:
+        cola = cola_resultados.estado_cola()
+        simples.append(("cola_resultados", "gauge", "Evaluaciones en la cola local por estado",
+                        [({"estado": "pendiente"}, cola["pendientes"]), ({"estado": "fallido"}, cola["fallidos"])]))
+    except Exception as e:
+        log.warning("No se pudo leer el estado de la cola para /metrics: %s", e)
+
+    cuerpo = metricas.renderizar(sheetdb_client.estadisticas_latencia(), simples)
+    return Response(cuerpo, mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/sheetdb/latencias')
+def api_sheetdb_latencias():
+    """Histograma de latencias de las llamadas a SheetDB por operación."""
+    return jsonify(sheetdb_client.estadisticas_latencia())
+
 @app.route('/formulario_p')
 def formulario_p():
     nrc = request.args.get('nrc')
@@ -480,21 +1132,102 @@ def formulario_tp():
     nrc = request.args.get('nrc')
     return render_template('formulario_tp.html', nrc=nrc)
 
+@app.route('/procesar_nrcs', methods=['GET'])
+def procesar_nrcs_form():
+    return render_template('procesar_nrcs.html')
+
+@app.route('/procesar_nrcs', methods=['POST'])
+def procesar_nrcs():
+    """Recibe el Excel de planificación y lanza la generación de NRCs en segundo plano."""
+    archivo = request.files.get('file')
+    if archivo is None or not archivo.filename:
+        return jsonify({"status": "error", "mensaje": "No se recibió ningún archivo"}), 400
+    if not archivo.filename.lower().endswith('.xlsx'):
+        return jsonify({"status": "error", "mensaje": "El archivo debe ser .xlsx"}), 400
+
+    nombre = secure_filename(archivo.filename) or 'planificacion.xlsx'
+    id_trabajo = generador_nrcs.nuevo_id()
+    archivo.save(generador_nrcs.ruta_entrada(id_trabajo))  # Werkzeug lo copia por bloques, sin leerlo entero en memoria
+
+    generador_nrcs.encolar_trabajo(id_trabajo, nombre)
+    log.info("Trabajo de NRCs encolado", extra=bitacora.campos(id=id_trabajo, archivo=nombre))
+    return jsonify({"status": "ok", "id": id_trabajo})
+
+@app.route('/procesar_nrcs/estado/<id_trabajo>')
+def procesar_nrcs_estado(id_trabajo):
+    """Progreso de un trabajo de generación de NRCs."""
+    estado = generador_nrcs.estado_trabajo(id_trabajo)
+    if estado is None:
+        return jsonify({"status": "error", "mensaje": "Trabajo no encontrado"}), 404
+    return jsonify(estado)
+
+@app.route('/procesar_nrcs/descargar/<id_trabajo>')
+def procesar_nrcs_descargar(id_trabajo):
+    """Descarga el Excel generado por un trabajo terminado."""
+    salida = generador_nrcs.archivo_salida_trabajo(id_trabajo)
+    if salida is None or not os.path.exists(salida[0]):
+        return jsonify({"status": "error", "mensaje": "El archivo aún no está disponible"}), 404
+    ruta, nombre = salida
+    return send_file(ruta, as_attachment=True, download_name=nombre)
+
+@app.route('/asistencias_operatic', methods=['GET'])
+def asistencias_operatic_form():
+    return render_template('asistencias_operatic.html')
+
+
+@app.route('/asistencias_operatic', methods=['POST'])
+def asistencias_operatic():
+    """Procesa el registro de asistencias subido y descarga el conteo por rango de fechas."""
+    archivo = request.files.get('file')
+    if archivo is None or archivo.filename == '':
+        flash("No se seleccionó ningún archivo.")
+        return redirect('/asistencias_operatic')
+    nombre = secure_filename(archivo.filename)
+    if not nombre.lower().endswith(('.xlsx', '.csv')):
+        flash("El archivo debe ser .xlsx o .csv.")
+        return redirect('/asistencias_operatic')
+
+    inicio = datetime.datetime.now()
+    try:
+        tabla, fechas_invalidas = asistencias.procesar_asistencias(
+            archivo.stream, nombre, request.form.getlist('rango_inicio[]'), request.form.getlist('rango_fin[]')
+        )
+    except asistencias.ErrorAsistencias as e:
+        flash(str(e))
+        return redirect('/asistencias_operatic')
+    except Exception as e:
+        log.error("Error procesando asistencias: %s", e, extra=bitacora.campos(archivo=nombre))
+        flash(f"No se pudo procesar el archivo: {e}")
+        return redirect('/asistencias_operatic')
+
+    log.info("Asistencias procesadas", extra=bitacora.campos(
+        archivo=nombre, personas=len(tabla), fechas_invalidas=fechas_invalidas,
+        segundos=round((datetime.datetime.now() - inicio).total_seconds(), 3)))
+    if fechas_invalidas:
+        log.warning("Registros de asistencia con fecha ilegible descartados",
+                    extra=bitacora.campos(archivo=nombre, registros=fechas_invalidas))
+        flash(f"Se descartaron {fechas_invalidas} registros de {nombre} porque su fecha no se pudo leer.")
+    base = os.path.splitext(nombre)[0] or 'asistencias'
+    return send_file(
+        asistencias.resultado_a_excel(tabla),
+        as_attachment=True,
+        download_name=f"{base}_asistencias.xlsx",
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+
+
 @app.route('/cronjob_load_data', methods=['GET'])
 def cronjob_load_data():
-    """Este endpoint se ejecutará a través del cronjob para cargar automáticamente los datos desde SheetDB."""
-    global is_data_loaded
-    if not is_data_loaded:  # Verifica si los datos ya han sido cargados
-        cargar_datos_desde_sheetdb()  # Cargar datos desde SheetDB
-        if is_data_loaded:
-            print(f"[INFO] Datos de filtros cargados correctamente desde SheetDB a las {datetime.datetime.now()}.")
-            return jsonify({"status": "success", "message": "Datos de filtros cargados correctamente"})
-        else:
-            print(f"[ERROR] Error al cargar los datos desde SheetDB.")
-            return jsonify({"status": "error", "message": "Error al cargar los datos desde SheetDB"})
-    else:
-        print(f"[INFO] Los datos de filtros ya están cargados.")
-        return jsonify({"status": "info", "message": "Los datos de filtros ya están cargados"})
+    """Este endpoint se ejecutará a través del cronjob para forzar un refresco de los datos desde SheetDB."""
+    solicitar_refresco_snapshot()
+    log.info("Refresco de filtros solicitado por cronjob")
+    if is_data_loaded:
+        return jsonify({
+            "status": "info",
+            "message": "Los datos de filtros ya están cargados; se solicitó una actualización",
+            "cargado_en": snapshot["cargado_en"].isoformat(),
+        })
+    return jsonify({"status": "pendiente", "message": "Cargando los datos de filtros en segundo plano"})
 
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))  # Usar el puerto dinámico proporcionado por Render
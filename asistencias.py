@@ -0,0 +1,205 @@
+"""Procesamiento de asistencias OPERATIC (ruta /asistencias_operatic).
+
+Cuenta, por persona, los días con asistencia dentro de cada rango de fechas elegido
+en el formulario. El archivo se lee por bloques (openpyxl read-only para .xlsx,
+read_csv con chunksize para .csv) y cada bloque se reduce a pares únicos
+persona-día antes de juntarlos, así la memoria depende de cuántas personas y días
+hay y no del largo del archivo.
+
+La asignación de cada registro a su rango se hace de una vez para todo el bloque
+con np.searchsorted sobre los inicios ordenados de los rangos, sin recorrer filas
+ni rangos en Python.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+# Filas por bloque al leer el archivo
+TAMANO_BLOQUE = 200_000
+
+# Columnas candidatas (se comparan sin distinguir mayúsculas); se usan las que existan
+COLUMNAS_FECHA = ['Fecha', 'Fecha_Asistencia', 'Fecha Asistencia', 'Fecha_Hora', 'Fecha y hora']
+COLUMNAS_PERSONA = ['DNI', 'Codigo', 'Código', 'Apellidos', 'Apellido', 'Nombres', 'Nombre',
+                    'Alumno', 'Participante', 'Usuario', 'Correo', 'Email']
+COLUMNAS_ESTADO = ['Asistencia', 'Estado']
+# Valores de la columna de estado que cuentan como asistencia ('A' no: en los exportes
+# en castellano suele ser "ausente")
+VALORES_PRESENTE = {'ASISTIO', 'ASISTIÓ', 'PRESENTE', 'P', 'SI', 'SÍ', '1', 'TRUE', 'TARDANZA', 'T'}
+
+
+class ErrorAsistencias(ValueError):
+    """Error de validación que se muestra tal cual al usuario (flash)."""
+
+
+def _buscar_columna(columnas, candidatas):
+    por_nombre = {str(c).strip().lower(): c for c in columnas}
+    for candidata in candidatas:
+        if candidata.lower() in por_nombre:
+            return por_nombre[candidata.lower()]
+    return None
+
+
+def detectar_columnas(columnas):
+    """Elige la columna de fecha, las de identificación de la persona y la de estado."""
+    fecha = _buscar_columna(columnas, COLUMNAS_FECHA)
+    if fecha is None:
+        fecha = next((c for c in columnas if 'fecha' in str(c).lower()), None)
+    if fecha is None:
+        raise ErrorAsistencias("No se encontró una columna de fecha en el archivo.")
+
+    persona = []
+    for candidata in COLUMNAS_PERSONA:
+        columna = _buscar_columna(columnas, [candidata])
+        if columna is not None and columna not in persona:
+            persona.append(columna)
+    if not persona:
+        raise ErrorAsistencias(f"No se encontró ninguna columna que identifique a la persona ({', '.join(COLUMNAS_PERSONA)}).")
+
+    return fecha, persona, _buscar_columna(columnas, COLUMNAS_ESTADO)
+
+
+def normalizar_rangos(inicios, fines):
+    """Valida los rangos del formulario y los devuelve ordenados como arrays datetime64[D].
+
+    Devuelve (inicios, fines, etiquetas). Los rangos no pueden superponerse: cada
+    registro cae como máximo en uno.
+    """
+    if not inicios or len(inicios) != len(fines):
+        raise ErrorAsistencias("Debe indicar al menos un rango de fechas completo.")
+    try:
+        inicio = pd.to_datetime(pd.Series(inicios)).dt.normalize()
+        fin = pd.to_datetime(pd.Series(fines)).dt.normalize()
+    except (ValueError, TypeError):
+        raise ErrorAsistencias("Las fechas de los rangos no son válidas.")
+    if (fin < inicio).any():
+        raise ErrorAsistencias("La fecha de fin de un rango no puede ser anterior a su inicio.")
+
+    orden = np.argsort(inicio.to_numpy(), kind='stable')
+    inicio = inicio.to_numpy()[orden].astype('datetime64[D]')
+    fin = fin.to_numpy()[orden].astype('datetime64[D]')
+    if len(inicio) > 1 and (inicio[1:] <= fin[:-1]).any():
+        raise ErrorAsistencias("Los rangos de fechas no deben superponerse.")
+
+    etiquetas = [f"{i} a {f}" for i, f in zip(inicio, fin)]
+    return inicio, fin, etiquetas
+
+
+def asignar_rango(dias, inicios, fines):
+    """Índice del rango (ordenado) en que cae cada día, o -1 si no cae en ninguno."""
+    posicion = np.searchsorted(inicios, dias, side='right') - 1
+    dentro = (posicion >= 0) & (dias <= fines[np.clip(posicion, 0, None)])
+    return np.where(dentro, posicion, -1)
+
+
+def leer_por_bloques(archivo, nombre, tamano_bloque=TAMANO_BLOQUE):
+    """Genera DataFrames de hasta `tamano_bloque` filas a partir de un .xlsx o .csv."""
+    if nombre.lower().endswith('.csv'):
+        yield from pd.read_csv(archivo, chunksize=tamano_bloque, dtype=str)
+        return
+
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        encabezado = [str(c).strip() if c is not None else f"col_{i}" for i, c in enumerate(next(filas, []))]
+        bloque = []
+        for fila in filas:
+            bloque.append(fila)
+            if len(bloque) >= tamano_bloque:
+                yield pd.DataFrame(bloque, columns=encabezado)
+                bloque = []
+        if bloque:
+            yield pd.DataFrame(bloque, columns=encabezado)
+    finally:
+        libro.close()
+
+
+def _a_dias(serie):
+    """Columna de fecha (datetime de openpyxl o texto) a datetime64[D].
+
+    Devuelve (días, cuántos valores no vacíos no se pudieron leer); esos quedan NaT.
+    Cada valor se interpreta por separado (un mismo archivo puede traer dd/mm/aaaa,
+    dd/mm/aaaa HH:MM e ISO) y una sola vez por valor distinto, porque se repiten mucho.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie.to_numpy().astype('datetime64[D]'), 0
+    codigos, valores = pd.factorize(serie)
+    valores = pd.Series(valores, dtype=object)
+    fechas = pd.to_datetime(valores, format='mixed', dayfirst=True, errors='coerce').to_numpy().astype('datetime64[D]')
+    invalidas = np.isnat(fechas) & (valores.astype(str).str.strip() != '').to_numpy()
+    presentes = codigos >= 0
+    dias = np.full(len(codigos), np.datetime64('NaT'), dtype='datetime64[D]')
+    dias[presentes] = fechas[codigos[presentes]]
+    return dias, int(invalidas[codigos[presentes]].sum())
+
+
+def _limpiar_texto(serie):
+    """str + strip aplicados una vez por valor distinto y repartidos por código (hay pocos distintos)."""
+    codigos, valores = pd.factorize(serie, use_na_sentinel=False)
+    return pd.Index(valores).astype(str).str.strip().to_numpy()[codigos]
+
+
+def _reducir_bloque(df, columnas, inicios, fines):
+    """Pares únicos (persona, rango, día) con asistencia dentro de algún rango y cuántas fechas no se leyeron."""
+    fecha, persona, estado = columnas
+    if estado is not None:
+        codigos, valores = pd.factorize(df[estado], use_na_sentinel=False)
+        presentes = pd.Index(valores).astype(str).str.strip().str.upper().isin(VALORES_PRESENTE)
+        df = df[presentes[codigos]]
+
+    dias, fechas_invalidas = _a_dias(df[fecha])
+    rango = asignar_rango(dias, inicios, fines)
+    validos = (rango >= 0) & ~np.isnat(dias)
+
+    reducido = pd.DataFrame({columna: _limpiar_texto(df[columna].to_numpy()[validos]) for columna in persona})
+    reducido['_rango'] = rango[validos]
+    reducido['_dia'] = dias[validos]
+    return reducido.drop_duplicates(), fechas_invalidas
+
+
+def agregar_asistencias(bloques, inicios, fines, etiquetas):
+    """Tabla final (una fila por persona, días asistidos por rango y total) y cuántos
+    registros con asistencia se descartaron por tener una fecha que no se pudo leer."""
+    columnas = None
+    parciales = []
+    fechas_invalidas = 0
+    for df in bloques:
+        if columnas is None:
+            columnas = detectar_columnas(list(df.columns))
+        if not df.empty:
+            parcial, invalidas = _reducir_bloque(df, columnas, inicios, fines)
+            parciales.append(parcial)
+            fechas_invalidas += invalidas
+
+    if columnas is None:
+        raise ErrorAsistencias("El archivo está vacío.")
+    persona = columnas[1]
+    if not parciales:
+        return pd.DataFrame(columns=persona + etiquetas + ['Total']), fechas_invalidas
+
+    # Un mismo persona-día puede venir en dos bloques: se deduplica al juntar
+    unicos = pd.concat(parciales, ignore_index=True).drop_duplicates()
+    tabla = (
+        unicos.groupby(persona + ['_rango'], sort=False).size()
+        .unstack('_rango', fill_value=0)
+        .reindex(columns=range(len(etiquetas)), fill_value=0)
+    )
+    tabla.columns = etiquetas
+    tabla['Total'] = tabla.sum(axis=1)
+    return tabla.reset_index().sort_values(persona, kind='stable').reset_index(drop=True), fechas_invalidas
+
+
+def procesar_asistencias(archivo, nombre, inicios, fines, tamano_bloque=TAMANO_BLOQUE):
+    """Lee el archivo subido y devuelve (tabla de asistencias por rango, fechas que no se pudieron leer)."""
+    rango_inicio, rango_fin, etiquetas = normalizar_rangos(inicios, fines)
+    return agregar_asistencias(leer_por_bloques(archivo, nombre, tamano_bloque), rango_inicio, rango_fin, etiquetas)
+
+
+def resultado_a_excel(tabla):
+    """Serializa la tabla de resultado a un .xlsx en memoria, listo para send_file."""
+    salida = io.BytesIO()
+    with pd.ExcelWriter(salida, engine='openpyxl') as writer:
+        tabla.to_excel(writer, index=False, sheet_name='Asistencias')
+    salida.seek(0)
+    return salida
@@ -0,0 +1,34 @@
+"""Archivos locales de la aplicación: la carpeta procesados/ y sus bases SQLite.
+
+La cola de resultados, el resumen, el almacenamiento SQLite y los trabajos de NRCs
+guardan su estado en bases SQLite dentro de procesados/. Todas se abren igual: una
+conexión por operación (las conexiones de sqlite3 no se comparten entre hilos), en
+modo WAL para que las lecturas no esperen a las escrituras, y con el esquema creado
+la primera vez que el proceso abre cada base.
+"""
+import os
+import sqlite3
+import threading
+
+CARPETA_BASE = os.path.dirname(os.path.abspath(__file__))
+CARPETA_PROCESADOS = os.path.join(CARPETA_BASE, 'procesados')
+CARPETA_UPLOADS = os.path.join(CARPETA_BASE, 'uploads')
+
+_lock_esquemas = threading.Lock()
+_esquemas_listos = set()
+
+
+def conectar(ruta, crear_esquema):
+    """Abrir una conexión a la base SQLite `ruta` (una por operación, segura entre hilos).
+
+    `crear_esquema(conexion)` crea tablas e índices con IF NOT EXISTS; se llama solo
+    la primera vez que este proceso abre `ruta`.
+    """
+    conexion = sqlite3.connect(ruta, timeout=30)
+    if ruta not in _esquemas_listos:
+        with _lock_esquemas:
+            conexion.execute("PRAGMA journal_mode=WAL")
+            crear_esquema(conexion)
+            conexion.commit()
+            _esquemas_listos.add(ruta)
+    return conexion
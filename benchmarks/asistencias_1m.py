@@ -0,0 +1,99 @@
+"""Benchmark del conteo de asistencias OPERATIC sobre un registro sintético grande.
+
+Genera un registro de asistencias (DNI, Nombre, Fecha, Asistencia) con N filas y
+compara, para los mismos rangos de fechas:
+
+- legado: una máscara booleana por rango y un groupby por rango (recorre el
+  DataFrame completo una vez por rango)
+- actual: asistencias.agregar_asistencias por bloques, con searchsorted para
+  asignar el rango de todas las filas de una vez
+
+Además mide la lectura por bloques de un .csv del mismo tamaño (el .xlsx de 1M
+filas tarda minutos solo en escribirse con openpyxl, así que se omite por defecto).
+
+Uso:  python benchmarks/asistencias_1m.py [filas] [rangos]
+"""
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import asistencias  # noqa: E402
+
+
+def generar_registro(filas, personas=5000, semilla=7):
+    """Registro sintético: varias marcas por persona y día en un año, ~10% de ausencias."""
+    rng = np.random.default_rng(semilla)
+    ids = rng.integers(0, personas, filas)
+    inicio = np.datetime64('2024-01-01T00:00')
+    minutos = rng.integers(0, 365 * 24 * 60, filas)
+    return pd.DataFrame({
+        'DNI': pd.Series(ids + 70_000_000).astype(str),
+        'Nombre': pd.Series(ids).map(lambda i: f"Persona {i}"),
+        'Fecha': pd.Series(inicio + minutos.astype('timedelta64[m]')).dt.strftime('%Y-%m-%d %H:%M'),
+        'Asistencia': np.where(rng.random(filas) < 0.9, 'PRESENTE', 'FALTA'),
+    })
+
+
+def generar_rangos(cantidad):
+    """`cantidad` rangos consecutivos del mismo largo que no se superponen dentro de 2024."""
+    limites = pd.date_range('2024-01-01', '2024-12-31', periods=cantidad + 1).normalize()
+    inicios = [d.strftime('%Y-%m-%d') for d in limites[:-1]]
+    fines = [(d - pd.Timedelta(days=1)).strftime('%Y-%m-%d') for d in limites[1:]]
+    return inicios, fines
+
+
+def conteo_legado(df, inicios, fines):
+    """Una pasada completa por rango: máscara entre fechas + groupby de días únicos."""
+    df = df[df['Asistencia'].str.strip().str.upper().isin(asistencias.VALORES_PRESENTE)]
+    dias = pd.to_datetime(df['Fecha'], errors='coerce').dt.normalize()
+    columnas = {}
+    for inicio, fin in zip(inicios, fines):
+        mascara = (dias >= pd.Timestamp(inicio)) & (dias <= pd.Timestamp(fin))
+        parcial = df.loc[mascara, ['DNI', 'Nombre']].assign(_dia=dias[mascara]).drop_duplicates()
+        columnas[f"{inicio} a {fin}"] = parcial.groupby(['DNI', 'Nombre']).size()
+    tabla = pd.DataFrame(columnas).fillna(0).astype(int)
+    tabla['Total'] = tabla.sum(axis=1)
+    return tabla
+
+
+def medir(nombre, funcion):
+    inicio = time.perf_counter()
+    resultado = funcion()
+    print(f"{nombre:<40} {time.perf_counter() - inicio:8.2f} s")
+    return resultado
+
+
+def main():
+    filas = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    cantidad_rangos = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    df = generar_registro(filas)
+    inicios, fines = generar_rangos(cantidad_rangos)
+    rango_inicio, rango_fin, etiquetas = asistencias.normalizar_rangos(inicios, fines)
+    print(f"Filas: {filas:,}  Rangos: {cantidad_rangos}")
+
+    legado = medir("legado (máscara por rango)", lambda: conteo_legado(df, inicios, fines))
+    bloques = [df.iloc[i:i + asistencias.TAMANO_BLOQUE] for i in range(0, len(df), asistencias.TAMANO_BLOQUE)]
+    actual, _ = medir("actual (searchsorted por bloques)",
+                      lambda: asistencias.agregar_asistencias(bloques, rango_inicio, rango_fin, etiquetas))
+
+    legado = legado.reset_index().rename(columns={'level_0': 'DNI', 'level_1': 'Nombre'})
+    comparacion = actual.merge(legado, on=['DNI', 'Nombre'], suffixes=('', '_legado'))
+    iguales = len(comparacion) == len(actual) == len(legado) and all(
+        (comparacion[c] == comparacion[f"{c}_legado"]).all() for c in etiquetas + ['Total']
+    )
+    print(f"Resultados iguales: {iguales}")
+
+    csv = io.BytesIO(df.to_csv(index=False).encode())
+    medir("actual desde .csv (lectura incluida)",
+          lambda: asistencias.procesar_asistencias(csv, 'registro.csv', inicios, fines))
+
+
+if __name__ == '__main__':
+    main()
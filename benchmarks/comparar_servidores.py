@@ -0,0 +1,130 @@
+"""Compara el throughput del servidor de desarrollo contra gunicorn (gunicorn.conf.py).
+
+Levanta un SheetDB local con una hoja sintética, arranca cada servidor como
+subproceso apuntando a él, y durante unos segundos lanza peticiones concurrentes
+a una mezcla de endpoints de la cascada. Imprime req/s, p50 y p99.
+
+Uso:  python benchmarks/comparar_servidores.py [filas] [clientes] [segundos]
+"""
+import os
+import sys
+import time
+import random
+import signal
+import tempfile
+import threading
+import subprocess
+
+import requests
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sheetdb_local import SheetDBLocal, generar_hoja_filtros  # noqa: E402
+
+
+def urls_cascada(registros, cantidad, semilla=11):
+    """URLs de /get_* y /api/cascade para combinaciones que existen en la hoja."""
+    aleatorio = random.Random(semilla)
+    urls = []
+    for _ in range(cantidad):
+        r = aleatorio.choice(registros)
+        base = {'ano': r['ANO'], 'periodo': r['PERIODO'], 'sede': r['SEDE_PRINCIPAL'], 'carrera': r['Carrera'],
+                'seccion': r['Seccion'], 'asignatura': r['Asignatura'], 'instructor': r['INSTRUCTOR']}
+        ruta, claves = aleatorio.choice([
+            ('/get_periodos', ['ano']),
+            ('/get_sedes', ['ano', 'periodo']),
+            ('/get_carreras', ['ano', 'periodo', 'sede']),
+            ('/get_secciones', ['ano', 'periodo', 'sede', 'carrera']),
+            ('/get_asignaturas', ['ano', 'periodo', 'sede', 'carrera', 'seccion']),
+            ('/get_instructores', ['ano', 'periodo', 'sede', 'carrera', 'seccion', 'asignatura']),
+            ('/get_nrc', list(base)),
+            ('/api/cascade', list(base)),
+        ])
+        urls.append((ruta, {k: base[k] for k in claves}))
+    return urls
+
+
+def esperar_listo(url, segundos=60):
+    limite = time.time() + segundos
+    while time.time() < limite:
+        try:
+            if requests.get(url + '/get_anos', timeout=1).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.3)
+    return False
+
+
+def medir(url_base, urls, clientes, segundos):
+    """Lanza `clientes` hilos con sesión propia durante `segundos`; devuelve métricas."""
+    latencias = []
+    lock = threading.Lock()
+    fin = time.time() + segundos
+
+    def cliente(indice):
+        sesion = requests.Session()
+        propias = []
+        i = indice
+        while time.time() < fin:
+            ruta, params = urls[i % len(urls)]
+            i += clientes
+            inicio = time.perf_counter()
+            sesion.get(url_base + ruta, params=params, timeout=30)
+            propias.append(time.perf_counter() - inicio)
+        with lock:
+            latencias.extend(propias)
+
+    hilos = [threading.Thread(target=cliente, args=(i,)) for i in range(clientes)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    latencias.sort()
+    return {
+        'req_s': len(latencias) / segundos,
+        'p50_ms': latencias[len(latencias) // 2] * 1000,
+        'p99_ms': latencias[int(len(latencias) * 0.99)] * 1000,
+    }
+
+
+def main():
+    filas = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    clientes = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    segundos = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    registros = generar_hoja_filtros(filas)
+    url_sheetdb = SheetDBLocal(registros).iniciar_en_hilo()
+    urls = urls_cascada(registros, 2000)
+    carpeta = tempfile.mkdtemp(prefix='bench_servidores_')
+
+    servidores = [
+        ('python app.py (debug, reloader)', [sys.executable, 'app.py'], 5101),
+        ('gunicorn (gunicorn.conf.py)', [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'], 5102),
+    ]
+    print(f"{'servidor':40}{'req/s':>10}{'p50 (ms)':>12}{'p99 (ms)':>12}")
+    for nombre, comando, puerto in servidores:
+        entorno = dict(os.environ,
+                       PORT=str(puerto),
+                       SHEETDB_API_URL_FILTERS=f"{url_sheetdb}/filtros",
+                       SHEETDB_API_URL=f"{url_sheetdb}/resultados",
+                       SNAPSHOT_LOCAL_PATH=os.path.join(carpeta, f"snapshot_{puerto}.pkl"),
+                       COLA_RESULTADOS_DB=os.path.join(carpeta, f"cola_{puerto}.sqlite3"))
+        proceso = subprocess.Popen(comando, cwd=RAIZ, env=entorno, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL, start_new_session=True)
+        try:
+            url_app = f"http://127.0.0.1:{puerto}"
+            if not esperar_listo(url_app):
+                print(f"{nombre:40}{'no arrancó':>10}")
+                continue
+            time.sleep(2)  # que el refresco inicial termine
+            resultado = medir(url_app, urls, clientes, segundos)
+            print(f"{nombre:40}{resultado['req_s']:10.0f}{resultado['p50_ms']:12.1f}{resultado['p99_ms']:12.1f}")
+        finally:
+            os.killpg(proceso.pid, signal.SIGTERM)
+            proceso.wait(timeout=10)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Reporte de memoria y latencia del DataFrame de filtros: normalización anterior vs. actual.
+
+Usa la planificación real (procesados/planificacion_academica_proc.xlsx) convertida a
+strings, que es como SheetDB entrega la hoja de filtros, y compara:
+
+- memoria del DataFrame (memory_usage(deep=True))
+- tiempo de normalización
+- tiempo de un filtro por igualdad de 7 columnas (el patrón que usaba /get_nrc)
+
+Uso:  python benchmarks/reporte_memoria_filtros.py [ruta.xlsx] [repeticiones]
+(requiere openpyxl para leer el Excel)
+"""
+import os
+import sys
+import time
+import contextlib
+import io
+
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import app  # noqa: E402
+
+FILTROS_GET_NRC = ['ANO', 'PERIODO', 'SEDE_PRINCIPAL', 'Carrera', 'Seccion', 'Asignatura', 'INSTRUCTOR']
+
+
+def normalizar_legado(registros):
+    """Normalización tal como estaba antes: texto como object y números como float64."""
+    df = pd.DataFrame(registros)
+    df.columns = [str(c).strip() for c in df.columns]
+    df = df.replace(r'^\s*$', pd.NA, regex=True)
+    for col in ['SEDE_PRINCIPAL', 'SEDE_CURSO', 'Carrera', 'Asignatura', 'INSTRUCTOR', 'Tipo_Curso']:
+        if col in df.columns:
+            df[col] = df[col].astype(str).str.strip()
+    for col in ['ANO', 'PERIODO', 'Seccion', 'NRC']:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+
+def mascara_igualdad(df, columna, valor):
+    """Máscara booleana de `columna == valor` sin comparar objetos fila por fila.
+
+    En columnas categóricas se busca el código del valor una vez y se comparan los
+    códigos enteros; en las numéricas se compara contra el valor ya convertido.
+    """
+    serie = df[columna]
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        categorias = serie.cat.categories
+        if valor not in categorias:
+            return pd.Series(False, index=df.index)
+        return serie.cat.codes == categorias.get_loc(valor)
+    if pd.api.types.is_numeric_dtype(serie):
+        try:
+            valor = float(valor)
+        except (TypeError, ValueError):
+            return pd.Series(False, index=df.index)
+    return (serie == valor).fillna(False)
+
+
+def medir(funcion, repeticiones):
+    """Mediana en milisegundos de `repeticiones` ejecuciones."""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return tiempos[len(tiempos) // 2]
+
+
+def main():
+    ruta = sys.argv[1] if len(sys.argv) > 1 else os.path.join(RAIZ, 'procesados', 'planificacion_academica_proc.xlsx')
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    registros = pd.read_excel(ruta).astype(str).to_dict('records')
+    with contextlib.redirect_stdout(io.StringIO()):
+        df_legado = normalizar_legado(registros)
+        df_actual = app.normalizar_df_filtros(registros)
+        t_norm_legado = medir(lambda: normalizar_legado(registros), 3)
+        t_norm_actual = medir(lambda: app.normalizar_df_filtros(registros), 3)
+
+    fila = df_legado.iloc[len(df_legado) // 2]
+    filtros = {c: fila[c] for c in FILTROS_GET_NRC}
+
+    def filtrar_legado():
+        mascara = pd.Series(True, index=df_legado.index)
+        for columna, valor in filtros.items():
+            mascara &= df_legado[columna] == valor
+        return df_legado[mascara]
+
+    def filtrar_actual():
+        mascara = pd.Series(True, index=df_actual.index)
+        for columna, valor in filtros.items():
+            mascara &= mascara_igualdad(df_actual, columna, valor)
+        return df_actual[mascara]
+
+    assert len(filtrar_legado()) == len(filtrar_actual())
+
+    columnas = [c for c in FILTROS_GET_NRC + ['SEDE_CURSO', 'Tipo_Curso', 'NRC'] if c in df_actual.columns]
+    mem_legado = df_legado[columnas].memory_usage(deep=True).sum() / 1024
+    mem_actual = df_actual[columnas].memory_usage(deep=True).sum() / 1024
+    mem_legado_total = df_legado.memory_usage(deep=True).sum() / 1024
+    mem_actual_total = df_actual.memory_usage(deep=True).sum() / 1024
+    t_filtro_legado = medir(filtrar_legado, repeticiones)
+    t_filtro_actual = medir(filtrar_actual, repeticiones)
+
+    print(f"Archivo: {ruta} ({len(df_actual)} filas, {len(df_actual.columns)} columnas)")
+    print(f"{'':34}{'anterior':>12}{'actual':>12}")
+    print(f"{'Memoria columnas de filtro (KiB)':34}{mem_legado:12.1f}{mem_actual:12.1f}")
+    print(f"{'Memoria DataFrame completo (KiB)':34}{mem_legado_total:12.1f}{mem_actual_total:12.1f}")
+    print(f"{'Normalización (ms, mediana)':34}{t_norm_legado:12.2f}{t_norm_actual:12.2f}")
+    print(f"{'Filtro 7 columnas (ms, mediana)':34}{t_filtro_legado:12.3f}{t_filtro_actual:12.3f}")
+    print("dtypes actuales:", {c: str(df_actual[c].dtype) for c in columnas})
+
+
+if __name__ == '__main__':
+    main()
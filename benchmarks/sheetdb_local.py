@@ -0,0 +1,166 @@
+"""Servidor HTTP local que imita a SheetDB, para benchmarks y pruebas sin red.
+
+- GET  /filtros                  hoja de filtros sintética (JSON), con ETag / If-None-Match
+                                 y paginación ?limit=&offset=
+- GET  /filtros/keys             encabezado de la hoja
+- GET  /filtros/count            {"rows": n}
+- POST /resultados?sheet=TP|P    acepta un registro o {"data": [...]} y responde {"created": n}
+- GET  /resultados?sheet=TP|P    filas recibidas en esa hoja
+- GET  /resultados/search?sheet=TP|P&NRC=...
+                                 filas de esa hoja con esos valores
+- GET  /estado                   conteo de peticiones y filas recibidas
+
+Con `caido = True` todo (salvo /estado) responde 503, para probar los reintentos de
+la cola y el modo espejo sin SheetDB.
+
+Uso:  python benchmarks/sheetdb_local.py [puerto] [filas] [latencia_ms]
+y apuntar la app con SHEETDB_API_URL_FILTERS=http://127.0.0.1:<puerto>/filtros
+y SHEETDB_API_URL=http://127.0.0.1:<puerto>/resultados.
+"""
+import sys
+import json
+import urllib.parse
+import time
+import random
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+SEDES = {'FCHB': ['FCHB', 'EMPLEABILIDAD'], 'ABQ': ['ABQ'], 'LIM': ['LIM', 'EMPLEABILIDAD'], 'AQP': ['AQP']}
+CARRERAS = [
+    'EXPLORACIÓN Y OPERACIÓN MINERA', 'SEGURIDAD INDUSTRIAL', 'PROCESAMIENTO DE MINERALES',
+    'MANTENIMIENTO DE MAQUINARIA PESADA', 'MANTENIMIENTO DE SISTEMAS ELÉCTRICOS INDUSTRIALES',
+]
+
+
+def generar_hoja_filtros(filas, semilla=7):
+    """Genera `filas` registros con las columnas de la hoja de filtros, todos como strings."""
+    aleatorio = random.Random(semilla)
+    instructores = [f"INSTRUCTOR {i:04d} APELLIDO NOMBRE" for i in range(max(20, filas // 15))]
+    asignaturas = [f"ASIGNATURA {i:04d}" for i in range(max(30, filas // 10))]
+    registros = []
+    for i in range(filas):
+        sede = aleatorio.choice(list(SEDES))
+        registros.append({
+            'ANO': str(aleatorio.choice([2024, 2025])),
+            'PERIODO': str(aleatorio.randint(1, 4)),
+            'SEDE_PRINCIPAL': sede,
+            'SEDE_CURSO': aleatorio.choice(SEDES[sede]),
+            'Carrera': aleatorio.choice(CARRERAS),
+            'Seccion': str(aleatorio.randint(1, 4)),
+            'Asignatura': aleatorio.choice(asignaturas),
+            'INSTRUCTOR': aleatorio.choice(instructores),
+            'NRC': str(1000 + i),
+            'Tipo_Curso': aleatorio.choice(['TP', 'P']),
+            'MODALIDAD': 'PRESENCIAL',
+        })
+    return registros
+
+
+class SheetDBLocal:
+    """Estado del servidor: hoja de filtros servida y filas recibidas por hoja."""
+
+    def __init__(self, registros, latencia_ms=0):
+        self.latencia = latencia_ms / 1000
+        self.lock = threading.Lock()
+        self.filas_recibidas = {}
+        self.hojas = {}
+        self.peticiones = 0
+        self.caido = False
+        self.publicar(registros)
+
+    def publicar(self, registros):
+        """Reemplaza la hoja de filtros servida (cambia también la ETag)."""
+        cuerpo = json.dumps(registros, ensure_ascii=False).encode()
+        self.registros = registros
+        self.cuerpo = cuerpo
+        self.etag = '"%s"' % hashlib.sha1(cuerpo).hexdigest()
+
+    def anexar(self, registros):
+        """Agrega filas al final de la hoja servida, como cuando se completa la planificación."""
+        self.publicar(self.registros + list(registros))
+
+    def servidor(self, puerto=0):
+        """Crea el ThreadingHTTPServer (puerto 0 = uno libre); llamar a serve_forever()."""
+        estado = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _responder(self, codigo, cuerpo=b'', headers=None):
+                self.send_response(codigo)
+                for clave, valor in (headers or {}).items():
+                    self.send_header(clave, valor)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def do_GET(self):
+                with estado.lock:
+                    estado.peticiones += 1
+                if self.path.startswith('/estado'):
+                    with estado.lock:
+                        cuerpo = json.dumps({'peticiones': estado.peticiones, 'filas_recibidas': estado.filas_recibidas})
+                    return self._responder(200, cuerpo.encode())
+                time.sleep(estado.latencia)
+                if estado.caido:
+                    return self._responder(503, b'{"error": "no disponible"}')
+                ruta, _, consulta = self.path.partition('?')
+                if ruta.startswith('/resultados'):
+                    parametros = urllib.parse.parse_qs(consulta)
+                    hoja = parametros.pop('sheet', [''])[0]
+                    with estado.lock:
+                        filas = list(estado.hojas.get(hoja, []))
+                    if ruta.endswith('/search'):
+                        # Igualdad exacta en cada columna pedida (SheetDB además admite comodines)
+                        filas = [f for f in filas if all(str(f.get(c, '')) == v[0] for c, v in parametros.items())]
+                    return self._responder(200, json.dumps(filas, ensure_ascii=False).encode())
+                registros = estado.registros
+                if ruta.endswith('/keys'):
+                    return self._responder(200, json.dumps(list(registros[0]) if registros else []).encode())
+                if ruta.endswith('/count'):
+                    return self._responder(200, json.dumps({'rows': len(registros)}).encode())
+                parametros = urllib.parse.parse_qs(consulta)
+                if 'limit' in parametros or 'offset' in parametros:
+                    inicio = int(parametros.get('offset', ['0'])[0])
+                    limite = int(parametros['limit'][0]) if 'limit' in parametros else len(registros)
+                    pagina = json.dumps(registros[inicio:inicio + limite], ensure_ascii=False).encode()
+                    return self._responder(200, pagina)
+                if self.headers.get('If-None-Match') == estado.etag:
+                    return self._responder(304, headers={'ETag': estado.etag})
+                self._responder(200, estado.cuerpo, {'ETag': estado.etag})
+
+            def do_POST(self):
+                with estado.lock:
+                    estado.peticiones += 1
+                largo = int(self.headers.get('Content-Length', 0))
+                cuerpo = json.loads(self.rfile.read(largo) or b'{}')
+                if estado.caido:
+                    return self._responder(503, b'{"error": "no disponible"}')
+                filas = cuerpo['data'] if isinstance(cuerpo, dict) and 'data' in cuerpo else [cuerpo]
+                hoja = self.path.split('sheet=')[-1] if 'sheet=' in self.path else ''
+                time.sleep(estado.latencia)
+                with estado.lock:
+                    estado.filas_recibidas[hoja] = estado.filas_recibidas.get(hoja, 0) + len(filas)
+                    estado.hojas.setdefault(hoja, []).extend(filas)
+                self._responder(201, json.dumps({'created': len(filas)}).encode())
+
+        return ThreadingHTTPServer(('127.0.0.1', puerto), Manejador)
+
+    def iniciar_en_hilo(self, puerto=0):
+        """Arranca el servidor en un hilo daemon y devuelve la URL base."""
+        servidor = self.servidor(puerto)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{servidor.server_address[1]}"
+
+
+if __name__ == '__main__':
+    puerto = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    filas = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    latencia = float(sys.argv[3]) if len(sys.argv) > 3 else 0
+    print(f"SheetDB local en http://127.0.0.1:{puerto} ({filas} filas)")
+    SheetDBLocal(generar_hoja_filtros(filas), latencia).servidor(puerto).serve_forever()
@@ -0,0 +1,333 @@
+"""Suite de benchmarks del flujo de evaluación, para comparar entre commits.
+
+Para cada escala (1x, 10x y 100x filas de la hoja de filtros sintética) levanta un
+SheetDB local con esa hoja y mide:
+
+- carga del snapshot: recarga completa desde SheetDB y sync incremental (delta),
+  dentro de este mismo proceso
+- cada endpoint /get_*, /get_nrc, /api/cascade, /api/buscar y los dos /guardar_resultado_*
+  contra gunicorn (gunicorn.conf.py) con clientes concurrentes: req/s, p50 y p99
+
+El resultado se guarda como JSON en benchmarks/resultados/ con el commit, la
+máquina y la configuración, y dos archivos se comparan con --comparar.
+
+Uso:
+    python benchmarks/suite.py [--filas 2000] [--escalas 1,10,100] [--clientes 8] [--segundos 3]
+    python benchmarks/suite.py --comparar benchmarks/resultados/A.json benchmarks/resultados/B.json
+"""
+import os
+import sys
+import io
+import json
+import time
+import random
+import signal
+import argparse
+import platform
+import tempfile
+import threading
+import contextlib
+import subprocess
+import datetime
+
+import requests
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CARPETA_RESULTADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resultados')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+# bitacora lee LOG_NIVEL al importarse: tiene que estar antes del primer módulo de la app
+os.environ.setdefault('LOG_NIVEL', 'WARNING')
+
+from sheetdb_local import SheetDBLocal, generar_hoja_filtros  # noqa: E402
+from comparar_servidores import esperar_listo  # noqa: E402
+import esquema_resultados  # noqa: E402
+
+# Ruta -> parámetros de la cascada que recibe
+RUTAS_CASCADA = [
+    ('/get_anos', []),
+    ('/get_periodos', ['ano']),
+    ('/get_sedes', ['ano', 'periodo']),
+    ('/get_carreras', ['ano', 'periodo', 'sede']),
+    ('/get_secciones', ['ano', 'periodo', 'sede', 'carrera']),
+    ('/get_asignaturas', ['ano', 'periodo', 'sede', 'carrera', 'seccion']),
+    ('/get_instructores', ['ano', 'periodo', 'sede', 'carrera', 'seccion', 'asignatura']),
+    ('/get_nrc', ['ano', 'periodo', 'sede', 'carrera', 'seccion', 'asignatura', 'instructor']),
+    ('/api/cascade', ['ano', 'periodo', 'sede', 'carrera', 'seccion', 'asignatura', 'instructor']),
+]
+RUTAS_GUARDADO = [('/guardar_resultado_tp', 'TP'), ('/guardar_resultado_p', 'P')]
+
+
+def peticiones_cascada(registros, ruta, claves, cantidad, semilla=11):
+    """Peticiones GET a `ruta` para combinaciones que existen en la hoja."""
+    aleatorio = random.Random(semilla)
+    peticiones = []
+    for _ in range(cantidad):
+        r = aleatorio.choice(registros)
+        base = {'ano': r['ANO'], 'periodo': r['PERIODO'], 'sede': r['SEDE_PRINCIPAL'], 'carrera': r['Carrera'],
+                'seccion': r['Seccion'], 'asignatura': r['Asignatura'], 'instructor': r['INSTRUCTOR']}
+        peticiones.append(('GET', ruta, {'params': {k: base[k] for k in claves}}))
+    return peticiones
+
+
+def peticiones_busqueda(registros, cantidad, semilla=17):
+    """Consultas a /api/buscar como se escriben en el buscador: prefijos de instructor, asignatura o NRC."""
+    aleatorio = random.Random(semilla)
+    peticiones = []
+    for _ in range(cantidad):
+        r = aleatorio.choice(registros)
+        texto = aleatorio.choice([r['INSTRUCTOR'], r['Asignatura'], f"{r['Carrera']} {r['Asignatura']}", r['NRC']])
+        peticiones.append(('GET', '/api/buscar', {'params': {'q': texto[:aleatorio.randint(2, len(texto))]}}))
+    return peticiones
+
+
+def payload_evaluacion(hoja, registro, aleatorio):
+    """Payload como el que arma formulario_tp.html / formulario_p.html, con todas las preguntas."""
+    payload = {
+        "ANO": registro['ANO'], "PERIODO": registro['PERIODO'], "SEDE_CURSO": registro['SEDE_CURSO'],
+        "Carrera": registro['Carrera'], "Seccion": registro['Seccion'], "Asignatura": registro['Asignatura'],
+        "INSTRUCTOR": registro['INSTRUCTOR'], "NRC": registro['NRC'],
+        "Eval_Aula": round(aleatorio.uniform(40, 100), 2), "Resultado_Aula": "LOGRADO",
+        "Eval_Carpeta": round(aleatorio.uniform(40, 100), 2), "Resultado_Carpeta": "LOGRADO",
+        "fechaRegistro": "2025-05-20", "fechaEvaluacion": "2025-05-19",
+    }
+    for clave, _, preguntas, campos in esquema_resultados.SECCIONES[hoja]:
+        respuestas = []
+        for _ in range(preguntas):
+            respuesta = {}
+            for _, clave_item, _ in campos:
+                if clave_item == 'puntaje':
+                    respuesta[clave_item] = str(aleatorio.randint(0, 4))
+                elif clave_item == 'valoracion':
+                    respuesta[clave_item] = aleatorio.choice(["Se observa", "Se observa parcialmente", "No se observa"])
+                else:
+                    respuesta[clave_item] = aleatorio.choice(["", "Sin comentarios", "Reforzar el cierre de la sesión"])
+            respuestas.append(respuesta)
+        payload[clave] = respuestas
+    return payload
+
+
+def peticiones_guardado(registros, ruta, hoja, cantidad, semilla=13):
+    aleatorio = random.Random(semilla)
+    return [('POST', ruta, {'json': payload_evaluacion(hoja, aleatorio.choice(registros), aleatorio)})
+            for _ in range(cantidad)]
+
+
+def percentil(valores, p):
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else None
+
+
+def medir_carga(url_base, peticiones, clientes, segundos):
+    """`clientes` hilos con sesión propia repiten `peticiones` durante `segundos`."""
+    latencias = []
+    errores = [0]
+    lock = threading.Lock()
+    fin = time.perf_counter() + segundos
+
+    def cliente(indice):
+        sesion = requests.Session()
+        propias = []
+        fallidas = 0
+        i = indice
+        while time.perf_counter() < fin:
+            metodo, ruta, kwargs = peticiones[i % len(peticiones)]
+            i += clientes
+            inicio = time.perf_counter()
+            try:
+                response = sesion.request(metodo, url_base + ruta, timeout=30, **kwargs)
+                if response.status_code >= 400:
+                    fallidas += 1
+            except requests.RequestException:
+                fallidas += 1
+            propias.append(time.perf_counter() - inicio)
+        with lock:
+            latencias.extend(propias)
+            errores[0] += fallidas
+
+    inicio = time.perf_counter()
+    hilos = [threading.Thread(target=cliente, args=(i,)) for i in range(clientes)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+    latencias.sort()
+    return {
+        'peticiones': len(latencias),
+        'errores': errores[0],
+        'req_s': round(len(latencias) / duracion, 1),
+        'p50_ms': round(percentil(latencias, 0.50) * 1000, 3) if latencias else None,
+        'p99_ms': round(percentil(latencias, 0.99) * 1000, 3) if latencias else None,
+    }
+
+
+def medir_snapshot(app, url_filtros, servidor, registros, repeticiones):
+    """Tiempos de recarga completa y de sync delta del snapshot, en este proceso."""
+    app.almacen = app.almacenamiento.AlmacenSheetDB(url_filtros, None)
+    app.SNAPSHOT_SYNC_MODO = "delta"
+    completos = []
+    deltas = []
+    silencio = io.StringIO()
+    for _ in range(repeticiones):
+        servidor.publicar(registros)
+        # Olvidar la huella para que la recarga no se salte por "sin cambios"
+        app.snapshot = dict(app.snapshot, hash=None, etag=None)
+        with contextlib.redirect_stdout(silencio):
+            inicio = time.perf_counter()
+            app.cargar_datos_desde_sheetdb(completo=True)
+            completos.append(time.perf_counter() - inicio)
+
+            nuevas = [dict(r, NRC=str(900000 + i)) for i, r in enumerate(registros[:max(1, len(registros) // 100)])]
+            servidor.anexar(nuevas)
+            app._ciclos_delta = 0
+            inicio = time.perf_counter()
+            app.cargar_datos_desde_sheetdb()
+            deltas.append(time.perf_counter() - inicio)
+    completos.sort()
+    deltas.sort()
+    return {
+        'completo': {'p50_ms': round(percentil(completos, 0.5) * 1000, 1), 'max_ms': round(completos[-1] * 1000, 1)},
+        'delta_1pct': {'p50_ms': round(percentil(deltas, 0.5) * 1000, 1), 'max_ms': round(deltas[-1] * 1000, 1)},
+        'filas': len(app.snapshot["df"]),
+    }
+
+
+def medir_endpoints(url_sheetdb, registros, clientes, segundos, carpeta, puerto):
+    """Arranca gunicorn contra el SheetDB local y mide cada endpoint por separado."""
+    entorno = dict(os.environ,
+                   PORT=str(puerto),
+                   LOG_NIVEL='WARNING',
+                   SHEETDB_API_URL_FILTERS=f"{url_sheetdb}/filtros",
+                   SHEETDB_API_URL=f"{url_sheetdb}/resultados",
+                   SNAPSHOT_LOCAL_PATH=os.path.join(carpeta, f"snapshot_{puerto}.pkl"),
+                   COLA_RESULTADOS_DB=os.path.join(carpeta, f"cola_{puerto}.sqlite3"),
+                   RESUMEN_RESULTADOS_DB=os.path.join(carpeta, f"resumen_{puerto}.sqlite3"))
+    proceso = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'], cwd=RAIZ, env=entorno,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    resultados = {}
+    try:
+        url_app = f"http://127.0.0.1:{puerto}"
+        if not esperar_listo(url_app, segundos=300):
+            raise RuntimeError("gunicorn no arrancó")
+        time.sleep(2)  # que el refresco inicial termine
+        for ruta, claves in RUTAS_CASCADA:
+            resultados[ruta] = medir_carga(url_app, peticiones_cascada(registros, ruta, claves, 2000), clientes, segundos)
+            imprimir_fila(ruta, resultados[ruta])
+        resultados['/api/buscar'] = medir_carga(url_app, peticiones_busqueda(registros, 2000), clientes, segundos)
+        imprimir_fila('/api/buscar', resultados['/api/buscar'])
+        for ruta, hoja in RUTAS_GUARDADO:
+            resultados[ruta] = medir_carga(url_app, peticiones_guardado(registros, ruta, hoja, 200), clientes, segundos)
+            imprimir_fila(ruta, resultados[ruta])
+    finally:
+        os.killpg(proceso.pid, signal.SIGTERM)
+        proceso.wait(timeout=30)
+    return resultados
+
+
+def imprimir_fila(nombre, datos):
+    print(f"  {nombre:28}{datos['req_s']:>10}{datos['p50_ms']:>12}{datos['p99_ms']:>12}{datos['errores']:>9}")
+
+
+def commit_actual():
+    try:
+        salida = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True, text=True, timeout=30)
+        commit = salida.stdout.strip() or None
+        sucio = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=RAIZ,
+                               capture_output=True, text=True, timeout=60).stdout.strip()
+        return f"{commit}+cambios" if commit and sucio else commit
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def ejecutar(args):
+    carpeta = tempfile.mkdtemp(prefix='bench_suite_')
+    os.environ['SNAPSHOT_LOCAL_PATH'] = os.path.join(carpeta, 'snapshot_local.pkl')
+    os.environ['COLA_RESULTADOS_DB'] = os.path.join(carpeta, 'cola_local.sqlite3')
+    os.environ['RESUMEN_RESULTADOS_DB'] = os.path.join(carpeta, 'resumen_local.sqlite3')
+    # Las rutas de las bases también se leen al importar: app (y lo que importa) recién ahora
+    import app
+
+    resultado = {
+        'commit': commit_actual(),
+        'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+        'maquina': {'python': platform.python_version(), 'plataforma': platform.platform(), 'cpus': os.cpu_count()},
+        'config': {'filas_base': args.filas, 'clientes': args.clientes, 'segundos': args.segundos,
+                   'latencia_sheetdb_ms': args.latencia_ms, 'workers': os.environ.get('WEB_CONCURRENCY', '2')},
+        'escalas': {},
+    }
+    for indice, escala in enumerate(args.escalas):
+        filas = args.filas * escala
+        print(f"\n== {escala}x ({filas} filas) ==")
+        registros = generar_hoja_filtros(filas)
+        servidor = SheetDBLocal(registros, args.latencia_ms)
+        url_sheetdb = servidor.iniciar_en_hilo()
+
+        snapshot = medir_snapshot(app, f"{url_sheetdb}/filtros", servidor, registros, args.repeticiones_snapshot)
+        print(f"  snapshot completo p50 {snapshot['completo']['p50_ms']} ms, delta (+1%) p50 {snapshot['delta_1pct']['p50_ms']} ms")
+
+        servidor.publicar(registros)
+        print(f"  {'endpoint':28}{'req/s':>10}{'p50 (ms)':>12}{'p99 (ms)':>12}{'errores':>9}")
+        endpoints = medir_endpoints(url_sheetdb, registros, args.clientes, args.segundos, carpeta, args.puerto + indice)
+        resultado['escalas'][f"{escala}x"] = {'filas': filas, 'snapshot': snapshot, 'endpoints': endpoints}
+
+    os.makedirs(CARPETA_RESULTADOS, exist_ok=True)
+    nombre = f"{datetime.datetime.now():%Y%m%d_%H%M%S}_{resultado['commit'] or 'sin_git'}.json"
+    ruta = args.salida or os.path.join(CARPETA_RESULTADOS, nombre)
+    with open(ruta, 'w') as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {ruta}")
+
+
+def _cambio(antes, despues, mayor_es_mejor):
+    if not antes or despues is None:
+        return ''
+    porcentaje = (despues - antes) / antes * 100
+    mejora = porcentaje > 0 if mayor_es_mejor else porcentaje < 0
+    return f"{porcentaje:+.0f}%{'' if abs(porcentaje) < 5 else (' ✓' if mejora else ' ✗')}"
+
+
+def comparar(ruta_base, ruta_nueva):
+    with open(ruta_base) as f:
+        base = json.load(f)
+    with open(ruta_nueva) as f:
+        nueva = json.load(f)
+    print(f"base:  {base['commit']} ({base['fecha']})\nnueva: {nueva['commit']} ({nueva['fecha']})")
+    for escala, datos in nueva['escalas'].items():
+        anterior = base['escalas'].get(escala)
+        if anterior is None:
+            continue
+        print(f"\n== {escala} ({datos['filas']} filas) ==")
+        for tipo in ('completo', 'delta_1pct'):
+            a, d = anterior['snapshot'][tipo]['p50_ms'], datos['snapshot'][tipo]['p50_ms']
+            print(f"  snapshot {tipo:19}{a:>10} -> {d:<10} ms {_cambio(a, d, False)}")
+        print(f"  {'endpoint':28}{'req/s':>24}{'p50 (ms)':>26}{'p99 (ms)':>26}")
+        for ruta, medicion in datos['endpoints'].items():
+            previa = anterior['endpoints'].get(ruta)
+            if previa is None:
+                continue
+            columnas = []
+            for clave, mayor_es_mejor in (('req_s', True), ('p50_ms', False), ('p99_ms', False)):
+                columnas.append(f"{previa[clave]:>8} -> {medicion[clave]:<8}{_cambio(previa[clave], medicion[clave], mayor_es_mejor):>8}")
+            print(f"  {ruta:28}" + "".join(f"{c:>26}" for c in columnas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--filas', type=int, default=2000, help="filas de la hoja en la escala 1x")
+    parser.add_argument('--escalas', type=lambda s: [int(x) for x in s.split(',')], default=[1, 10, 100])
+    parser.add_argument('--clientes', type=int, default=8, help="clientes concurrentes por endpoint")
+    parser.add_argument('--segundos', type=float, default=3, help="duración de la carga por endpoint")
+    parser.add_argument('--latencia-ms', type=float, default=0, help="latencia simulada del SheetDB local")
+    parser.add_argument('--repeticiones-snapshot', type=int, default=3)
+    parser.add_argument('--puerto', type=int, default=5201)
+    parser.add_argument('--salida', help="ruta del JSON de resultados (por defecto benchmarks/resultados/)")
+    parser.add_argument('--comparar', nargs=2, metavar=('BASE', 'NUEVA'), help="comparar dos JSON de resultados")
+    args = parser.parse_args()
+    if args.comparar:
+        comparar(*args.comparar)
+    else:
+        ejecutar(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Logging con niveles para toda la aplicación (reemplaza los print("[INFO] ...")).
+
+Cada módulo pide su logger con bitacora.obtener(__name__). El nivel se elige con LOG_NIVEL
+(DEBUG, INFO, WARNING, ERROR); los mensajes de un nivel desactivado no se llegan a
+formatear, por eso en las rutas calientes se usa log.debug("... %s", valor) y no
+f-strings. Los datos de un evento se pasan con extra=campos(clave=valor) y salen como
+clave=valor al final de la línea, o como un objeto JSON por línea con LOG_FORMATO=json.
+"""
+import os
+import sys
+import json
+import logging
+
+LOG_NIVEL = os.environ.get("LOG_NIVEL", "INFO").upper()
+LOG_FORMATO = os.environ.get("LOG_FORMATO", "texto")
+# Logger raíz de la aplicación; no propaga al raíz de logging (gunicorn/werkzeug tienen el suyo)
+NOMBRE_RAIZ = "evaluacion"
+
+
+def campos(**valores):
+    """Datos estructurados de un evento: log.info("...", extra=campos(filas=10))."""
+    return {"campos": valores}
+
+
+def _valor_texto(valor):
+    texto = str(valor)
+    if not texto or any(c in texto for c in ' "='):
+        return json.dumps(texto, ensure_ascii=False)
+    return texto
+
+
+class _Formato(logging.Formatter):
+    def format(self, record):
+        datos = getattr(record, "campos", None) or {}
+        mensaje = record.getMessage()
+        if LOG_FORMATO == "json":
+            salida = {"ts": self.formatTime(record), "nivel": record.levelname, "logger": record.name, "mensaje": mensaje}
+            salida.update(datos)
+            if record.exc_info:
+                salida["excepcion"] = self.formatException(record.exc_info)
+            return json.dumps(salida, ensure_ascii=False, default=str)
+
+        linea = f"{self.formatTime(record)} [{record.levelname}] {record.name}: {mensaje}"
+        if datos:
+            linea += " " + " ".join(f"{clave}={_valor_texto(valor)}" for clave, valor in datos.items())
+        if record.exc_info:
+            linea += "\n" + self.formatException(record.exc_info)
+        return linea
+
+
+def _configurar():
+    raiz = logging.getLogger(NOMBRE_RAIZ)
+    if raiz.handlers:
+        return
+    salida = logging.StreamHandler(sys.stdout)
+    salida.setFormatter(_Formato())
+    raiz.addHandler(salida)
+    raiz.setLevel(LOG_NIVEL)
+    raiz.propagate = False
+
+
+def obtener(nombre):
+    """Logger hijo del raíz de la aplicación (p. ej. obtener(__name__) -> evaluacion.app)."""
+    return logging.getLogger(f"{NOMBRE_RAIZ}.{nombre}")
+
+
+_configurar()
@@ -0,0 +1,258 @@
+"""Índice de búsqueda por texto de los cursos del snapshot (ruta /api/buscar).
+
+Se arma junto con el snapshot de filtros sobre INSTRUCTOR, Asignatura, Carrera y
+NRC. Cada documento es una combinación NRC + instructor (sin los instructores
+genéricos que tampoco ofrece la cascada) y guarda la posición de su primera fila en
+el DataFrame; el registro completo lo arma app.py solo para los resultados.
+
+El texto se normaliza sin tildes ni mayúsculas y se parte en palabras. Una palabra
+de la consulta coincide con las del índice por igualdad, por prefijo (búsqueda
+binaria en el vocabulario ordenado, lo que permite buscar mientras se escribe) o,
+si no hay ninguna con ese prefijo, por trigramas en común (errores de tipeo como
+"gonzales" por "gonzalez"). Todas las palabras de la consulta tienen que coincidir;
+el puntaje suma, por palabra, el tipo de coincidencia por el peso del campo.
+"""
+import re
+import heapq
+import bisect
+import unicodedata
+from collections import Counter
+
+import pandas as pd
+
+# Columna -> peso en el puntaje (un NRC escrito completo es casi siempre lo que se busca)
+CAMPOS = (('NRC', 3.0), ('INSTRUCTOR', 2.0), ('Asignatura', 1.5), ('Carrera', 1.0))
+# Puntaje por tipo de coincidencia de una palabra
+PUNTAJE_EXACTO = 1.0
+PUNTAJE_PREFIJO = 0.8
+PUNTAJE_TRIGRAMA = 0.6
+# Similitud mínima (Jaccard de trigramas) para aceptar una palabra parecida
+SIMILITUD_MINIMA = 0.4
+# Palabras de la consulta que se consideran (el resto se ignora)
+MAXIMO_PALABRAS = 8
+# Palabras distintas de un documento, aproximadas (para estimar el costo de filtrar por ellas)
+PALABRAS_POR_DOCUMENTO = 8
+
+_NO_ALFANUMERICO = re.compile(r'[^0-9a-z]+')
+
+
+def normalizar(texto):
+    """Texto en minúsculas, sin tildes ni signos, con las palabras separadas por un espacio."""
+    texto = str(texto).casefold()
+    if not texto.isascii():
+        texto = unicodedata.normalize('NFKD', texto)
+        texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return _NO_ALFANUMERICO.sub(' ', texto).strip()
+
+
+def _trigramas(palabra):
+    relleno = f" {palabra} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+def _vacio(valor):
+    return valor is None or valor is pd.NA or (not isinstance(valor, str) and pd.isna(valor))
+
+
+def _orden(valor):
+    """Año o periodo negado para ordenar de más reciente a más antiguo (0 si está vacío)."""
+    try:
+        return -int(valor)
+    except (TypeError, ValueError):
+        return 0
+
+
+def construir_indice(df, excluir=(), base=None):
+    """Índice de búsqueda de las filas de `df`.
+
+    `excluir` son los valores de INSTRUCTOR que no se indexan. Con `base` (un índice
+    ya construido sobre las filas anteriores del mismo DataFrame) se parte de copias
+    y solo se recorren las filas de `df`, cuyas posiciones siguen a las de la base;
+    los diccionarios compartidos con la base se copian antes de modificarlos.
+    """
+    documentos = list(base["documentos"]) if base else []
+    claves = set(base["claves"]) if base else set()
+    palabras = dict(base["palabras"]) if base else {}
+    trigramas = dict(base["trigramas"]) if base else {}
+    inicio = base["filas"] if base else 0
+    filas = inicio + (0 if df is None else len(df))
+    if df is None or df.empty or any(c not in df.columns for c, _ in CAMPOS):
+        return {"documentos": documentos, "claves": claves, "palabras": palabras, "trigramas": trigramas,
+                "vocabulario": list(base["vocabulario"]) if base else [], "filas": filas}
+
+    columnas = [c for c, _ in CAMPOS] + [c for c in ('ANO', 'PERIODO') if c in df.columns]
+    datos = df[columnas]
+    # Solo la primera fila de cada NRC + instructor, con NRC y sin los instructores excluidos
+    mascara = (datos['NRC'].notna() & ~datos['INSTRUCTOR'].isin(list(excluir))
+               & ~datos.duplicated(['NRC', 'INSTRUCTOR'])).to_numpy()
+    posiciones = mascara.nonzero()[0] + inicio
+
+    propias = set()
+    trigramas_propios = set()
+    # Los mismos instructores, asignaturas y carreras se repiten en muchas filas
+    palabras_por_valor = {}
+    nombres = {}
+    for posicion, fila in zip(posiciones.tolist(), datos[mascara].itertuples(index=False, name=None)):
+        valores = dict(zip(columnas, fila))
+        instructor = valores['INSTRUCTOR']
+        clave = (str(valores['NRC']), None if _vacio(instructor) else str(instructor))
+        if clave in claves:
+            continue
+        claves.add(clave)
+
+        id_documento = len(documentos)
+        # Más recientes primero a igual puntaje, luego por nombre del instructor
+        nombre = nombres.get(clave[1])
+        if nombre is None:
+            nombre = '' if clave[1] is None else normalizar(clave[1])
+            nombres[clave[1]] = nombre
+
+        pesos_documento = {}
+        for campo, peso in CAMPOS:
+            valor = valores[campo]
+            if campo == 'NRC':
+                palabras_valor = (str(valor),)  # Numérico (Int32): no hace falta normalizarlo
+            else:
+                palabras_valor = palabras_por_valor.get(valor)
+                if palabras_valor is None:
+                    palabras_valor = () if _vacio(valor) else tuple(set(normalizar(valor).split()))
+                    palabras_por_valor[valor] = palabras_valor
+            for palabra in palabras_valor:
+                documentos_palabra = palabras.get(palabra)
+                if documentos_palabra is None:
+                    documentos_palabra = {}
+                    palabras[palabra] = documentos_palabra
+                    propias.add(palabra)
+                    for trigrama in _trigramas(palabra):
+                        conjunto = trigramas.get(trigrama)
+                        if conjunto is None:
+                            conjunto = set()
+                            trigramas[trigrama] = conjunto
+                            trigramas_propios.add(trigrama)
+                        elif trigrama not in trigramas_propios:
+                            conjunto = set(conjunto)
+                            trigramas[trigrama] = conjunto
+                            trigramas_propios.add(trigrama)
+                        conjunto.add(palabra)
+                elif palabra not in propias:
+                    documentos_palabra = dict(documentos_palabra)
+                    palabras[palabra] = documentos_palabra
+                    propias.add(palabra)
+                if documentos_palabra.get(id_documento, 0) < peso:
+                    documentos_palabra[id_documento] = peso
+                    pesos_documento[palabra] = peso
+        # (posición, -año, -periodo, instructor, ((palabra, peso), ...))
+        documentos.append((posicion, _orden(valores.get('ANO')), _orden(valores.get('PERIODO')), nombre,
+                           tuple(pesos_documento.items())))
+
+    return {"documentos": documentos, "claves": claves, "palabras": palabras, "trigramas": trigramas,
+            "vocabulario": sorted(palabras), "filas": filas}
+
+
+def _rango_prefijo(vocabulario, termino):
+    """Posiciones [inicio, fin) de las palabras del vocabulario que empiezan con `termino`."""
+    # "{" va justo después de "z": las palabras normalizadas son solo [0-9a-z]
+    return bisect.bisect_left(vocabulario, termino), bisect.bisect_left(vocabulario, termino + '{')
+
+
+def _por_trigramas(indice, termino):
+    """Palabras parecidas a `termino` (Jaccard de trigramas), con su puntaje."""
+    propios = _trigramas(termino)
+    compartidos = Counter()
+    for trigrama in propios:
+        compartidos.update(indice["trigramas"].get(trigrama, ()))
+    candidatas = []
+    for palabra, comunes in compartidos.items():
+        # comunes / len(propios) es la similitud más alta posible: evita calcular el resto
+        if comunes < SIMILITUD_MINIMA * len(propios):
+            continue
+        similitud = comunes / (len(propios) + len(_trigramas(palabra)) - comunes)
+        if similitud >= SIMILITUD_MINIMA:
+            candidatas.append((palabra, PUNTAJE_TRIGRAMA * similitud))
+    return candidatas
+
+
+def _puntajes(palabras, candidatas):
+    """Documento -> mejor puntaje entre las palabras candidatas de un término."""
+    puntajes = {}
+    for palabra, puntaje in candidatas:
+        for id_documento, peso in palabras[palabra].items():
+            if puntajes.get(id_documento, 0) < puntaje * peso:
+                puntajes[id_documento] = puntaje * peso
+    return puntajes
+
+
+def _filtrar_por_prefijo(documentos, totales, termino):
+    """Sumar a cada documento en carrera su mejor coincidencia con `termino` (y descartar el resto)."""
+    siguientes = {}
+    for id_documento, acumulado in totales.items():
+        mejor = 0
+        for palabra, peso in documentos[id_documento][4]:
+            if palabra.startswith(termino):
+                valor = (PUNTAJE_EXACTO if palabra == termino else PUNTAJE_PREFIJO) * peso
+                if valor > mejor:
+                    mejor = valor
+        if mejor:
+            siguientes[id_documento] = acumulado + mejor
+    return siguientes
+
+
+def buscar(indice, consulta, limite=10):
+    """Posiciones en el DataFrame de los mejores `limite` documentos y el total de coincidencias.
+
+    Devuelve ([(posición, puntaje)], total), de mayor a menor puntaje; a igual
+    puntaje, los cursos más recientes primero. Las palabras de una sola letra se
+    ignoran si la consulta tiene otras más largas (coinciden con casi todo).
+    """
+    terminos = list(dict.fromkeys(normalizar(consulta).split()))
+    if any(len(t) > 1 for t in terminos):
+        terminos = [t for t in terminos if len(t) > 1]
+    terminos = terminos[:MAXIMO_PALABRAS]
+    documentos = indice["documentos"]
+    if not terminos or not documentos:
+        return [], 0
+
+    palabras = indice["palabras"]
+    vocabulario = indice["vocabulario"]
+    # (apariciones, término, candidatas, si es por prefijo)
+    por_termino = []
+    for termino in terminos:
+        inicio, fin = _rango_prefijo(vocabulario, termino)
+        candidatas = [(p, PUNTAJE_EXACTO if p == termino else PUNTAJE_PREFIJO) for p in vocabulario[inicio:fin]]
+        por_prefijo = bool(candidatas)
+        if not candidatas and len(termino) >= 3:
+            candidatas = _por_trigramas(indice, termino)
+        if not candidatas:
+            return [], 0
+        por_termino.append((sum(len(palabras[p]) for p, _ in candidatas), termino, candidatas, por_prefijo))
+
+    # Se parte del término con menos apariciones; para cada uno de los siguientes se
+    # elige lo más barato entre recorrer todas sus apariciones, buscar cada documento
+    # que sigue en carrera en las palabras candidatas o, si es un prefijo, mirar las
+    # palabras propias de cada documento (un prefijo corto puede abarcar miles de palabras)
+    por_termino.sort(key=lambda t: t[0])
+    totales = _puntajes(palabras, por_termino[0][2])
+    for apariciones, termino, candidatas, por_prefijo in por_termino[1:]:
+        costo_consulta = len(totales) * len(candidatas)
+        costo_documento = len(totales) * PALABRAS_POR_DOCUMENTO if por_prefijo else float('inf')
+        if costo_documento <= min(apariciones, costo_consulta):
+            totales = _filtrar_por_prefijo(documentos, totales, termino)
+        elif costo_consulta <= apariciones:
+            siguientes = {}
+            for id_documento, acumulado in totales.items():
+                mejor = 0
+                for palabra, puntaje in candidatas:
+                    peso = palabras[palabra].get(id_documento)
+                    if peso is not None and puntaje * peso > mejor:
+                        mejor = puntaje * peso
+                if mejor:
+                    siguientes[id_documento] = acumulado + mejor
+            totales = siguientes
+        else:
+            totales = {id_documento: totales[id_documento] + puntaje
+                       for id_documento, puntaje in _puntajes(palabras, candidatas).items() if id_documento in totales}
+        if not totales:
+            return [], 0
+
+    mejores = heapq.nsmallest(limite, totales.items(), key=lambda par: (-par[1],) + documentos[par[0]][1:4])
+    return [(documentos[id_documento][0], round(puntaje, 3)) for id_documento, puntaje in mejores], len(totales)
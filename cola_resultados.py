@@ -0,0 +1,275 @@
+"""Cola local (write-behind) para los resultados de evaluación que van a SheetDB.
+
+Los formularios TP y P guardan su registro aplanado en una base SQLite local y
+responden de inmediato; un hilo en segundo plano envía los registros pendientes a
+la hoja correspondiente en lotes (SheetDB acepta un arreglo en "data"), con
+reintentos y espera exponencial cuando SheetDB falla o limita las peticiones. El
+POST lo hace la función que recibe iniciar_worker (ver almacenamiento.py).
+
+El worker mantiene hasta COLA_ENVIOS_CONCURRENTES lotes en vuelo a la vez: cada POST
+pasa cientos de milisegundos esperando a SheetDB, así que enviarlos de a uno limita
+el caudal a un lote por latencia. Cada lote se reclama de forma atómica en SQLite,
+por lo que dos envíos nunca toman las mismas filas; el orden de llegada a la hoja
+entre lotes distintos puede variar.
+"""
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import bitacora
+import base_local
+
+log = bitacora.obtener(__name__)
+
+COLA_DB_PATH = os.environ.get("COLA_RESULTADOS_DB", os.path.join(base_local.CARPETA_PROCESADOS, 'cola_resultados.sqlite3'))
+
+# Máximo de registros por POST a SheetDB
+COLA_LOTE_MAXIMO = int(os.environ.get("COLA_LOTE_MAXIMO", 50))
+# Espera entre pasadas cuando no hay nada que enviar (segundos)
+COLA_INTERVALO_SEGUNDOS = float(os.environ.get("COLA_INTERVALO_SEGUNDOS", 5))
+# Lotes enviados a SheetDB en paralelo por proceso (no más que el pool de sheetdb_client)
+COLA_ENVIOS_CONCURRENTES = max(1, int(os.environ.get("COLA_ENVIOS_CONCURRENTES", 4)))
+# Reintentos: espera = base * 2^intentos, con tope; tras el máximo queda como "fallido"
+COLA_BACKOFF_BASE_SEGUNDOS = 2
+COLA_BACKOFF_MAXIMO_SEGUNDOS = 300
+COLA_MAX_INTENTOS = int(os.environ.get("COLA_MAX_INTENTOS", 8))
+# Un lote "enviando" más antiguo que esto se considera abandonado (p. ej. el proceso murió)
+COLA_RECLAMO_EXPIRA_SEGUNDOS = 120
+
+_hilo_worker = None
+_lock_worker = threading.Lock()
+_evento_worker = threading.Event()
+
+
+def _crear_esquema(conexion):
+    conexion.execute("""
+        CREATE TABLE IF NOT EXISTS resultados_pendientes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hoja TEXT NOT NULL,
+            registro TEXT NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'pendiente',
+            intentos INTEGER NOT NULL DEFAULT 0,
+            proximo_intento REAL NOT NULL DEFAULT 0,
+            reclamado_en REAL,
+            ultimo_error TEXT,
+            creado_en REAL NOT NULL
+        )
+    """)
+    conexion.execute(
+        "CREATE INDEX IF NOT EXISTS idx_resultados_estado ON resultados_pendientes (estado, hoja, proximo_intento)"
+    )
+
+
+def _conectar():
+    return base_local.conectar(COLA_DB_PATH, _crear_esquema)
+
+
+def encolar(hoja, registro):
+    """Guardar un registro aplanado para la hoja indicada ("TP" o "P"). Devuelve su id en la cola."""
+    conexion = _conectar()
+    try:
+        with conexion:
+            cursor = conexion.execute(
+                "INSERT INTO resultados_pendientes (hoja, registro, creado_en) VALUES (?, ?, ?)",
+                (hoja, json.dumps(registro, ensure_ascii=False), time.time())
+            )
+        _evento_worker.set()
+        return cursor.lastrowid
+    finally:
+        conexion.close()
+
+
+def encolar_lote(hoja, registros):
+    """Guardar varios registros aplanados de una misma hoja en una sola transacción. Devuelve cuántos."""
+    ahora = time.time()
+    conexion = _conectar()
+    try:
+        with conexion:
+            conexion.executemany(
+                "INSERT INTO resultados_pendientes (hoja, registro, creado_en) VALUES (?, ?, ?)",
+                [(hoja, json.dumps(registro, ensure_ascii=False), ahora) for registro in registros]
+            )
+        _evento_worker.set()
+        return len(registros)
+    finally:
+        conexion.close()
+
+
+def _reclamar_lote():
+    """Marcar como "enviando" el siguiente lote listo de una misma hoja y devolverlo.
+
+    Volver a tomar un registro cuyo envío anterior venció (el proceso murió o el POST
+    se colgó) cuenta como un intento: si no, un lote que siempre falla así nunca
+    llegaría a "fallido".
+    """
+    ahora = time.time()
+    conexion = _conectar()
+    try:
+        conexion.execute("BEGIN IMMEDIATE")
+        fila = conexion.execute(
+            """SELECT hoja FROM resultados_pendientes
+               WHERE (estado = 'pendiente' AND proximo_intento <= ?)
+                  OR (estado = 'enviando' AND reclamado_en < ?)
+               ORDER BY id LIMIT 1""",
+            (ahora, ahora - COLA_RECLAMO_EXPIRA_SEGUNDOS)
+        ).fetchone()
+        if fila is None:
+            conexion.rollback()
+            return None, []
+        hoja = fila[0]
+        candidatas = conexion.execute(
+            """SELECT id, registro, intentos, estado FROM resultados_pendientes
+               WHERE hoja = ? AND ((estado = 'pendiente' AND proximo_intento <= ?)
+                                   OR (estado = 'enviando' AND reclamado_en < ?))
+               ORDER BY id LIMIT ?""",
+            (hoja, ahora, ahora - COLA_RECLAMO_EXPIRA_SEGUNDOS, COLA_LOTE_MAXIMO)
+        ).fetchall()
+        filas = []
+        agotadas = []
+        for id_fila, registro, intentos, estado in candidatas:
+            if estado == 'enviando':
+                intentos += 1
+                if intentos >= COLA_MAX_INTENTOS:
+                    agotadas.append((intentos, id_fila))
+                    continue
+            filas.append((id_fila, registro, intentos))
+        conexion.executemany(
+            "UPDATE resultados_pendientes SET estado = 'enviando', intentos = ?, reclamado_en = ? WHERE id = ?",
+            [(intentos, ahora, id_fila) for id_fila, _, intentos in filas]
+        )
+        if agotadas:
+            conexion.executemany(
+                """UPDATE resultados_pendientes
+                   SET estado = 'fallido', intentos = ?, reclamado_en = NULL,
+                       ultimo_error = 'el envío no terminó antes de vencer el reclamo'
+                   WHERE id = ?""",
+                agotadas
+            )
+            log.error("Registros de la cola sin respuesta tras varios reclamos; quedan como fallidos",
+                      extra=bitacora.campos(hoja=hoja, registros=len(agotadas)))
+        conexion.commit()
+        return hoja, filas
+    finally:
+        conexion.close()
+
+
+def procesar_lote(enviar):
+    """Enviar un lote pendiente a SheetDB. Devuelve cuántos registros se procesaron.
+
+    `enviar(hoja, registros)` hace el POST y devuelve None si se guardó o el mensaje
+    de error (almacenamiento.AlmacenSheetDB.enviar_resultados).
+    """
+    hoja, filas = _reclamar_lote()
+    if not filas:
+        return 0
+    return _enviar_reclamado(enviar, hoja, filas)
+
+
+def _enviar_reclamado(enviar, hoja, filas):
+    """Enviar un lote ya reclamado y borrarlo o reprogramarlo según el resultado."""
+    error = enviar(hoja, [json.loads(f[1]) for f in filas])
+    conexion = _conectar()
+    try:
+        with conexion:
+            if error is None:
+                conexion.executemany("DELETE FROM resultados_pendientes WHERE id = ?", [(f[0],) for f in filas])
+                log.info("Lote enviado a SheetDB", extra=bitacora.campos(hoja=hoja, registros=len(filas)))
+            else:
+                log.error("Fallo al enviar un lote a SheetDB: %s", error, extra=bitacora.campos(hoja=hoja, registros=len(filas)))
+                ahora = time.time()
+                actualizaciones = []
+                for id_fila, _, intentos in filas:
+                    intentos += 1
+                    estado = 'fallido' if intentos >= COLA_MAX_INTENTOS else 'pendiente'
+                    espera = min(COLA_BACKOFF_BASE_SEGUNDOS * 2 ** intentos, COLA_BACKOFF_MAXIMO_SEGUNDOS)
+                    actualizaciones.append((estado, intentos, ahora + espera, error, id_fila))
+                conexion.executemany(
+                    """UPDATE resultados_pendientes
+                       SET estado = ?, intentos = ?, proximo_intento = ?, ultimo_error = ?, reclamado_en = NULL
+                       WHERE id = ?""",
+                    actualizaciones
+                )
+    finally:
+        conexion.close()
+    return len(filas) if error is None else 0
+
+
+def _bucle_worker(enviar):
+    """Reclamar lotes listos hasta llenar los envíos en vuelo; sin nada que enviar, esperar."""
+    en_vuelo = set()
+    with ThreadPoolExecutor(max_workers=COLA_ENVIOS_CONCURRENTES, thread_name_prefix="cola-envio") as ejecutor:
+        while True:
+            try:
+                while len(en_vuelo) < COLA_ENVIOS_CONCURRENTES:
+                    hoja, filas = _reclamar_lote()
+                    if not filas:
+                        break
+                    en_vuelo.add(ejecutor.submit(_enviar_reclamado, enviar, hoja, filas))
+            except Exception:
+                log.exception("Error en el worker de la cola de resultados")
+
+            if en_vuelo:
+                # Al terminar un envío se vuelve a reclamar: puede haber más lotes listos
+                listos, en_vuelo = wait(en_vuelo, timeout=COLA_INTERVALO_SEGUNDOS, return_when=FIRST_COMPLETED)
+                for futuro in listos:
+                    if futuro.exception() is not None:
+                        log.error("Error al enviar un lote de la cola de resultados: %s", futuro.exception())
+                continue
+            _evento_worker.wait(COLA_INTERVALO_SEGUNDOS)
+            _evento_worker.clear()
+
+
+def iniciar_worker(enviar):
+    """Arrancar (una sola vez por proceso) el hilo que envía la cola a SheetDB."""
+    global _hilo_worker
+    if _hilo_worker is not None and _hilo_worker.is_alive():
+        return
+    with _lock_worker:
+        if _hilo_worker is None or not _hilo_worker.is_alive():
+            _hilo_worker = threading.Thread(target=_bucle_worker, args=(enviar,), name="cola-resultados", daemon=True)
+            _hilo_worker.start()
+
+
+def reintentar_fallidos():
+    """Devolver a "pendiente" los registros que agotaron sus reintentos. Devuelve cuántos."""
+    conexion = _conectar()
+    try:
+        with conexion:
+            cursor = conexion.execute(
+                "UPDATE resultados_pendientes SET estado = 'pendiente', intentos = 0, proximo_intento = 0 WHERE estado = 'fallido'"
+            )
+        _evento_worker.set()
+        return cursor.rowcount
+    finally:
+        conexion.close()
+
+
+def estado_cola():
+    """Resumen de la cola: pendientes (incluye los que se están enviando) y fallidos, por hoja."""
+    conexion = _conectar()
+    try:
+        filas = conexion.execute(
+            "SELECT hoja, estado, COUNT(*), MIN(creado_en) FROM resultados_pendientes GROUP BY hoja, estado"
+        ).fetchall()
+        ultimo_error = conexion.execute(
+            "SELECT ultimo_error FROM resultados_pendientes WHERE ultimo_error IS NOT NULL ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+    finally:
+        conexion.close()
+
+    resumen = {"pendientes": 0, "fallidos": 0, "por_hoja": {}, "mas_antiguo_segundos": None, "ultimo_error": None}
+    mas_antiguo = None
+    for hoja, estado, cantidad, creado_en in filas:
+        clave = 'fallidos' if estado == 'fallido' else 'pendientes'
+        resumen[clave] += cantidad
+        por_hoja = resumen["por_hoja"].setdefault(hoja, {"pendientes": 0, "fallidos": 0})
+        por_hoja[clave] += cantidad
+        if clave == 'pendientes' and (mas_antiguo is None or creado_en < mas_antiguo):
+            mas_antiguo = creado_en
+    if mas_antiguo is not None:
+        resumen["mas_antiguo_segundos"] = round(time.time() - mas_antiguo, 1)
+    if ultimo_error:
+        resumen["ultimo_error"] = ultimo_error[0]
+    return resumen
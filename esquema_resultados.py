@@ -0,0 +1,127 @@
+"""Esquema de las filas de evaluación TP y P que se guardan en SheetDB.
+
+El orden de columnas de cada formulario se arma una sola vez al importar: campos
+base (filtros, totales y fechas) seguidos de A{n}_* por cada pregunta de aula y
+C{n}_* por cada pregunta de carpeta, con la cantidad de preguntas que muestran
+formulario_tp.html (12 de aula, 8 de carpeta) y formulario_p.html (5 criterios,
+8 de carpeta). Aplanar un payload es una sola pasada sobre ese plan que valida los
+tipos y llena una fila de largo fijo; un payload mal formado se rechaza con
+ErrorPayload antes de encolarlo.
+"""
+
+# Columna de la hoja -> clave del payload que envía el formulario
+CAMPOS_BASE = (
+    ("ANO", "ANO"),
+    ("PERIODO", "PERIODO"),
+    ("SEDE_CURSO", "SEDE_CURSO"),
+    ("Carrera", "Carrera"),
+    ("Seccion", "Seccion"),
+    ("Asignatura", "Asignatura"),
+    ("INSTRUCTOR", "INSTRUCTOR"),
+    ("NRC", "NRC"),
+    ("Aula_Porcentaje", "Eval_Aula"),
+    ("Aula_Resultado", "Resultado_Aula"),
+    ("Carpeta_Porcentaje", "Eval_Carpeta"),
+    ("Carpeta_Resultado", "Resultado_Carpeta"),
+    ("fechaRegistro", "fechaRegistro"),
+    ("fechaEvaluacion", "fechaEvaluacion"),
+)
+
+# Por formulario: (clave del payload, prefijo de columna, cantidad de preguntas, campos).
+# Cada campo es (sufijo de columna, clave en la respuesta, si se recorta como texto);
+# el puntaje se guarda tal cual llega (número o texto), como antes.
+SECCIONES = {
+    "TP": (
+        ("respuestasAula", "A", 12, (("Valoracion", "valoracion", True), ("Puntaje", "puntaje", False),
+                                     ("Observaciones", "observaciones", True), ("Recomendaciones", "recomendaciones", True))),
+        ("respuestasCarpeta", "C", 8, (("Valoracion", "valoracion", True), ("Observaciones", "observaciones", True),
+                                       ("Recomendaciones", "recomendaciones", True))),
+    ),
+    "P": (
+        ("respuestasAula", "A", 5, (("Puntaje", "puntaje", False), ("Observaciones", "observaciones", True),
+                                    ("Recomendaciones", "recomendaciones", True))),
+        ("respuestasCarpeta", "C", 8, (("Valoracion", "valoracion", True), ("Observaciones", "observaciones", True),
+                                       ("Recomendaciones", "recomendaciones", True))),
+    ),
+}
+
+_ESCALARES = (str, int, float, type(None))
+
+
+class ErrorPayload(ValueError):
+    """Payload de evaluación mal formado; el mensaje se devuelve al formulario."""
+
+
+def _compilar(hoja):
+    """Orden de columnas y plan de aplanado de un formulario."""
+    columnas = [columna for columna, _ in CAMPOS_BASE]
+    plan = []
+    for clave, prefijo, preguntas, campos in SECCIONES[hoja]:
+        plan.append((clave, preguntas, tuple((clave_item, recortar) for _, clave_item, recortar in campos)))
+        for idx in range(1, preguntas + 1):
+            columnas.extend(f"{prefijo}{idx}_{sufijo}" for sufijo, _, _ in campos)
+    return {"columnas": tuple(columnas), "base": tuple(clave for _, clave in CAMPOS_BASE), "secciones": tuple(plan)}
+
+
+ESQUEMAS = {hoja: _compilar(hoja) for hoja in SECCIONES}
+
+
+def columnas(hoja):
+    """Columnas de la hoja ("TP" o "P") en el orden en que se llenan las filas."""
+    return ESQUEMAS[hoja]["columnas"]
+
+
+def aplanar(hoja, payload):
+    """Valida y aplana el payload de un formulario en una fila (lista) de largo fijo.
+
+    Las preguntas que no vienen quedan vacías; más respuestas que preguntas, valores
+    que no son texto/número o respuestas que no son objetos lanzan ErrorPayload.
+    """
+    if not isinstance(payload, dict):
+        raise ErrorPayload("El cuerpo debe ser un objeto JSON")
+    esquema = ESQUEMAS[hoja]
+
+    fila = []
+    for clave in esquema["base"]:
+        valor = payload.get(clave, "")
+        if not isinstance(valor, _ESCALARES):
+            raise ErrorPayload(f"{clave} debe ser texto o número")
+        fila.append(valor)
+
+    for clave, preguntas, campos in esquema["secciones"]:
+        respuestas = payload.get(clave) or []
+        if not isinstance(respuestas, list):
+            raise ErrorPayload(f"{clave} debe ser una lista")
+        if len(respuestas) > preguntas:
+            raise ErrorPayload(f"{clave} tiene {len(respuestas)} respuestas; el formulario {hoja} tiene {preguntas}")
+        for idx, item in enumerate(respuestas, start=1):
+            if not isinstance(item, dict):
+                raise ErrorPayload(f"{clave}[{idx}] debe ser un objeto")
+            for clave_item, recortar in campos:
+                valor = item.get(clave_item)
+                if not isinstance(valor, _ESCALARES):
+                    raise ErrorPayload(f"{clave}[{idx}].{clave_item} debe ser texto o número")
+                if recortar:
+                    fila.append(str(valor).strip() if valor else "")
+                else:
+                    fila.append(valor or "")
+        fila.extend([""] * ((preguntas - len(respuestas)) * len(campos)))
+    return fila
+
+
+def aplanar_lote(hoja, payloads):
+    """Aplana varios payloads; si alguno está mal formado no se devuelve ninguno."""
+    if not isinstance(payloads, list):
+        raise ErrorPayload("El lote debe ser una lista de evaluaciones")
+    filas = []
+    for posicion, payload in enumerate(payloads):
+        try:
+            filas.append(aplanar(hoja, payload))
+        except ErrorPayload as e:
+            raise ErrorPayload(f"Evaluación {posicion + 1}: {e}")
+    return filas
+
+
+def a_registro(hoja, fila):
+    """Fila aplanada -> dict columna: valor, que es lo que recibe SheetDB."""
+    return dict(zip(ESQUEMAS[hoja]["columnas"], fila))
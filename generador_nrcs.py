@@ -0,0 +1,324 @@
+"""Generación de NRCs para la planificación académica (ruta /procesar_nrcs).
+
+El libro subido se lee fila por fila en modo read-only de openpyxl (sin cargarlo
+entero con pandas) y se escribe en modo write-only, así la memoria no crece con el
+tamaño del archivo. Cada combinación ANO/PERIODO/Codigo_Carrera/Codigo_Curso/Seccion
+recibe un NRC estable: se busca en la memoria de NRCs (procesados/nrc_memoria.xlsx,
+cargada en un diccionario) y si no existe se asigna el siguiente número libre.
+
+El procesamiento corre como trabajo en segundo plano; la petición solo sube el
+archivo y devuelve el id del trabajo, cuyo progreso se consulta aparte. El estado
+de los trabajos se guarda en una base SQLite en procesados/ y no en memoria: con
+varios workers de gunicorn la consulta de progreso o la descarga puede llegar a un
+proceso distinto del que recibió el archivo. Los archivos de entrada y salida se
+nombran por el id del trabajo, nunca por el nombre del archivo subido.
+"""
+import os
+import uuid
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from openpyxl import Workbook, load_workbook
+
+import bitacora
+import base_local
+
+try:
+    import fcntl  # Evita que dos procesos reescriban la memoria de NRCs a la vez (solo Unix)
+except ImportError:
+    fcntl = None
+
+log = bitacora.obtener(__name__)
+
+NRC_MEMORIA_PATH = os.environ.get("NRC_MEMORIA_PATH", os.path.join(base_local.CARPETA_PROCESADOS, 'nrc_memoria.xlsx'))
+
+# Columnas que identifican un curso-sección; cada combinación distinta lleva un NRC
+COLUMNAS_CLAVE_NRC = ['ANO', 'PERIODO', 'Codigo_Carrera', 'Codigo_Curso', 'Seccion']
+COLUMNAS_NUMERICAS = {'ANO', 'PERIODO', 'Seccion'}
+NRC_INICIAL = 1000
+TRABAJOS_DB_PATH = os.environ.get("TRABAJOS_NRCS_DB", os.path.join(base_local.CARPETA_PROCESADOS, 'trabajos_nrcs.sqlite3'))
+# Cada cuántas filas se actualiza el progreso del trabajo
+INTERVALO_PROGRESO = 500
+# Los trabajos (y su archivo generado) se borran pasado este tiempo desde que terminaron;
+# uno que no terminó en ese tiempo quedó huérfano (p. ej. se reinició el worker)
+TRABAJOS_RETENCION_SEGUNDOS = int(os.environ.get("TRABAJOS_NRCS_RETENCION_SEGUNDOS", 24 * 3600))
+
+# Un trabajo a la vez por proceso: todos comparten la memoria de NRCs
+_ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="generador-nrcs")
+# Columnas de trabajos_nrcs que se entregan en el estado
+_CAMPOS_ESTADO = ('id', 'estado', 'archivo', 'filas_procesadas', 'filas_totales', 'filas', 'nrcs_nuevos', 'nrcs_usados', 'error')
+
+
+def _crear_esquema(conexion):
+    conexion.execute("""
+        CREATE TABLE IF NOT EXISTS trabajos_nrcs (
+            id TEXT PRIMARY KEY,
+            estado TEXT NOT NULL,
+            archivo TEXT NOT NULL,
+            filas_procesadas INTEGER NOT NULL DEFAULT 0,
+            filas_totales INTEGER,
+            filas INTEGER,
+            nrcs_nuevos INTEGER,
+            nrcs_usados INTEGER,
+            error TEXT,
+            creado_en REAL NOT NULL,
+            inicio REAL,
+            fin REAL
+        )
+    """)
+
+
+def _conectar():
+    return base_local.conectar(TRABAJOS_DB_PATH, _crear_esquema)
+
+
+def _a_entero(valor):
+    try:
+        return int(float(valor))
+    except (TypeError, ValueError):
+        return None
+
+
+def _normalizar_clave(columna, valor):
+    if valor is None:
+        return None
+    if columna in COLUMNAS_NUMERICAS:
+        return _a_entero(valor)
+    valor = str(valor).strip()
+    return valor or None
+
+
+def cargar_memoria_nrc(ruta=NRC_MEMORIA_PATH):
+    """Lee la memoria de NRCs en un diccionario clave -> NRC. Devuelve (memoria, siguiente_nrc)."""
+    memoria = {}
+    siguiente = NRC_INICIAL
+    if not os.path.exists(ruta):
+        return memoria, siguiente
+
+    libro = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        encabezado = [str(c).strip() if c is not None else '' for c in next(filas, [])]
+        posiciones = [encabezado.index(c) for c in COLUMNAS_CLAVE_NRC]
+        posicion_nrc = encabezado.index('NRC')
+        for fila in filas:
+            clave = tuple(_normalizar_clave(c, fila[p]) for c, p in zip(COLUMNAS_CLAVE_NRC, posiciones))
+            nrc = _a_entero(fila[posicion_nrc])
+            if nrc is None or None in clave:
+                continue
+            memoria[clave] = nrc
+            siguiente = max(siguiente, nrc + 1)
+    finally:
+        libro.close()
+    return memoria, siguiente
+
+
+def guardar_memoria_nrc(memoria, ruta=NRC_MEMORIA_PATH):
+    """Reescribe la memoria de NRCs (ordenada por NRC) de forma atómica."""
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet('Sheet1')
+    hoja.append(COLUMNAS_CLAVE_NRC + ['NRC'])
+    for clave, nrc in sorted(memoria.items(), key=lambda item: item[1]):
+        hoja.append(list(clave) + [nrc])
+    temporal = f"{ruta}.tmp"
+    libro.save(temporal)
+    os.replace(temporal, ruta)
+
+
+def _actualizar(id_trabajo, **cambios):
+    asignaciones = ", ".join(f"{columna} = ?" for columna in cambios)
+    conexion = _conectar()
+    try:
+        with conexion:
+            conexion.execute(f"UPDATE trabajos_nrcs SET {asignaciones} WHERE id = ?", list(cambios.values()) + [id_trabajo])
+    finally:
+        conexion.close()
+
+
+def ruta_entrada(id_trabajo):
+    """Dónde se guarda el archivo subido para un trabajo."""
+    return os.path.join(base_local.CARPETA_UPLOADS, f"nrcs_{id_trabajo}.xlsx")
+
+
+def ruta_salida(id_trabajo):
+    """Dónde escribe un trabajo su libro procesado."""
+    return os.path.join(base_local.CARPETA_PROCESADOS, f"nrcs_{id_trabajo}_proc.xlsx")
+
+
+def generar_nrcs(ruta_entrada, ruta_salida, id_trabajo=None):
+    """Procesa el libro de planificación y escribe el libro de salida con INSTRUCTOR y NRC.
+
+    Devuelve un resumen {filas, nrcs_nuevos, nrcs_usados}.
+    """
+    archivo_lock = None
+    if fcntl is not None:
+        archivo_lock = open(f"{NRC_MEMORIA_PATH}.lock", 'a')
+        fcntl.flock(archivo_lock, fcntl.LOCK_EX)
+    try:
+        memoria, siguiente = cargar_memoria_nrc()
+        nuevos = 0
+        usados = set()
+
+        entrada = load_workbook(ruta_entrada, read_only=True, data_only=True)
+        salida = Workbook(write_only=True)
+        hoja_salida = salida.create_sheet('Sheet1')
+        try:
+            hoja_entrada = entrada.active
+            if id_trabajo is not None and hoja_entrada.max_row:
+                _actualizar(id_trabajo, filas_totales=hoja_entrada.max_row - 1)
+
+            filas = hoja_entrada.iter_rows(values_only=True)
+            encabezado = [str(c).strip() if c is not None else '' for c in next(filas, [])]
+            faltantes = [c for c in COLUMNAS_CLAVE_NRC if c not in encabezado]
+            if faltantes:
+                raise ValueError(f"Faltan columnas en el archivo: {', '.join(faltantes)}")
+
+            posiciones = [encabezado.index(c) for c in COLUMNAS_CLAVE_NRC]
+            posicion_nombre = encabezado.index('Nombre_Docente') if 'Nombre_Docente' in encabezado else None
+            posicion_apellido = encabezado.index('Apellido_Docente') if 'Apellido_Docente' in encabezado else None
+
+            # Si el archivo ya trae INSTRUCTOR/NRC se reemplazan en su lugar
+            encabezado_salida = list(encabezado)
+            for columna in ('INSTRUCTOR', 'NRC'):
+                if columna not in encabezado_salida:
+                    encabezado_salida.append(columna)
+            posicion_instructor = encabezado_salida.index('INSTRUCTOR')
+            posicion_nrc = encabezado_salida.index('NRC')
+            hoja_salida.append(encabezado_salida)
+
+            procesadas = 0
+            for fila in filas:
+                if not any(v is not None for v in fila):
+                    continue
+                fila_salida = list(fila) + [None] * (len(encabezado_salida) - len(fila))
+
+                clave = tuple(_normalizar_clave(c, fila[p]) for c, p in zip(COLUMNAS_CLAVE_NRC, posiciones))
+                if None not in clave:
+                    nrc = memoria.get(clave)
+                    if nrc is None:
+                        nrc = siguiente
+                        siguiente += 1
+                        memoria[clave] = nrc
+                        nuevos += 1
+                    usados.add(nrc)
+                    fila_salida[posicion_nrc] = nrc
+
+                if posicion_apellido is not None and posicion_nombre is not None:
+                    partes = [fila[posicion_apellido], fila[posicion_nombre]]
+                    fila_salida[posicion_instructor] = ' '.join(str(p).strip() for p in partes if p is not None) or None
+
+                hoja_salida.append(fila_salida)
+                procesadas += 1
+                if id_trabajo is not None and procesadas % INTERVALO_PROGRESO == 0:
+                    _actualizar(id_trabajo, filas_procesadas=procesadas)
+        finally:
+            entrada.close()
+
+        temporal = f"{ruta_salida}.tmp"
+        salida.save(temporal)
+        os.replace(temporal, ruta_salida)
+        if nuevos:
+            guardar_memoria_nrc(memoria)
+        return {"filas": procesadas, "nrcs_nuevos": nuevos, "nrcs_usados": len(usados)}
+    finally:
+        if archivo_lock is not None:
+            archivo_lock.close()
+
+
+def _borrar_archivo(ruta):
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
+
+
+def _ejecutar_trabajo(id_trabajo):
+    _actualizar(id_trabajo, estado="procesando", inicio=time.time())
+    try:
+        resumen = generar_nrcs(ruta_entrada(id_trabajo), ruta_salida(id_trabajo), id_trabajo)
+        _actualizar(id_trabajo, estado="terminado", fin=time.time(), filas_procesadas=resumen["filas"], **resumen)
+        log.info("Trabajo de NRCs terminado", extra=bitacora.campos(id=id_trabajo, **resumen))
+    except Exception as e:
+        log.error("Trabajo de NRCs fallido: %s", e, extra=bitacora.campos(id=id_trabajo))
+        _actualizar(id_trabajo, estado="error", fin=time.time(), error=str(e))
+    finally:
+        _borrar_archivo(ruta_entrada(id_trabajo))
+
+
+def nuevo_id():
+    """Id para un trabajo nuevo; el archivo subido se guarda en ruta_entrada(id) antes de encolarlo."""
+    return uuid.uuid4().hex[:12]
+
+
+def purgar_trabajos():
+    """Borrar los trabajos vencidos y sus archivos generados. Devuelve cuántos se borraron."""
+    limite = time.time() - TRABAJOS_RETENCION_SEGUNDOS
+    conexion = _conectar()
+    try:
+        with conexion:
+            vencidos = [fila[0] for fila in conexion.execute(
+                "SELECT id FROM trabajos_nrcs WHERE COALESCE(fin, creado_en) < ?", (limite,)
+            )]
+            conexion.executemany("DELETE FROM trabajos_nrcs WHERE id = ?", [(v,) for v in vencidos])
+    finally:
+        conexion.close()
+    for id_trabajo in vencidos:
+        _borrar_archivo(ruta_entrada(id_trabajo))
+        _borrar_archivo(ruta_salida(id_trabajo))
+    return len(vencidos)
+
+
+def encolar_trabajo(id_trabajo, nombre_original):
+    """Registrar y lanzar en segundo plano el trabajo cuyo archivo ya está en ruta_entrada(id_trabajo)."""
+    try:
+        purgados = purgar_trabajos()
+        if purgados:
+            log.info("Trabajos de NRCs vencidos borrados", extra=bitacora.campos(trabajos=purgados))
+    except Exception:
+        log.exception("No se pudieron borrar los trabajos de NRCs vencidos")
+
+    conexion = _conectar()
+    try:
+        with conexion:
+            conexion.execute(
+                "INSERT INTO trabajos_nrcs (id, estado, archivo, creado_en) VALUES (?, 'en_cola', ?, ?)",
+                (id_trabajo, os.path.basename(nombre_original), time.time())
+            )
+    finally:
+        conexion.close()
+    _ejecutor.submit(_ejecutar_trabajo, id_trabajo)
+    return id_trabajo
+
+
+def _leer_trabajo(id_trabajo):
+    conexion = _conectar()
+    try:
+        fila = conexion.execute(
+            f"SELECT {', '.join(_CAMPOS_ESTADO)} FROM trabajos_nrcs WHERE id = ?", (id_trabajo,)
+        ).fetchone()
+    finally:
+        conexion.close()
+    return None if fila is None else dict(zip(_CAMPOS_ESTADO, fila))
+
+
+def estado_trabajo(id_trabajo):
+    """Estado de un trabajo (None si no existe), con el porcentaje de avance."""
+    trabajo = _leer_trabajo(id_trabajo)
+    if trabajo is None:
+        return None
+    if trabajo["estado"] == "terminado":
+        trabajo["porcentaje"] = 100
+    elif trabajo.get("filas_totales"):
+        trabajo["porcentaje"] = min(99, int(100 * trabajo["filas_procesadas"] / trabajo["filas_totales"]))
+    else:
+        trabajo["porcentaje"] = 0
+    return trabajo
+
+
+def archivo_salida_trabajo(id_trabajo):
+    """(ruta, nombre de descarga) del archivo generado si el trabajo terminó bien, si no None."""
+    trabajo = _leer_trabajo(id_trabajo)
+    if trabajo is None or trabajo["estado"] != "terminado":
+        return None
+    base = os.path.splitext(trabajo["archivo"])[0] or 'planificacion'
+    return ruta_salida(id_trabajo), f"{base}_proc.xlsx"
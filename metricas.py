@@ -0,0 +1,125 @@
+"""Métricas de la aplicación en formato de exposición de Prometheus (ruta /metrics).
+
+Lleva en memoria el histograma de latencia por ruta y los tiempos de carga del
+snapshot de filtros; el resto (latencias de SheetDB, caché de respuestas, cola de
+resultados) ya lo cuenta cada módulo y app.py lo entrega al armar la respuesta.
+
+Las métricas son por proceso: con varios workers de gunicorn cada scrape ve las del
+worker que atendió la petición (la etiqueta pid permite distinguirlos).
+"""
+import os
+import time
+import threading
+
+# Límites superiores (segundos) del histograma de latencia de las rutas: la cascada
+# responde en menos de un milisegundo, los guardados y procesamientos en segundos
+BUCKETS_RUTAS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PREFIJO = "evaluacion"
+
+_lock = threading.Lock()
+_rutas = {}
+_cargas_snapshot = {}
+
+
+def registrar_ruta(ruta, metodo, estado, segundos):
+    """Sumar una petición atendida al histograma de su ruta (regla de Flask, no la URL)."""
+    clave = (ruta, metodo, str(estado))
+    with _lock:
+        datos = _rutas.get(clave)
+        if datos is None:
+            datos = {"conteo": 0, "suma": 0.0, "buckets": [0] * len(BUCKETS_RUTAS)}
+            _rutas[clave] = datos
+        datos["conteo"] += 1
+        datos["suma"] += segundos
+        for i, limite in enumerate(BUCKETS_RUTAS):
+            if segundos <= limite:
+                datos["buckets"][i] += 1
+                break
+
+
+def registrar_carga_snapshot(origen, segundos, filas):
+    """Anotar una carga del snapshot de filtros ("completa", "delta" o "local")."""
+    with _lock:
+        datos = _cargas_snapshot.setdefault(origen, {"conteo": 0, "suma": 0.0, "ultima": 0.0, "filas": 0, "en": 0.0})
+        datos["conteo"] += 1
+        datos["suma"] += segundos
+        datos["ultima"] = segundos
+        datos["filas"] = filas
+        datos["en"] = time.time()
+
+
+def _etiquetas(**valores):
+    if not valores:
+        return ""
+    partes = []
+    for clave, valor in valores.items():
+        texto = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        partes.append(f'{clave}="{texto}"')
+    return "{" + ",".join(partes) + "}"
+
+
+def _numero(valor):
+    if valor is None:
+        return "NaN"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def _cabecera(lineas, nombre, tipo, ayuda):
+    lineas.append(f"# HELP {PREFIJO}_{nombre} {ayuda}")
+    lineas.append(f"# TYPE {PREFIJO}_{nombre} {tipo}")
+
+
+def renderizar(latencias_sheetdb, metricas_simples):
+    """Texto para /metrics.
+
+    `latencias_sheetdb` es sheetdb_client.estadisticas_latencia() (buckets ya
+    acumulados) y `metricas_simples` una lista de (nombre, tipo, ayuda, [(etiquetas, valor)]).
+    """
+    pid = os.getpid()
+    lineas = []
+
+    with _lock:
+        rutas = {clave: dict(datos, buckets=list(datos["buckets"])) for clave, datos in _rutas.items()}
+        cargas = {origen: dict(datos) for origen, datos in _cargas_snapshot.items()}
+
+    _cabecera(lineas, "http_peticion_segundos", "histogram", "Latencia de las peticiones por ruta, método y estado")
+    for (ruta, metodo, estado), datos in sorted(rutas.items()):
+        acumulado = 0
+        for limite, cantidad in zip(BUCKETS_RUTAS, datos["buckets"]):
+            acumulado += cantidad
+            etiquetas = _etiquetas(ruta=ruta, metodo=metodo, estado=estado, pid=pid, le=limite)
+            lineas.append(f"{PREFIJO}_http_peticion_segundos_bucket{etiquetas} {acumulado}")
+        etiquetas = _etiquetas(ruta=ruta, metodo=metodo, estado=estado, pid=pid, le="+Inf")
+        lineas.append(f"{PREFIJO}_http_peticion_segundos_bucket{etiquetas} {datos['conteo']}")
+        etiquetas = _etiquetas(ruta=ruta, metodo=metodo, estado=estado, pid=pid)
+        lineas.append(f"{PREFIJO}_http_peticion_segundos_sum{etiquetas} {_numero(datos['suma'])}")
+        lineas.append(f"{PREFIJO}_http_peticion_segundos_count{etiquetas} {datos['conteo']}")
+
+    _cabecera(lineas, "sheetdb_solicitud_segundos", "histogram", "Duración de las llamadas a SheetDB por operación")
+    for operacion, datos in sorted(latencias_sheetdb.items()):
+        for limite, acumulado in datos["buckets"].items():
+            etiquetas = _etiquetas(operacion=operacion, pid=pid, le=limite)
+            lineas.append(f"{PREFIJO}_sheetdb_solicitud_segundos_bucket{etiquetas} {acumulado}")
+        etiquetas = _etiquetas(operacion=operacion, pid=pid)
+        lineas.append(f"{PREFIJO}_sheetdb_solicitud_segundos_sum{etiquetas} {_numero(datos['suma_segundos'])}")
+        lineas.append(f"{PREFIJO}_sheetdb_solicitud_segundos_count{etiquetas} {datos['conteo']}")
+    _cabecera(lineas, "sheetdb_errores_total", "counter", "Llamadas a SheetDB con error o estado >= 400")
+    for operacion, datos in sorted(latencias_sheetdb.items()):
+        lineas.append(f"{PREFIJO}_sheetdb_errores_total{_etiquetas(operacion=operacion, pid=pid)} {datos['errores']}")
+
+    _cabecera(lineas, "snapshot_carga_segundos", "gauge", "Duración de la última carga del snapshot de filtros")
+    for origen, datos in sorted(cargas.items()):
+        lineas.append(f"{PREFIJO}_snapshot_carga_segundos{_etiquetas(origen=origen, pid=pid)} {_numero(datos['ultima'])}")
+    _cabecera(lineas, "snapshot_carga_segundos_total", "counter", "Tiempo acumulado cargando el snapshot de filtros")
+    for origen, datos in sorted(cargas.items()):
+        lineas.append(f"{PREFIJO}_snapshot_carga_segundos_total{_etiquetas(origen=origen, pid=pid)} {_numero(datos['suma'])}")
+    _cabecera(lineas, "snapshot_cargas_total", "counter", "Cargas del snapshot de filtros")
+    for origen, datos in sorted(cargas.items()):
+        lineas.append(f"{PREFIJO}_snapshot_cargas_total{_etiquetas(origen=origen, pid=pid)} {datos['conteo']}")
+
+    for nombre, tipo, ayuda, muestras in metricas_simples:
+        _cabecera(lineas, nombre, tipo, ayuda)
+        for etiquetas, valor in muestras:
+            lineas.append(f"{PREFIJO}_{nombre}{_etiquetas(**etiquetas, pid=pid)} {_numero(valor)}")
+
+    return "\n".join(lineas) + "\n"
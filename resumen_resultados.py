@@ -0,0 +1,280 @@
+"""Resumen pre-agregado de las evaluaciones TP y P (ruta /api/resultados/resumen).
+
+Cada evaluación guardada suma, en una base SQLite local, sus valores al grupo
+(hoja, ANO, PERIODO, SEDE_CURSO, Carrera, INSTRUCTOR): cantidad de evaluaciones,
+suma y conteo de Aula_Porcentaje y Carpeta_Porcentaje, y cuántas veces salió cada
+puntaje en cada pregunta A{n}_Puntaje. Consultar promedios y distribuciones es
+entonces un GROUP BY sobre unos cientos de filas, sin volver a leer la hoja.
+
+Solo se suman las evaluaciones que ya están en el almacenamiento: el almacén llama a
+guardar_y_registrar() alrededor de cada escritura confirmada (el envío de un lote de
+la cola a SheetDB, o el INSERT en SQLite), así lo que sigue en la cola o terminó como
+"fallido" no cuenta.
+
+Las evaluaciones guardadas antes de existir el resumen se cargan con reconstruir(),
+que lee las hojas completas del almacenamiento (SheetDB o SQLite). Un lock de archivo
+entre procesos, compartido al confirmar y exclusivo al reconstruir, impide que un
+guardado quede entre la lectura de las hojas y el reemplazo del resumen.
+"""
+import os
+import re
+import threading
+import contextlib
+
+import bitacora
+import base_local
+
+try:
+    import fcntl  # Lock entre workers de gunicorn (solo Unix)
+except ImportError:
+    fcntl = None
+
+log = bitacora.obtener(__name__)
+
+RESUMEN_DB_PATH = os.environ.get("RESUMEN_RESULTADOS_DB", os.path.join(base_local.CARPETA_PROCESADOS, 'resumen_resultados.sqlite3'))
+RESUMEN_LOCK_PATH = f"{RESUMEN_DB_PATH}.lock"
+
+HOJAS = ('TP', 'P')
+# Dimensiones del resumen: columna del registro -> parámetro de la API
+DIMENSIONES = {'ANO': 'ano', 'PERIODO': 'periodo', 'SEDE_CURSO': 'sede', 'Carrera': 'carrera', 'INSTRUCTOR': 'instructor'}
+_PATRON_PUNTAJE = re.compile(r'^A(\d+)_Puntaje$')
+
+# Sin fcntl el lock solo cubre los hilos de este proceso
+_lock_local = threading.Lock()
+
+
+def _crear_esquema(conexion):
+    conexion.execute("""
+        CREATE TABLE IF NOT EXISTS resumen_grupos (
+            hoja TEXT NOT NULL,
+            ANO TEXT NOT NULL,
+            PERIODO TEXT NOT NULL,
+            SEDE_CURSO TEXT NOT NULL,
+            Carrera TEXT NOT NULL,
+            INSTRUCTOR TEXT NOT NULL,
+            evaluaciones INTEGER NOT NULL DEFAULT 0,
+            aula_suma REAL NOT NULL DEFAULT 0,
+            aula_conteo INTEGER NOT NULL DEFAULT 0,
+            carpeta_suma REAL NOT NULL DEFAULT 0,
+            carpeta_conteo INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hoja, ANO, PERIODO, SEDE_CURSO, Carrera, INSTRUCTOR)
+        )
+    """)
+    conexion.execute("""
+        CREATE TABLE IF NOT EXISTS resumen_puntajes (
+            hoja TEXT NOT NULL,
+            ANO TEXT NOT NULL,
+            PERIODO TEXT NOT NULL,
+            SEDE_CURSO TEXT NOT NULL,
+            Carrera TEXT NOT NULL,
+            INSTRUCTOR TEXT NOT NULL,
+            pregunta INTEGER NOT NULL,
+            puntaje TEXT NOT NULL,
+            conteo INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hoja, ANO, PERIODO, SEDE_CURSO, Carrera, INSTRUCTOR, pregunta, puntaje)
+        )
+    """)
+
+
+def _conectar():
+    return base_local.conectar(RESUMEN_DB_PATH, _crear_esquema)
+
+
+@contextlib.contextmanager
+def _bloqueo(exclusivo):
+    """Compartido al confirmar guardados (pueden ir varios a la vez), exclusivo al reconstruir."""
+    if fcntl is None:
+        with _lock_local:
+            yield
+        return
+    # Cada toma abre su propio descriptor: flock bloquea también entre hilos del mismo proceso
+    with open(RESUMEN_LOCK_PATH, 'a') as archivo:
+        fcntl.flock(archivo, fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH)
+        yield
+
+
+def _a_numero(valor):
+    """Porcentaje o puntaje de la hoja ("85", "85.5", "85,5 %", 85) a float; None si no es número."""
+    if valor is None or isinstance(valor, bool):
+        return None
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    texto = str(valor).strip().rstrip('%').strip().replace(',', '.')
+    try:
+        return float(texto)
+    except ValueError:
+        return None
+
+
+def _clave_puntaje(valor):
+    """Puntaje como texto estable para la distribución ("3" y 3.0 cuentan igual)."""
+    numero = _a_numero(valor)
+    if numero is None:
+        texto = str(valor).strip() if valor is not None else ''
+        return texto or None
+    return str(int(numero)) if numero.is_integer() else str(numero)
+
+
+def _filas_registro(hoja, registro):
+    """Aportes de un registro aplanado: (fila de resumen_grupos, filas de resumen_puntajes)."""
+    grupo = (hoja,) + tuple(str(registro.get(c) or '').strip() for c in DIMENSIONES)
+    aula = _a_numero(registro.get('Aula_Porcentaje'))
+    carpeta = _a_numero(registro.get('Carpeta_Porcentaje'))
+    fila_grupo = grupo + (1, aula or 0.0, int(aula is not None), carpeta or 0.0, int(carpeta is not None))
+
+    filas_puntaje = []
+    for columna, valor in registro.items():
+        coincidencia = _PATRON_PUNTAJE.match(columna)
+        if coincidencia is None:
+            continue
+        puntaje = _clave_puntaje(valor)
+        if puntaje is not None:
+            filas_puntaje.append(grupo + (int(coincidencia.group(1)), puntaje, 1))
+    return fila_grupo, filas_puntaje
+
+
+def _sumar(conexion, filas_grupo, filas_puntaje):
+    conexion.executemany(
+        """INSERT INTO resumen_grupos
+               (hoja, ANO, PERIODO, SEDE_CURSO, Carrera, INSTRUCTOR,
+                evaluaciones, aula_suma, aula_conteo, carpeta_suma, carpeta_conteo)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+           ON CONFLICT (hoja, ANO, PERIODO, SEDE_CURSO, Carrera, INSTRUCTOR) DO UPDATE SET
+               evaluaciones = evaluaciones + excluded.evaluaciones,
+               aula_suma = aula_suma + excluded.aula_suma,
+               aula_conteo = aula_conteo + excluded.aula_conteo,
+               carpeta_suma = carpeta_suma + excluded.carpeta_suma,
+               carpeta_conteo = carpeta_conteo + excluded.carpeta_conteo""",
+        filas_grupo
+    )
+    conexion.executemany(
+        """INSERT INTO resumen_puntajes
+               (hoja, ANO, PERIODO, SEDE_CURSO, Carrera, INSTRUCTOR, pregunta, puntaje, conteo)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+           ON CONFLICT (hoja, ANO, PERIODO, SEDE_CURSO, Carrera, INSTRUCTOR, pregunta, puntaje) DO UPDATE SET
+               conteo = conteo + excluded.conteo""",
+        filas_puntaje
+    )
+
+
+def registrar(hoja, registros):
+    """Sumar al resumen uno o varios registros aplanados de la hoja indicada ("TP" o "P")."""
+    if isinstance(registros, dict):
+        registros = [registros]
+    filas_grupo = []
+    filas_puntaje = []
+    for registro in registros:
+        fila_grupo, puntajes = _filas_registro(hoja, registro)
+        filas_grupo.append(fila_grupo)
+        filas_puntaje.extend(puntajes)
+
+    conexion = _conectar()
+    try:
+        with conexion:
+            _sumar(conexion, filas_grupo, filas_puntaje)
+    finally:
+        conexion.close()
+
+
+def guardar_y_registrar(guardar, hoja, registros):
+    """Llamar a `guardar(hoja, registros)` y, si devuelve None (guardado), sumar los registros al resumen.
+
+    Si guardar falla se devuelve su error y no se suma nada. Si falla el resumen solo se
+    avisa: las evaluaciones ya quedaron guardadas y reconstruir() las recupera.
+    """
+    with _bloqueo(exclusivo=False):
+        error = guardar(hoja, registros)
+        if error is None:
+            try:
+                registrar(hoja, registros)
+            except Exception as e:
+                log.warning("No se pudo actualizar el resumen de resultados: %s", e, extra=bitacora.campos(hoja=hoja))
+        return error
+
+
+def reconstruir(leer_hoja):
+    """Rehacer el resumen desde cero leyendo las hojas TP y P completas.
+
+    `leer_hoja(hoja)` devuelve la lista de registros de la hoja (el leer_resultados
+    del almacén). Devuelve {hoja: registros leídos}. Si falla la lectura de alguna
+    hoja no se toca el resumen actual. Mientras dura, los guardados confirmados esperan.
+    """
+    with _bloqueo(exclusivo=True):
+        leidos = {hoja: leer_hoja(hoja) for hoja in HOJAS}
+
+        conexion = _conectar()
+        try:
+            with conexion:
+                conexion.execute("DELETE FROM resumen_grupos")
+                conexion.execute("DELETE FROM resumen_puntajes")
+                for hoja, registros in leidos.items():
+                    filas_grupo = []
+                    filas_puntaje = []
+                    for registro in registros:
+                        fila_grupo, puntajes = _filas_registro(hoja, registro)
+                        filas_grupo.append(fila_grupo)
+                        filas_puntaje.extend(puntajes)
+                    _sumar(conexion, filas_grupo, filas_puntaje)
+        finally:
+            conexion.close()
+        return {hoja: len(registros) for hoja, registros in leidos.items()}
+
+
+def consultar(agrupar=None, filtros=None, hoja=None):
+    """Promedios, distribuciones de puntajes y conteos agrupados.
+
+    `agrupar` es una lista de columnas de DIMENSIONES (por defecto todas), `filtros`
+    un dict columna -> valor exacto y `hoja` "TP", "P" o None para ambas.
+    """
+    agrupar = list(DIMENSIONES) if agrupar is None else [c for c in DIMENSIONES if c in agrupar]
+    condiciones = []
+    parametros = []
+    if hoja is not None:
+        condiciones.append("hoja = ?")
+        parametros.append(hoja)
+    for columna, valor in (filtros or {}).items():
+        if columna in DIMENSIONES:
+            condiciones.append(f"{columna} = ?")
+            parametros.append(str(valor).strip())
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    columnas = ", ".join(agrupar)
+    group_by = f"GROUP BY {columnas}" if agrupar else ""
+    seleccion = f"{columnas}, " if agrupar else ""
+
+    conexion = _conectar()
+    try:
+        filas = conexion.execute(
+            f"""SELECT {seleccion}SUM(evaluaciones), SUM(aula_suma), SUM(aula_conteo), SUM(carpeta_suma), SUM(carpeta_conteo)
+                FROM resumen_grupos {where} {group_by} ORDER BY {columnas or 1}""",
+            parametros
+        ).fetchall()
+        puntajes = conexion.execute(
+            f"""SELECT {seleccion}pregunta, puntaje, SUM(conteo)
+                FROM resumen_puntajes {where} {group_by}{',' if agrupar else 'GROUP BY'} pregunta, puntaje""",
+            parametros
+        ).fetchall()
+    finally:
+        conexion.close()
+
+    grupos = {}
+    for fila in filas:
+        clave = fila[:len(agrupar)]
+        evaluaciones, aula_suma, aula_conteo, carpeta_suma, carpeta_conteo = fila[len(agrupar):]
+        if not evaluaciones:
+            continue
+        grupo = dict(zip(agrupar, clave))
+        grupo.update({
+            "evaluaciones": evaluaciones,
+            "Aula_Porcentaje_promedio": round(aula_suma / aula_conteo, 2) if aula_conteo else None,
+            "Carpeta_Porcentaje_promedio": round(carpeta_suma / carpeta_conteo, 2) if carpeta_conteo else None,
+            "puntajes": {},
+        })
+        grupos[clave] = grupo
+
+    for fila in sorted(puntajes, key=lambda f: (f[len(agrupar)], f[len(agrupar) + 1])):
+        grupo = grupos.get(fila[:len(agrupar)])
+        if grupo is None:
+            continue
+        pregunta, puntaje, conteo = fila[len(agrupar):]
+        grupo["puntajes"].setdefault(f"A{pregunta}_Puntaje", {})[puntaje] = conteo
+    return list(grupos.values())
@@ -0,0 +1,147 @@
+"""Cliente HTTP compartido para todas las llamadas a SheetDB.
+
+Mantiene una sola requests.Session por proceso (conexiones keep-alive reutilizadas,
+sin repetir el handshake TCP+TLS en cada llamada), con reintentos acotados y espera
+exponencial ante 429/5xx, timeouts de conexión y de lectura por separado, y un
+histograma de latencias por operación.
+
+Las URLs las decide quien llama, así que se puede apuntar a un servidor HTTP local
+que imite a SheetDB (ver SHEETDB_API_URL* en app.py).
+"""
+import os
+import time
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Timeouts separados: conectar debe ser rápido, leer la hoja completa puede tardar
+SHEETDB_TIMEOUT_CONEXION = float(os.environ.get("SHEETDB_TIMEOUT_CONEXION", 5))
+SHEETDB_TIMEOUT_LECTURA = float(os.environ.get("SHEETDB_TIMEOUT_LECTURA", 30))
+
+# Reintentos ante errores de conexión y respuestas 429/5xx. Los POST solo se reintentan
+# si no llegaron a conectarse: reenviar tras un 5xx podría duplicar filas en la hoja
+# (de esos se encarga la cola de resultados con su propio backoff).
+SHEETDB_REINTENTOS = int(os.environ.get("SHEETDB_REINTENTOS", 3))
+SHEETDB_BACKOFF_SEGUNDOS = float(os.environ.get("SHEETDB_BACKOFF_SEGUNDOS", 0.5))
+SHEETDB_ESTADOS_REINTENTO = (429, 500, 502, 503, 504)
+
+# Tamaño del pool de conexiones keep-alive (uno por hilo que llama en paralelo)
+SHEETDB_POOL_CONEXIONES = int(os.environ.get("SHEETDB_POOL_CONEXIONES", 10))
+
+# Límites superiores (segundos) de los buckets del histograma de latencias
+BUCKETS_LATENCIA = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_sesion = None
+_lock_sesion = threading.Lock()
+_lock_latencias = threading.Lock()
+_latencias = {}
+
+
+def _crear_sesion():
+    """Sesión con pool keep-alive y política de reintentos montada para http y https."""
+    reintentos = Retry(
+        total=SHEETDB_REINTENTOS,
+        connect=SHEETDB_REINTENTOS,
+        read=SHEETDB_REINTENTOS,
+        status=SHEETDB_REINTENTOS,
+        backoff_factor=SHEETDB_BACKOFF_SEGUNDOS,
+        status_forcelist=SHEETDB_ESTADOS_REINTENTO,
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adaptador = HTTPAdapter(
+        max_retries=reintentos,
+        pool_connections=SHEETDB_POOL_CONEXIONES,
+        pool_maxsize=SHEETDB_POOL_CONEXIONES,
+    )
+    sesion = requests.Session()
+    sesion.mount('http://', adaptador)
+    sesion.mount('https://', adaptador)
+    return sesion
+
+
+def obtener_sesion():
+    """Devuelve la sesión compartida del proceso, creándola la primera vez."""
+    global _sesion
+    if _sesion is None:
+        with _lock_sesion:
+            if _sesion is None:
+                _sesion = _crear_sesion()
+    return _sesion
+
+
+def _reiniciar_tras_fork():
+    # Los sockets del pool no se pueden compartir entre procesos (p. ej. gunicorn con
+    # preload_app): cada proceso hijo abre su propia sesión.
+    global _sesion
+    _sesion = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reiniciar_tras_fork)
+
+
+def _registrar_latencia(operacion, segundos, error):
+    with _lock_latencias:
+        datos = _latencias.get(operacion)
+        if datos is None:
+            datos = {"conteo": 0, "errores": 0, "suma_segundos": 0.0, "buckets": [0] * (len(BUCKETS_LATENCIA) + 1)}
+            _latencias[operacion] = datos
+        datos["conteo"] += 1
+        datos["suma_segundos"] += segundos
+        if error:
+            datos["errores"] += 1
+        for i, limite in enumerate(BUCKETS_LATENCIA):
+            if segundos <= limite:
+                datos["buckets"][i] += 1
+                break
+        else:
+            datos["buckets"][-1] += 1
+
+
+def solicitar(operacion, metodo, url, **kwargs):
+    """Hace una llamada a SheetDB con la sesión compartida y registra su latencia.
+
+    `operacion` es el nombre con el que se agrupa en el histograma (p. ej. "leer_filtros").
+    Propaga las excepciones de requests igual que requests.request.
+    """
+    kwargs.setdefault('timeout', (SHEETDB_TIMEOUT_CONEXION, SHEETDB_TIMEOUT_LECTURA))
+    inicio = time.perf_counter()
+    error = True
+    try:
+        response = obtener_sesion().request(metodo, url, **kwargs)
+        error = response.status_code >= 400
+        return response
+    finally:
+        _registrar_latencia(operacion, time.perf_counter() - inicio, error)
+
+
+def get(operacion, url, **kwargs):
+    return solicitar(operacion, 'GET', url, **kwargs)
+
+
+def post(operacion, url, **kwargs):
+    return solicitar(operacion, 'POST', url, **kwargs)
+
+
+def estadisticas_latencia():
+    """Copia del histograma por operación: conteo, errores, suma y buckets acumulados por límite."""
+    with _lock_latencias:
+        resumen = {}
+        for operacion, datos in _latencias.items():
+            acumulado = 0
+            buckets = {}
+            for limite, cantidad in zip(BUCKETS_LATENCIA + ('+Inf',), datos["buckets"]):
+                acumulado += cantidad
+                buckets[str(limite)] = acumulado
+            resumen[operacion] = {
+                "conteo": datos["conteo"],
+                "errores": datos["errores"],
+                "suma_segundos": round(datos["suma_segundos"], 6),
+                "promedio_segundos": round(datos["suma_segundos"] / datos["conteo"], 6) if datos["conteo"] else None,
+                "buckets": buckets,
+            }
+        return resumen
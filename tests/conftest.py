@@ -0,0 +1,60 @@
+"""Configuración común de las pruebas: todo corre sin red, contra el SheetDB local de benchmarks/.
+
+Las rutas de las bases y del snapshot se leen al importar los módulos de la app, así
+que se fijan aquí, antes de cualquier import, en una carpeta temporal: las pruebas
+nunca tocan procesados/.
+"""
+import os
+import tempfile
+import threading
+
+import pytest
+
+_CARPETA = tempfile.mkdtemp(prefix='pruebas_evaluacion_')
+for _clave, _archivo in (('SNAPSHOT_LOCAL_PATH', 'snapshot.pkl'), ('COLA_RESULTADOS_DB', 'cola.sqlite3'),
+                         ('RESUMEN_RESULTADOS_DB', 'resumen.sqlite3'), ('ALMACENAMIENTO_DB', 'almacenamiento.sqlite3'),
+                         ('TRABAJOS_NRCS_DB', 'trabajos_nrcs.sqlite3')):
+    os.environ[_clave] = os.path.join(_CARPETA, _archivo)
+os.environ['ALMACENAMIENTO_MODO'] = 'sqlite'
+os.environ['SNAPSHOT_TTL_SEGUNDOS'] = '3600'
+# Con el SheetDB local caído las pruebas esperan el 503 de inmediato, sin los reintentos de urllib3
+os.environ['SHEETDB_REINTENTOS'] = '0'
+os.environ.setdefault('LOG_NIVEL', 'WARNING')
+
+from sheetdb_local import SheetDBLocal, generar_hoja_filtros  # noqa: E402
+import cola_resultados  # noqa: E402
+import resumen_resultados  # noqa: E402
+
+
+@pytest.fixture
+def bases(tmp_path, monkeypatch):
+    """Cola y resumen vacíos para cada prueba."""
+    monkeypatch.setattr(cola_resultados, 'COLA_DB_PATH', str(tmp_path / 'cola.sqlite3'))
+    monkeypatch.setattr(cola_resultados, 'COLA_BACKOFF_BASE_SEGUNDOS', 0)
+    monkeypatch.setattr(resumen_resultados, 'RESUMEN_DB_PATH', str(tmp_path / 'resumen.sqlite3'))
+    monkeypatch.setattr(resumen_resultados, 'RESUMEN_LOCK_PATH', str(tmp_path / 'resumen.sqlite3.lock'))
+    return tmp_path
+
+
+@pytest.fixture
+def sheetdb():
+    """SheetDB local con una hoja de filtros sintética de 300 filas: (estado, url base)."""
+    estado = SheetDBLocal(generar_hoja_filtros(300))
+    servidor = estado.servidor(0)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    yield estado, f"http://127.0.0.1:{servidor.server_address[1]}"
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture
+def snapshot_vacio(tmp_path, monkeypatch):
+    """Snapshot de la app sin cargar, con su copia local en tmp_path y sin hilo de refresco."""
+    import app
+    monkeypatch.setattr(app, 'snapshot', dict(app.snapshot))
+    monkeypatch.setattr(app, 'is_data_loaded', False)
+    monkeypatch.setattr(app, '_ciclos_delta', 0)
+    monkeypatch.setattr(app, 'SNAPSHOT_LOCAL_PATH', str(tmp_path / 'snapshot.pkl'))
+    monkeypatch.setattr(app, 'SNAPSHOT_SOLICITUD_PATH', str(tmp_path / 'snapshot.pkl.solicitud'))
+    monkeypatch.setattr(app, 'iniciar_refresco_snapshot', lambda: None)
@@ -0,0 +1,255 @@
+"""Almacenes de filtros y resultados contra el SheetDB local, sin red.
+
+Cubre que el sync incremental deje el mismo snapshot que una recarga completa, que
+la cola lleve los guardados hasta la hoja (y el resumen solo los cuente entonces),
+que el modo espejo siga sirviendo con SheetDB caído, y el flujo completo de la app
+en ALMACENAMIENTO_MODO=sqlite.
+"""
+import json
+import random
+import sqlite3
+import functools
+
+import pandas as pd
+
+from sheetdb_local import generar_hoja_filtros
+from suite import payload_evaluacion
+import app
+import almacenamiento
+import buscador
+import cola_resultados
+import esquema_resultados
+import resumen_resultados
+
+# Filas que se agregan a la hoja después de la primera carga (NRC distintos de los 300 iniciales)
+FILAS_NUEVAS = [dict(r, NRC=str(5000 + i)) for i, r in enumerate(generar_hoja_filtros(40, semilla=11))]
+
+
+def _contar_llamadas(monkeypatch, objeto, metodo):
+    llamadas = []
+    original = getattr(objeto, metodo)
+
+    def espia(*args, **kwargs):
+        llamadas.append(args)
+        return original(*args, **kwargs)
+    monkeypatch.setattr(objeto, metodo, espia)
+    return llamadas
+
+
+def _registros(hoja, cantidad, semilla=3):
+    aleatorio = random.Random(semilla)
+    filas = generar_hoja_filtros(cantidad, semilla)
+    return [esquema_resultados.a_registro(hoja, esquema_resultados.aplanar(hoja, payload_evaluacion(hoja, fila, aleatorio)))
+            for fila in filas]
+
+
+def _evaluaciones_resumen(hoja=None):
+    return sum(g["evaluaciones"] for g in resumen_resultados.consultar([], hoja=hoja))
+
+
+def _comparar_snapshots(delta, completo):
+    pd.testing.assert_frame_equal(delta["df"], completo["df"], check_categorical=False)
+    assert delta["indice"] == completo["indice"]
+    assert delta["por_nrc"] == completo["por_nrc"]
+    assert delta["nrc_por_clave"] == completo["nrc_por_clave"]
+    assert delta["filas_crudas"] == completo["filas_crudas"]
+    for consulta in ("instructor 0003", "asignatura 001", "mecatronica", "5012", "mantenimiento pesada"):
+        assert buscador.buscar(delta["busqueda"], consulta) == buscador.buscar(completo["busqueda"], consulta)
+
+
+def _delta_contra_recarga(monkeypatch, almacen, anexar):
+    """Cargar, anexar FILAS_NUEVAS con `anexar`, sincronizar en delta y comparar con una recarga completa."""
+    monkeypatch.setattr(app, 'almacen', almacen)
+    monkeypatch.setattr(app, 'SNAPSHOT_SYNC_MODO', 'delta')
+    assert app.cargar_datos_desde_sheetdb(completo=True)
+    assert len(app.snapshot["df"]) == 300
+
+    anexar(FILAS_NUEVAS)
+    lecturas_completas = _contar_llamadas(monkeypatch, almacen, 'leer_filtros')
+    assert app.cargar_datos_desde_sheetdb()
+    assert lecturas_completas == []
+    delta = app.snapshot
+    assert len(delta["df"]) == 340
+
+    # Sin hash ni ETag la recarga completa no puede responder "sin cambios"
+    app.snapshot = dict(app.snapshot, hash=None, etag=None)
+    assert app.cargar_datos_desde_sheetdb(completo=True)
+    assert len(lecturas_completas) == 1
+    _comparar_snapshots(delta, app.snapshot)
+
+
+def test_delta_sheetdb_igual_a_recarga_completa(monkeypatch, snapshot_vacio, sheetdb):
+    estado, url = sheetdb
+    almacen = almacenamiento.AlmacenSheetDB(f"{url}/filtros", f"{url}/resultados")
+    _delta_contra_recarga(monkeypatch, almacen, estado.anexar)
+
+
+def test_delta_sqlite_igual_a_recarga_completa(monkeypatch, snapshot_vacio, tmp_path):
+    almacen = almacenamiento.AlmacenSQLite(str(tmp_path / 'almacenamiento.sqlite3'))
+    almacen.reemplazar_filtros(generar_hoja_filtros(300))
+    _delta_contra_recarga(monkeypatch, almacen, almacen.anexar_filtros)
+
+
+def test_delta_con_columnas_distintas_recarga_completo(monkeypatch, snapshot_vacio, sheetdb):
+    estado, url = sheetdb
+    monkeypatch.setattr(app, 'almacen', almacenamiento.AlmacenSheetDB(f"{url}/filtros", f"{url}/resultados"))
+    monkeypatch.setattr(app, 'SNAPSHOT_SYNC_MODO', 'delta')
+    assert app.cargar_datos_desde_sheetdb(completo=True)
+
+    estado.publicar([dict(r, Turno='MAÑANA') for r in estado.registros])
+    assert app.cargar_datos_desde_sheetdb()
+    assert 'Turno' in app.snapshot["columnas_crudas"]
+
+
+def test_cola_lleva_los_guardados_a_sheetdb(bases, sheetdb):
+    estado, url = sheetdb
+    almacen = almacenamiento.AlmacenSheetDB(f"{url}/filtros", f"{url}/resultados",
+                                            confirmar=resumen_resultados.guardar_y_registrar)
+    enviar = functools.partial(almacen.confirmar, almacen.enviar_resultados)
+    registros_tp = _registros("TP", 3)
+    registros_p = _registros("P", 2, semilla=5)
+
+    almacen.guardar_resultados("TP", registros_tp[:1])
+    almacen.guardar_resultados("TP", registros_tp[1:])
+    almacen.guardar_resultados("P", registros_p)
+    # Encolado no es guardado: el resumen todavía no los cuenta
+    assert cola_resultados.estado_cola()["pendientes"] == 5
+    assert _evaluaciones_resumen() == 0
+
+    while cola_resultados.procesar_lote(enviar):
+        pass
+    assert estado.hojas["TP"] == registros_tp
+    assert estado.hojas["P"] == registros_p
+    assert almacen.leer_resultados("TP") == registros_tp
+    assert cola_resultados.estado_cola()["pendientes"] == 0
+    assert _evaluaciones_resumen("TP") == 3
+    assert _evaluaciones_resumen("P") == 2
+
+
+def test_envio_fallido_no_se_cuenta_y_se_reintenta(bases, sheetdb):
+    estado, url = sheetdb
+    almacen = almacenamiento.AlmacenSheetDB(f"{url}/filtros", f"{url}/resultados",
+                                            confirmar=resumen_resultados.guardar_y_registrar)
+    enviar = functools.partial(almacen.confirmar, almacen.enviar_resultados)
+    registros = _registros("TP", 2)
+    almacen.guardar_resultados("TP", registros)
+
+    estado.caido = True
+    assert cola_resultados.procesar_lote(enviar) == 0
+    cola = cola_resultados.estado_cola()
+    assert cola["pendientes"] == 2
+    assert cola["ultimo_error"].startswith("503")
+    assert "TP" not in estado.hojas
+    assert _evaluaciones_resumen() == 0
+
+    estado.caido = False
+    assert cola_resultados.procesar_lote(enviar) == 2
+    assert estado.hojas["TP"] == registros
+    assert _evaluaciones_resumen() == 2
+
+
+def test_espejo_sirve_la_copia_con_sheetdb_caido(bases, sheetdb, tmp_path):
+    estado, url = sheetdb
+    almacen = almacenamiento.crear("espejo", f"{url}/filtros", f"{url}/resultados",
+                                   ruta_db=str(tmp_path / 'espejo.sqlite3'),
+                                   confirmar=resumen_resultados.guardar_y_registrar)
+    enviar = functools.partial(almacen.remoto.confirmar, almacen.enviar_resultados)
+
+    leida = almacen.leer_filtros()
+    assert json.loads(leida["contenido"]) == estado.registros
+    columnas = list(estado.registros[0])
+
+    estado.anexar(FILAS_NUEVAS[:5])
+    estado.caido = True
+    # La hoja y el delta salen de la copia SQLite, que no ve las filas que SheetDB ya no sirve
+    assert almacen.leer_filtros()["contenido"] == leida["contenido"]
+    assert almacen.leer_delta_filtros(columnas, 300) == {"tipo": "sin_cambios"}
+
+    registros = _registros("TP", 2)
+    almacen.guardar_resultados("TP", registros)
+    assert almacen.leer_resultados("TP") == registros
+    assert _evaluaciones_resumen() == 2
+    assert cola_resultados.procesar_lote(enviar) == 0
+    assert cola_resultados.estado_cola()["pendientes"] == 2
+
+    estado.caido = False
+    delta = almacen.leer_delta_filtros(columnas, 300)
+    assert delta["tipo"] == "anexar" and delta["registros"] == FILAS_NUEVAS[:5]
+    assert almacen.local.estado_filtros()[1] == 305
+    while cola_resultados.procesar_lote(enviar):
+        pass
+    assert estado.hojas["TP"] == registros
+    # La réplica a SheetDB no vuelve a sumar al resumen
+    assert _evaluaciones_resumen() == 2
+
+
+def test_app_en_modo_sqlite(bases, snapshot_vacio, monkeypatch, tmp_path):
+    almacen = almacenamiento.AlmacenSQLite(str(tmp_path / 'almacenamiento.sqlite3'),
+                                           confirmar=resumen_resultados.guardar_y_registrar)
+    filas = generar_hoja_filtros(300)
+    almacen.reemplazar_filtros(filas)
+    monkeypatch.setattr(app, 'almacen', almacen)
+    assert app.cargar_datos_desde_sheetdb(completo=True)
+
+    cliente = app.app.test_client()
+    anos = cliente.get('/get_anos')
+    assert anos.status_code == 200
+    assert anos.get_json() == sorted({int(f['ANO']) for f in filas})
+    assert cliente.get('/api/nrc/1000').get_json()["NRC"] == 1000
+
+    payload = payload_evaluacion("TP", filas[0], random.Random(1))
+    respuesta = cliente.post('/guardar_resultado_tp', json=payload)
+    assert respuesta.get_json()["guardadas"] == 1
+    guardados = almacen.leer_resultados("TP")
+    assert len(guardados) == 1 and guardados[0]["NRC"] == filas[0]["NRC"]
+    assert _evaluaciones_resumen("TP") == 1
+    assert cola_resultados.estado_cola()["pendientes"] == 0
+
+
+def test_leer_resultados_por_nrc_en_los_tres_modos(bases, sheetdb, tmp_path):
+    estado, url = sheetdb
+    registros = _registros("TP", 6)
+    nrc = registros[2]["NRC"]
+    esperados = [r for r in registros if r["NRC"] == nrc]
+    for modo in almacenamiento.MODOS:
+        almacen = almacenamiento.crear(modo, f"{url}/filtros", f"{url}/resultados",
+                                       ruta_db=str(tmp_path / f'{modo}.sqlite3'))
+        if modo == "sheetdb":
+            # SheetDB se lee de la hoja: lo que ya envió la cola del modo espejo no cuenta
+            estado.hojas.clear()
+            estado.hojas["TP"] = list(registros)
+        else:
+            almacen.guardar_resultados("TP", registros)
+        assert almacen.leer_resultados("TP") == registros
+        assert almacen.leer_resultados("TP", nrc) == esperados
+        assert almacen.leer_resultados("TP", int(nrc)) == esperados
+        assert almacen.leer_resultados("P", nrc) == []
+
+
+def test_sqlite_borra_los_indices_obsoletos(tmp_path):
+    ruta = str(tmp_path / 'anterior.sqlite3')
+    conexion = sqlite3.connect(ruta)
+    # Esquema de la versión anterior, con las copias de columnas y sus índices
+    conexion.executescript("""
+        CREATE TABLE filtros (fila INTEGER PRIMARY KEY, ANO TEXT, NRC TEXT, registro TEXT NOT NULL);
+        CREATE INDEX idx_filtros_cascada ON filtros (ANO);
+        CREATE INDEX idx_filtros_nrc ON filtros (NRC);
+        CREATE TABLE resultados (id INTEGER PRIMARY KEY AUTOINCREMENT, hoja TEXT NOT NULL, ANO TEXT, NRC TEXT,
+                                 registro TEXT NOT NULL, creado_en REAL NOT NULL);
+        CREATE INDEX idx_resultados_nrc ON resultados (hoja, NRC);
+        CREATE INDEX idx_resultados_filtros ON resultados (hoja, ANO);
+    """)
+    conexion.close()
+
+    almacen = almacenamiento.AlmacenSQLite(ruta)
+    filas = generar_hoja_filtros(20)
+    almacen.reemplazar_filtros(filas)
+    registros = _registros("P", 2)
+    almacen.guardar_resultados("P", registros)
+    assert json.loads(almacen.leer_filtros()["contenido"]) == filas
+    assert almacen.leer_resultados("P", registros[0]["NRC"]) == registros[:1]
+
+    conexion = sqlite3.connect(ruta)
+    indices = {n for (n,) in conexion.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'")}
+    conexion.close()
+    assert indices == {"idx_resultados_nrc"}
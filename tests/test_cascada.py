@@ -0,0 +1,25 @@
+"""Endpoints de la cascada de filtros sobre el snapshot publicado."""
+import app
+import almacenamiento
+from sheetdb_local import generar_hoja_filtros
+
+
+def test_get_nrc_y_cascade_usan_la_misma_fila(snapshot_vacio, monkeypatch, tmp_path):
+    filas = generar_hoja_filtros(50)
+    # El mismo NRC con otra combinación de filtros y otra SEDE_CURSO
+    repetida = dict(filas[0], Seccion='9', SEDE_CURSO='OTRA SEDE')
+    filas.append(repetida)
+    almacen = almacenamiento.AlmacenSQLite(str(tmp_path / 'almacenamiento.sqlite3'))
+    almacen.reemplazar_filtros(filas)
+    monkeypatch.setattr(app, 'almacen', almacen)
+    assert app.cargar_datos_desde_sheetdb(completo=True)
+
+    cliente = app.app.test_client()
+    for fila in (filas[0], repetida):
+        parametros = {'ano': fila['ANO'], 'periodo': fila['PERIODO'], 'sede': fila['SEDE_PRINCIPAL'],
+                      'carrera': fila['Carrera'], 'seccion': fila['Seccion'], 'asignatura': fila['Asignatura'],
+                      'instructor': fila['INSTRUCTOR']}
+        nrc = cliente.get('/get_nrc', query_string=parametros).get_json()
+        curso = cliente.get('/api/cascade', query_string=parametros).get_json()["curso"]
+        assert nrc == {'nrc': fila['NRC'], 'sede_curso': fila['SEDE_CURSO']}
+        assert (curso['nrc'], curso['sede_curso']) == (nrc['nrc'], nrc['sede_curso'])
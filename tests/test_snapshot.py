@@ -0,0 +1,46 @@
+"""Snapshot de filtros compartido entre procesos: copia local y refrescos explícitos."""
+import os
+import threading
+
+import app
+import almacenamiento
+from sheetdb_local import generar_hoja_filtros
+
+
+def _cargar(monkeypatch, tmp_path, filas=300):
+    almacen = almacenamiento.AlmacenSQLite(str(tmp_path / 'almacenamiento.sqlite3'))
+    almacen.reemplazar_filtros(generar_hoja_filtros(filas))
+    monkeypatch.setattr(app, 'almacen', almacen)
+    assert app.cargar_datos_desde_sheetdb(completo=True)
+    return almacen
+
+
+def test_pedido_de_refresco_lo_atiende_el_lider_una_vez(snapshot_vacio):
+    assert not app._tomar_pedido_refresco()
+    app._pedir_refresco_al_lider()
+    app._pedir_refresco_al_lider()
+    assert app._tomar_pedido_refresco()
+    assert not app._tomar_pedido_refresco()
+
+
+def test_espera_del_lider_termina_con_un_pedido(snapshot_vacio, monkeypatch):
+    monkeypatch.setattr(app, 'SNAPSHOT_SEGUIDOR_INTERVALO', 0.05)
+    app._pedir_refresco_al_lider()
+    assert app._esperar_refresco_lider(30)
+    assert not app._esperar_refresco_lider(0.1)
+
+
+def test_escrituras_simultaneas_de_la_copia_local(snapshot_vacio, monkeypatch, tmp_path):
+    _cargar(monkeypatch, tmp_path)
+    snap = app.snapshot
+    hilos = [threading.Thread(target=app.guardar_snapshot_local, args=(snap,)) for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert os.listdir(tmp_path).count('snapshot.pkl') == 1
+    assert not [n for n in os.listdir(tmp_path) if n.endswith('.tmp')]
+
+    monkeypatch.setattr(app, 'snapshot', dict(snap, hash=None))
+    assert app.cargar_snapshot_local()
+    assert len(app.snapshot["df"]) == 300
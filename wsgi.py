@@ -0,0 +1,15 @@
+"""Punto de entrada WSGI para producción.
+
+Con gunicorn.conf.py (preload_app = True) este módulo se importa una sola vez en el
+proceso maestro: el snapshot de filtros se carga ahí (copia local o, si no hay, una
+lectura a SheetDB) y los workers lo heredan al hacer fork, compartiendo la memoria
+copy-on-write en lugar de hacer N cargas y tener N copias. Después, solo uno de los
+workers refresca desde SheetDB y los demás siguen la copia local (ver app._bucle_refresco).
+
+    gunicorn -c gunicorn.conf.py
+"""
+import app as aplicacion
+
+aplicacion.preparar_snapshot_inicial()
+
+app = aplicacion.app